@@ -1,72 +1,418 @@
-from functools import reduce
-
-class Analytics:
-    @staticmethod
-    def update_streak(tasks, periodicity: str) -> (int, int):
-        """Functional approach to calculate current and max streaks."""
-
-        # Sort tasks by date
-        sorted_tasks = sorted(tasks, key=lambda t: t.date)
-
-        def streak_calculator(acc, task):
-            last_date, current_streak, max_streak = acc
-
-            if task.is_complete:
-                if last_date is None:
-                    # First completed task
-                    return (task.date, 1, 1)
-
-                delta_days = (task.date.date() - last_date.date()).days
-
-                if periodicity == 'Daily':
-                    if delta_days == 1:
-                        new_streak = current_streak + 1
-                    elif delta_days > 1:
-                        new_streak = 1
-                    else:
-                        return acc  # same day or earlier — skip
-                    return (task.date, new_streak, max(new_streak, max_streak))
-
-                elif periodicity == 'Weekly':
-                    if delta_days == 7:
-                        new_streak = current_streak + 1
-                    elif delta_days > 7:
-                        new_streak = 1
-                    else:
-                        return acc  # too soon or duplicate — skip
-                    return (task.date, new_streak, max(new_streak, max_streak))
-
-                elif periodicity == 'Monthly':
-                    # If same month and year, it's a duplicate — skip it
-                    if task.date.year == last_date.year and task.date.month == last_date.month:
-                        return acc
-
-                    # Treat monthly streak as strict ~1-month gap (28-31 days)
-                    if 28 <= delta_days <= 31:
-                        new_streak = current_streak + 1
-                    elif delta_days > 31:
-                        new_streak = 1  # too late — missed the cycle
-                    else:
-                        return acc  # early duplicate or same month — skip
-
-                    return (task.date, new_streak, max(new_streak, max_streak))
-
-            return acc  # task is not completed — skip
-
-        # Run the functional reducer
-        _, current_streak, max_streak = reduce(streak_calculator, sorted_tasks, (None, 0, 0))
-        return current_streak, max_streak
-
-    @staticmethod
-    def get_longest_streak(habits) -> (str, int):
-        """Return the habit with the longest streak."""
-        streaks = map(
-            lambda habit: (habit.name, Analytics.update_streak(habit.get_tasks(), habit.periodicity)[1]),
-            habits
-        )
-        return max(streaks, key=lambda x: x[1], default=(None, 0))
-
-    @staticmethod
-    def get_longest_streak_for_habit(habit) -> int:
-        """Return the longest streak for a specific habit."""
-        return Analytics.update_streak(habit.get_tasks(), habit.periodicity)[1]
+import heapq
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import reduce
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; batch_streaks falls back to the reducer
+    np = None
+
+# Larger than any date ordinal, so (habit index, day) pairs fit in one sortable integer key
+_ORDINAL_SPAN = 1 << 22
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+# Fewer completions than this are computed in-process, where they take less time than
+# starting worker processes (tens of ms); the vectorized pass needs far more to pay off
+PARALLEL_MIN_COMPLETIONS = 200_000 if np is None else 5_000_000
+
+
+def _vector_periods(days, periodicity: str):
+    """
+    Vectorized period_ordinal() for an int64 array of day ordinals.
+    """
+    if periodicity == 'Weekly':
+        return (days - 1) // 7
+    if periodicity == 'Monthly':
+        months = (days - _EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        return months + 1970 * 12
+    return days
+
+
+def _vector_streaks(day_lists, periodicity: str):
+    """
+    Vectorized equivalent of the streak reducer for many habits of one periodicity.
+
+    Takes one sequence of completed day ordinals per habit and returns four arrays
+    indexed like day_lists: current streak, max streak, last completed period and
+    ordinal of the latest completion (-1 when there is none).
+    """
+    count = len(day_lists)
+    current = np.zeros(count, dtype=np.int64)
+    maximum = np.zeros(count, dtype=np.int64)
+    last = np.full(count, -1, dtype=np.int64)
+    latest = np.full(count, -1, dtype=np.int64)
+
+    lengths = np.fromiter((len(d) for d in day_lists), dtype=np.int64, count=count)
+    if not lengths.sum():
+        return current, maximum, last, latest
+    seg = np.repeat(np.arange(count, dtype=np.int64), lengths)
+    days = np.concatenate([np.asarray(d, dtype=np.int64) for d in day_lists])
+    np.maximum.at(latest, seg, days)
+    # Sort by habit, then period (stable sort is near-linear on the usual already sorted
+    # histories), and keep each completed period once
+    keys = np.sort(seg * _ORDINAL_SPAN + _vector_periods(days, periodicity), kind='stable')
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    seg, periods = np.divmod(keys, _ORDINAL_SPAN)
+
+    # A run (streak) continues while each completed period directly follows the previous one
+    breaks = np.r_[True, (seg[1:] != seg[:-1]) | (np.diff(periods) != 1)]
+    run_starts = np.flatnonzero(breaks)
+    run_lengths = np.diff(np.r_[run_starts, len(keys)])
+    run_seg = seg[run_starts]
+    first_run = np.flatnonzero(np.r_[True, run_seg[1:] != run_seg[:-1]])
+    last_run = np.r_[first_run[1:] - 1, len(run_seg) - 1]
+    habits = run_seg[first_run]
+    maximum[habits] = np.maximum.reduceat(run_lengths, first_run)
+    current[habits] = run_lengths[last_run]
+    last[habits] = periods[np.r_[run_starts[1:], len(keys)][last_run] - 1]
+    return current, maximum, last, latest
+
+
+def period_ordinal(day: int, periodicity: str) -> int:
+    """
+    Returns the number of the period a day ordinal falls in: the day itself for Daily
+    habits, its week (Monday to Sunday) for Weekly and its calendar month for Monthly
+    ones. Consecutive periods have consecutive numbers.
+    """
+    if periodicity == 'Weekly':
+        return (day - 1) // 7  # day 1, 0001-01-01, is a Monday
+    if periodicity == 'Monthly':
+        d = date.fromordinal(day)
+        return d.year * 12 + d.month - 1
+    return day
+
+
+def period_start(period: int, periodicity: str) -> int:
+    """
+    Returns the day ordinal of the first day of a period numbered by period_ordinal.
+    """
+    if periodicity == 'Weekly':
+        return period * 7 + 1
+    if periodicity == 'Monthly':
+        return date(period // 12, period % 12 + 1, 1).toordinal()
+    return period
+
+
+def period_end(period: int, periodicity: str) -> int:
+    """
+    Returns the day ordinal of the last day of a period numbered by period_ordinal.
+    """
+    return period_start(period + 1, periodicity) - 1
+
+
+class CompletionCounts:
+    """
+    Running completion counts of one habit, so that any window is counted in O(1).
+
+    periods[i] is the number of completed periods among the first i periods from
+    first_period (the period of first_day). weekdays[i] is the number of completed
+    days among first_day + i, first_day + i - 7, first_day + i - 14, ..., i.e. a
+    running count per weekday, from which single days and weekday totals follow.
+    Both are built in one pass over the completed days; completing a day after all
+    counted ones extends them in O(1), an earlier one updates their tails.
+    """
+
+    __slots__ = ("periodicity", "first_day", "first_period", "periods", "weekdays")
+
+    def __init__(self, periodicity: str, first_day: int, days=()):
+        self.periodicity = periodicity
+        self.first_day = first_day
+        self.first_period = period_ordinal(first_day, periodicity)
+        self.periods = array('i', [0])
+        self.weekdays = array('i')
+        for day in days:
+            self.add(day)
+
+    def add(self, day: int) -> bool:
+        """
+        Counts a newly completed day (each day at most once). Returns False, counting
+        nothing, for a day before first_day; the counts must then be rebuilt.
+        """
+        if day < self.first_day:
+            return False
+        weekdays = self.weekdays
+        i = day - self.first_day
+        while len(weekdays) <= i:
+            weekdays.append(weekdays[-7] if len(weekdays) >= 7 else 0)
+        for j in range(i, len(weekdays), 7):
+            weekdays[j] += 1
+
+        periods = self.periods
+        p = period_ordinal(day, self.periodicity) - self.first_period
+        if len(periods) < p + 2:
+            periods.extend([periods[-1]] * (p + 2 - len(periods)))
+        if periods[p + 1] == periods[p]:  # the first completion in its period
+            for j in range(p + 1, len(periods)):
+                periods[j] += 1
+        return True
+
+    def completed_periods(self, first: int, last: int) -> int:
+        """
+        Returns how many periods from period ordinal first to last (inclusive) have a completion.
+        """
+        end = len(self.periods) - 1
+        lo = min(max(first - self.first_period, 0), end)
+        hi = min(max(last + 1 - self.first_period, 0), end)
+        return max(self.periods[hi] - self.periods[lo], 0)
+
+    def is_completed(self, day: int) -> bool:
+        i = day - self.first_day
+        if not 0 <= i < len(self.weekdays):
+            return False
+        return self.weekdays[i] > (self.weekdays[i - 7] if i >= 7 else 0)
+
+    def _weekday_count(self, until: int, weekday: int) -> int:
+        """
+        Returns the completed days on weekday (0 is Monday) up to day ordinal until.
+        """
+        i = min(until - self.first_day, len(self.weekdays) - 1)
+        i -= (self.first_day + i - 1 - weekday) % 7  # back to the nearest such weekday
+        return self.weekdays[i] if i >= 0 else 0
+
+    def weekday_counts(self, first: int, last: int) -> list:
+        """
+        Returns the completed days from day ordinal first to last for each weekday, Monday first.
+        """
+        return [self._weekday_count(last, weekday) - self._weekday_count(first - 1, weekday)
+                for weekday in range(7)]
+
+
+def _chunk_streaks(periodicity: str, day_blobs):
+    """
+    Computes the streaks of a chunk of habits of one periodicity in a worker process.
+    Takes each habit's completed day ordinals as the bytes of an array('i'), and
+    returns (last completed period, current, max, latest day ordinal) per habit, with
+    -1 for missing ordinals.
+    """
+    day_lists = []
+    for blob in day_blobs:
+        days = array('i')
+        days.frombytes(blob)
+        day_lists.append(days)
+    if np is not None:
+        current, maximum, last, latest = _vector_streaks(day_lists, periodicity)
+        return [(int(last[i]), int(current[i]), int(maximum[i]), int(latest[i])) for i in range(len(day_lists))]
+    results = []
+    for days in day_lists:
+        last, current, maximum = Analytics.day_streak_state(days, periodicity)
+        results.append((-1 if last is None else last, current, maximum, days[-1] if days else -1))
+    return results
+
+
+class Analytics:
+    @staticmethod
+    def period_step(acc, period: int):
+        """
+        Advance a (last_period, current_streak, max_streak) state by one completed period.
+        A streak counts consecutive periods (days, weeks or months; see period_ordinal)
+        with a completion: the next period extends it, a later one starts a new streak.
+        Periods must be fed in order; repeated or earlier ones leave the state unchanged.
+        """
+        last_period, current_streak, max_streak = acc
+        if last_period is None:
+            return (period, 1, 1)  # first completion
+        if period <= last_period:
+            return acc  # same period (or earlier) — already counted
+        current_streak = current_streak + 1 if period == last_period + 1 else 1
+        return (period, current_streak, max(current_streak, max_streak))
+
+    @staticmethod
+    def streak_step(acc, date, periodicity: str):
+        """Advance a (last_period, current_streak, max_streak) state by a completion on date."""
+        return Analytics.period_step(acc, period_ordinal(date.toordinal(), periodicity))
+
+    @staticmethod
+    def streak_state(tasks, periodicity: str):
+        """Run the reducer over all tasks and return the final (last_period, current, max) state."""
+        days = sorted(task.date.toordinal() for task in tasks if task.is_complete)
+        return Analytics.day_streak_state(days, periodicity)
+
+    @staticmethod
+    def day_streak_state(days, periodicity: str):
+        """Run the reducer over sorted day ordinals of completed tasks and return its final state."""
+        if periodicity == 'Daily':
+            periods = days
+        else:
+            periods = (period_ordinal(day, periodicity) for day in days)
+        return reduce(Analytics.period_step, periods, (None, 0, 0))
+
+    @staticmethod
+    def update_streak(tasks, periodicity: str) -> (int, int):
+        """Functional approach to calculate current and max streaks."""
+        _, current_streak, max_streak = Analytics.streak_state(tasks, periodicity)
+        return current_streak, max_streak
+
+    @staticmethod
+    def batch_streaks(habits) -> list:
+        """
+        Return (current, max) streaks for many habits at once.
+        Habits without cached streaks are computed together in one vectorized pass
+        per periodicity, and their cached state is filled in for later calls.
+        """
+        habits = list(habits)
+        stale = [habit for habit in habits if habit.streaks_stale]
+        if np is not None and stale:
+            by_periodicity = {}
+            for habit in stale:
+                by_periodicity.setdefault(habit.periodicity, []).append(habit)
+            for periodicity, group in by_periodicity.items():
+                current, maximum, last, latest = _vector_streaks(
+                    [habit.completed_days() for habit in group], periodicity)
+                for i, habit in enumerate(group):
+                    habit.set_streak_state((int(last[i]) if last[i] >= 0 else None, int(current[i]), int(maximum[i])),
+                                           int(latest[i]) if latest[i] >= 0 else None)
+        return [habit.get_streaks() for habit in habits]
+
+    @staticmethod
+    def parallel_streaks(habits, workers=None, min_completions=PARALLEL_MIN_COMPLETIONS) -> list:
+        """
+        Like batch_streaks, but computes the stale habits in a pool of `workers` processes
+        (one per core by default). Habits are grouped by periodicity and split into
+        chunks of about equal completion counts; each worker gets only the completed
+        day ordinals as raw bytes. With fewer than min_completions completions to
+        compute, or a single worker, this is batch_streaks.
+        """
+        habits = list(habits)
+        workers = workers or os.cpu_count() or 1
+        stale = [habit for habit in habits if habit.streaks_stale]
+        day_lists = [habit.completed_days() for habit in stale]
+        total = sum(len(days) for days in day_lists)
+        if workers < 2 or len(stale) < 2 or total < min_completions:
+            return Analytics.batch_streaks(habits)
+
+        chunks = []  # (periodicity, habits, day lists)
+        by_periodicity = {}
+        for habit, days in zip(stale, day_lists):
+            by_periodicity.setdefault(habit.periodicity, []).append((habit, days))
+        target = total // (workers * 4) + 1  # a few chunks per worker evens out uneven habits
+        for periodicity, group in by_periodicity.items():
+            chunk, size = [], 0
+            for habit, days in group:
+                chunk.append((habit, days))
+                size += len(days)
+                if size >= target:
+                    chunks.append((periodicity, chunk))
+                    chunk, size = [], 0
+            if chunk:
+                chunks.append((periodicity, chunk))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_chunk_streaks, periodicity,
+                                   [array('i', days).tobytes() for _, days in chunk])
+                       for periodicity, chunk in chunks]
+            for (_, chunk), future in zip(chunks, futures):
+                for (habit, _), (last, current, maximum, latest) in zip(chunk, future.result()):
+                    habit.set_streak_state((last if last >= 0 else None, current, maximum),
+                                           latest if latest >= 0 else None)
+        return [habit.get_streaks() for habit in habits]
+
+    @staticmethod
+    def get_longest_streak(habits, workers=None) -> (str, int):
+        """
+        Return the habit with the longest streak.
+        Given workers, large recomputes run in worker processes (see parallel_streaks).
+        """
+        habits = list(habits)
+        streaks = Analytics.parallel_streaks(habits, workers) if workers else Analytics.batch_streaks(habits)
+        return max(zip((habit.name for habit in habits), (s[1] for s in streaks)),
+                   key=lambda x: x[1], default=(None, 0))
+
+    @staticmethod
+    def top_streaks(habits, k=10, by="max", periodicity=None) -> list:
+        """
+        Return the top k (habit, streak) pairs ranked by max or current streak, of one
+        periodicity if given. Ties go to the lowest habit ID. Cached streaks are used
+        where present (see batch_streaks), and a k-sized heap picks the leaders
+        instead of sorting every habit.
+        """
+        if by not in ("max", "current"):
+            raise ValueError(f"by must be 'max' or 'current', not {by!r}")
+        if periodicity is not None:
+            habits = [habit for habit in habits if habit.periodicity == periodicity]
+        habits = list(habits)
+        column = 1 if by == "max" else 0
+        ranked = zip(habits, (streaks[column] for streaks in Analytics.batch_streaks(habits)))
+        return heapq.nsmallest(k, ranked, key=lambda pair: (-pair[1], pair[0].id))
+
+    @staticmethod
+    def leaderboard(habits, k=10, by="max") -> dict:
+        """
+        Return the top_streaks of all habits ("All") and of each periodicity that has habits.
+        """
+        habits = list(habits)
+        Analytics.batch_streaks(habits)  # fill any stale caches once, for every ranking
+        boards = {"All": Analytics.top_streaks(habits, k, by)}
+        present = {habit.periodicity for habit in habits}
+        for periodicity in ("Daily", "Weekly", "Monthly"):
+            if periodicity in present:
+                boards[periodicity] = Analytics.top_streaks(habits, k, by, periodicity)
+        return boards
+
+    @staticmethod
+    def _day_range(habit, start, end):
+        """
+        Returns the day ordinals from start to end, moved up to the habit's first day,
+        and the habit's CompletionCounts.
+        """
+        counts = habit.completion_counts()
+        return max(start.toordinal(), counts.first_day), end.toordinal(), counts
+
+    @staticmethod
+    def completion_rate(habit, start, end) -> float:
+        """
+        Return the share of the habit's periods from start to end (both days included,
+        from the habit's first day at the earliest) in which it was completed.
+        """
+        first, last, counts = Analytics._day_range(habit, start, end)
+        if last < first:
+            return 0.0
+        first, last = period_ordinal(first, habit.periodicity), period_ordinal(last, habit.periodicity)
+        return counts.completed_periods(first, last) / (last - first + 1)
+
+    @staticmethod
+    def completion_rates(habit, windows=(7, 30, 365), end=None) -> dict:
+        """Return {days: completion rate over the last `days` days up to end (today by default)}."""
+        end = end or datetime.now()
+        return {days: Analytics.completion_rate(habit, end - timedelta(days=days - 1), end) for days in windows}
+
+    @staticmethod
+    def weekday_breakdown(habit, start, end) -> list:
+        """
+        Return (completed days, days) for each weekday, Monday first, from start to end
+        (from the habit's first day at the earliest).
+        """
+        first, last, counts = Analytics._day_range(habit, start, end)
+        if last < first:
+            return [(0, 0)] * 7
+        weeks, rest = divmod(last - first + 1, 7)
+        first_weekday = (first - 1) % 7
+        return [(done, weeks + ((weekday - first_weekday) % 7 < rest))
+                for weekday, done in enumerate(counts.weekday_counts(first, last))]
+
+    @staticmethod
+    def heatmap(habit, start, end) -> list:
+        """
+        Return calendar heatmap data from start to end: a list of (Monday, days) weeks,
+        where days holds 1 for a completed day, 0 for a missed one and None for days
+        outside the range.
+        """
+        counts = habit.completion_counts()
+        first, last = start.toordinal(), end.toordinal()
+        weeks = []
+        for monday in range(first - (first - 1) % 7, last + 1, 7):
+            weeks.append((datetime.fromordinal(monday),
+                          [int(counts.is_completed(day)) if first <= day <= last else None
+                           for day in range(monday, monday + 7)]))
+        return weeks
+
+    @staticmethod
+    def get_longest_streak_in_storage(storage, user_id=None) -> (str, int):
+        """Return the habit with the longest streak (of user_id, if given), read from the stored habit_stats."""
+        return storage.longest_streak(user_id)
+
+    @staticmethod
+    def get_longest_streak_for_habit(habit) -> int:
+        """Return the longest streak for a specific habit."""
+        return habit.get_streaks()[1]
@@ -0,0 +1,174 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from habit import Habit, Task, from_micros, to_micros
+
+
+def parse_task_row(habit_id, date, is_complete, completed_at):
+    """
+    Converts a (habit_id, date, is_complete, completed_at) row with ISO text dates, as
+    given to save_task_rows, to (habit_id, day ordinal, is_complete, completed_at in
+    to_micros() form or None).
+    """
+    return (habit_id, datetime.fromisoformat(date[:10]).toordinal(), int(bool(is_complete)),
+            to_micros(datetime.fromisoformat(completed_at), None) if completed_at else None)
+
+
+class StorageBackend(ABC):
+    """
+    The operations User, the CLI, the server and the import/export tools need from a
+    storage engine. Storage (SQLite) is the default implementation; MemoryStorage and
+    LogStorage are the others, and storage.open_storage picks one by name.
+
+    Every backend has a lock (a threading.RLock) that its writes hold and that users
+    of the backend lock too (see User), and a db_path used to place snapshot files
+    (":memory:" when the data does not outlive the process). Habits are returned as
+    new Habit objects with their streak state filled in; tasks are keyed by habit
+    and day, and saving a day again completes it if either save did. Writes made
+    inside batch() are committed together, or not at all if the block raises.
+    """
+
+    db_path = ":memory:"
+
+    @abstractmethod
+    def close(self):
+        """
+        Releases the backend's resources. It cannot be used afterwards.
+        """
+
+    @abstractmethod
+    def batch(self):
+        """
+        Returns a context manager grouping every write made inside it into one
+        transaction. Nested batches join the outer one.
+        """
+
+    @abstractmethod
+    def in_batch(self) -> bool:
+        """
+        Returns whether the calling thread, which holds lock, is inside batch().
+        """
+
+    @abstractmethod
+    def get_user_id(self, name):
+        """
+        Returns the ID of the user with the given name, creating the user if needed.
+        """
+
+    @abstractmethod
+    def save_habit(self, habit: Habit, user_id=None):
+        """
+        Saves a new habit owned by user_id. A habit without an ID gets the next free
+        one, stored back on the habit.
+        """
+
+    @abstractmethod
+    def update_habit(self, habit: Habit):
+        """
+        Updates the name and periodicity of an existing habit.
+        """
+
+    @abstractmethod
+    def delete_habit(self, habit_id):
+        """
+        Deletes a habit and all its tasks.
+        """
+
+    @abstractmethod
+    def delete_tasks(self, habit_id):
+        """
+        Deletes all tasks of a habit.
+        """
+
+    @abstractmethod
+    def save_tasks(self, habit_id, tasks):
+        """
+        Saves several Task objects of a habit.
+        """
+
+    @abstractmethod
+    def save_task_rows(self, rows):
+        """
+        Saves raw (habit_id, date, is_complete, completed_at) rows with ISO text dates.
+        """
+
+    @abstractmethod
+    def load_habits(self, with_tasks=True, user_id=None):
+        """
+        Returns every habit (or every habit of user_id) ordered by ID, with their
+        tasks unless with_tasks is False.
+        """
+
+    @abstractmethod
+    def load_task_values(self, habit_id):
+        """
+        Returns the tasks of a habit as (day, is_complete, completed_at) rows ordered by
+        day, in the form Habit.load_tasks takes.
+        """
+
+    @abstractmethod
+    def get_habit_by_id(self, habit_id):
+        """
+        Returns a habit with its tasks, or None if there is none with that ID.
+        """
+
+    @abstractmethod
+    def load_streaks(self, user_id=None):
+        """
+        Returns (habit_id, name, periodicity, current_streak, max_streak) for every
+        habit (or every habit of user_id), ordered by habit ID.
+        """
+
+    @abstractmethod
+    def longest_streak(self, user_id=None):
+        """
+        Returns (name, max_streak) of the habit with the longest streak, ties going to
+        the lowest habit ID, or (None, 0) without habits.
+        """
+
+    @abstractmethod
+    def max_habit_id(self):
+        """
+        Returns the highest habit ID in use, or 0 when there are no habits.
+        """
+
+    @abstractmethod
+    def iter_history(self, chunk_size=10000, user_id=None):
+        """
+        Yields (habit_id, name, periodicity, created_at, date, is_complete, completed_at)
+        rows for every task, ordered by habit and date, dates as ISO text. Habits without
+        tasks yield one row with None in the task columns.
+        """
+
+    @abstractmethod
+    def data_state(self, user_id=None):
+        """
+        Returns a tuple of integers that changes whenever the stored data (of user_id,
+        when given) does, for telling whether a snapshot is still current (see
+        snapshot.py). It must not cost a scan of every task.
+        """
+
+    @abstractmethod
+    def compact(self):
+        """
+        Drops tasks of deleted habits and reclaims space. Returns the number of task
+        rows removed.
+        """
+
+    @abstractmethod
+    def rebuild_stats(self):
+        """
+        Recomputes the stored streaks of every habit. Returns the number of habits.
+        """
+
+    def save_task(self, habit_id, task: Task):
+        """
+        Saves one task of a habit, replacing any task saved for the same habit and day.
+        """
+        self.save_tasks(habit_id, [task])
+
+    def load_tasks(self, habit_id):
+        """
+        Loads the tasks of a habit as Task objects.
+        """
+        return [Task(datetime.fromordinal(day), bool(is_complete), from_micros(completed_at))
+                for day, is_complete, completed_at in self.load_task_values(habit_id)]
@@ -0,0 +1,161 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from analytics import Analytics
+from main import CLI, LAST_TASKS
+from storage import Storage
+from synthetic import populate
+from user import User
+
+BASELINE_PATH = "benchmark_baseline.json"
+# habits and years of history per scale; "large" is about 600,000 task rows
+SCALES = {
+    "small": {"habits": 100, "years": 1},
+    "medium": {"habits": 1000, "years": 1},
+    "large": {"habits": 1000, "years": 5},
+}
+DEFAULT_SCALES = ("small", "medium")
+TOLERANCE = 2.0  # a benchmark regresses when it is this many times slower than its baseline...
+MIN_REGRESSION = 0.025  # ...and at least this many seconds slower, so timer noise is ignored
+USER_NAME = "Benchmark"
+
+
+def _best(operation, repeat, prepare=None):
+    """
+    Returns the fastest of `repeat` timed runs of operation(state), where state is
+    what prepare() returns; preparing is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        state = prepare() if prepare else None
+        started = time.perf_counter()
+        operation(state)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _stale(habits):
+    """
+    Drops the cached streaks, so the next streak query computes them from the tasks.
+    """
+    for habit in habits:
+        habit.set_streak_state(None, None)
+    return habits
+
+
+def run_scale(habits, years, density=0.8, duplicates=0.05, seed=0, repeat=3):
+    """
+    Builds a synthetic database of the given size and times the hot paths on it.
+    Returns {benchmark name: best time in seconds}.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, "benchmark.db"))
+        user_id = populate(storage, habits, years, density, duplicates, seed, USER_NAME)
+        loaded = storage.load_habits(user_id=user_id)
+        task_lists = [(habit.get_tasks(), habit.periodicity) for habit in loaded]
+        user = User(USER_NAME, storage=storage, lazy=False)
+        cli = CLI(user)
+
+        def last_days():
+            return [(habit, habit.get_tasks()[-1].date)
+                    for habit in storage.load_habits(user_id=user_id)[:100] if habit.task_count]
+
+        def complete_next_month(state):
+            for habit, last in state:
+                for offset in range(1, 31):
+                    habit.complete_task(last + timedelta(days=offset))
+
+        def display(state):
+            with redirect_stdout(io.StringIO()):
+                cli.display_habits(state)
+
+        def display_last(state):
+            with redirect_stdout(io.StringIO()):
+                cli.display_habits(state, last=LAST_TASKS)
+
+        results = {
+            "storage_load_habits": _best(lambda _: storage.load_habits(user_id=user_id), repeat),
+            "user_init_lazy": _best(lambda _: User(USER_NAME, storage=storage), repeat),
+            "user_init_eager": _best(lambda _: User(USER_NAME, storage=storage, lazy=False), repeat),
+            "user_init_snapshot": _best(lambda _: User(USER_NAME, storage=storage, lazy=False, snapshot=True), repeat,
+                                        lambda: User(USER_NAME, storage=storage, snapshot=True).save_snapshot()),
+            "habit_complete_task": _best(complete_next_month, repeat, last_days),
+            "analytics_update_streak": _best(
+                lambda _: [Analytics.update_streak(tasks, periodicity) for tasks, periodicity in task_lists], repeat),
+            "analytics_get_longest_streak": _best(lambda state: Analytics.get_longest_streak(state), repeat,
+                                                  lambda: _stale(loaded)),
+            "cli_display_habits": _best(display, repeat, lambda: _stale(user.list_habits())),
+            "cli_display_last_tasks": _best(display_last, repeat, lambda: _stale(user.list_habits())),
+        }
+        storage.close()
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Returns a message for every benchmark that is slower than its baseline by more
+    than the tolerance factor (and MIN_REGRESSION seconds).
+    """
+    regressions = []
+    for scale, timings in results.items():
+        for name, seconds in timings.items():
+            expected = baseline.get(scale, {}).get(name)
+            if expected is not None and seconds > expected * tolerance and seconds - expected > MIN_REGRESSION:
+                regressions.append(f"{scale}/{name}: {seconds:.4f}s, baseline {expected:.4f}s "
+                                   f"({seconds / expected:.1f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the hot paths of the habit tracker on synthetic histories.")
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=DEFAULT_SCALES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the fastest counts")
+    parser.add_argument("--density", type=float, default=0.8, help="share of periods completed")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="share of days completed twice")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="JSON file with the results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scale in args.scales:
+        results[scale] = run_scale(**SCALES[scale], density=args.density, duplicates=args.duplicates,
+                                   seed=args.seed, repeat=args.repeat)
+        for name, seconds in results[scale].items():
+            print(f"{scale:>7} {name:<30} {seconds * 1000:10.2f} ms")
+
+    report = {"python": platform.python_version(), "machine": platform.machine(),
+              "parameters": {"density": args.density, "duplicates": args.duplicates, "seed": args.seed,
+                             "scales": {scale: SCALES[scale] for scale in args.scales}},
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+        print(f"Baseline written to {args.baseline}.")
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as source:
+            regressions = compare(results, json.load(source)["results"], args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS against " + args.baseline + ":", file=sys.stderr)
+            for message in regressions:
+                print("  " + message, file=sys.stderr)
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
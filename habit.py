@@ -1,55 +1,388 @@
-from datetime import datetime
-from typing import List
-
-class Task:
-    """
-    Represents a single task (instance of a habit) on a specific date.
-    """
-
-    def __init__(self, date: datetime, is_complete=False, completed_at=None):
-        self.date = date
-        self.is_complete = is_complete
-        self.completed_at = completed_at
-
-    def complete(self, completed_at: datetime):
-        """
-        Marks the task as complete and stores the completion timestamp.
-        """
-        self.is_complete = True
-        self.completed_at = completed_at
-
-class Habit:
-    """
-    Represents a habit with periodicity and a list of tasks.
-    """
-
-    def __init__(self, habit_id: int, name: str, periodicity: str, created_at=None):
-        self.id = habit_id
-        self.name = name
-        self.periodicity = periodicity
-        self.created_at = created_at or datetime.now()
-        self.tasks: List[Task] = []
-
-    def get_tasks(self):
-        """
-        Returns all tasks associated with the habit.
-        """
-        return self.tasks
-
-    def complete_task(self, date: datetime):
-        """
-        Marks a task as complete on a specific date or adds a new completed task.
-        """
-        task = next((t for t in self.tasks if t.date.date() == date.date()), None)
-        if task:
-            task.complete(datetime.now())
-        else:
-            new_task = Task(date)
-            new_task.complete(datetime.now())
-            self.tasks.append(new_task)
-
-    def reset_tasks(self):
-        """
-        Clears all tasks (used when editing a habit).
-        """
-        self.tasks = []
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import List
+from analytics import Analytics, CompletionCounts, period_ordinal
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NO_TIMESTAMP = -(1 << 63)  # stored when a task has no completion timestamp
+
+
+def to_micros(value, missing=_NO_TIMESTAMP):
+    """
+    Returns a timestamp as microseconds since 1970-01-01 in local time (like
+    datetime.now()), the form completion times are held and stored in; missing for None.
+    """
+    if value is None:
+        return missing
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_micros(value):
+    """
+    Returns the datetime of a to_micros() value, or None when there is no timestamp.
+    """
+    return None if value is None or value == _NO_TIMESTAMP else _EPOCH + timedelta(microseconds=value)
+
+
+class Task:
+    """
+    Represents a single task (instance of a habit) on a specific date.
+    """
+
+    __slots__ = ("date", "is_complete", "completed_at", "_habit")
+
+    def __init__(self, date: datetime, is_complete=False, completed_at=None):
+        self.date = date
+        self.is_complete = is_complete
+        self.completed_at = completed_at
+        self._habit = None  # the habit this task was read from, if any
+
+    def complete(self, completed_at: datetime):
+        """
+        Marks the task as complete and stores the completion timestamp.
+        A task read from a habit is completed in the habit too.
+        """
+        self.is_complete = True
+        self.completed_at = completed_at
+        if self._habit is not None:
+            self._habit._complete(self.date, completed_at)
+
+class Habit:
+    """
+    Represents a habit with periodicity and a list of tasks.
+
+    Tasks are kept in compact form: one entry per day in a sorted array of day
+    ordinals, a parallel array of completion timestamps (microseconds since the
+    epoch) and a bitmap of completed days. Task objects are only built on request.
+    The bitmap answers "is this day done" in O(1); lookups and date ranges use
+    binary search over the sorted days.
+
+    The tasks can also be left unloaded (see unload_tasks): they are then fetched
+    through a loader on first access.
+
+    The streak state (last completed period, current streak, max streak) is cached
+    and advanced incrementally as newer completions arrive. It is recomputed from the
+    full task list only after a backfill into an earlier period or a direct change to
+    the tasks.
+    """
+
+    __slots__ = ("id", "name", "periodicity", "created_at", "_loader",
+                 "_days", "_timestamps", "_done", "_done_base", "_streak", "_latest", "_counts")
+
+    def __init__(self, habit_id: int, name: str, periodicity: str, created_at=None):
+        self.id = habit_id
+        self.name = name
+        self.periodicity = periodicity
+        self.created_at = created_at or datetime.now()
+        self.reset_tasks()
+
+    @property
+    def tasks(self) -> List[Task]:
+        return self.get_tasks()
+
+    @tasks.setter
+    def tasks(self, tasks: List[Task]):
+        self.reset_tasks()
+        for task in tasks:
+            self.add_task(task.date, task.is_complete, task.completed_at)
+
+    def get_tasks(self):
+        """
+        Returns all tasks associated with the habit, ordered by date.
+        The list is built on each call: completing one of its tasks (Task.complete)
+        completes it in the habit, but adding to or removing from the list does not
+        change the habit; use add_task, complete_task or the tasks setter for that.
+        """
+        self._ensure_loaded()
+        return self._build_tasks(0, len(self._days))
+
+    def get_task(self, date: datetime):
+        """
+        Returns the task on the given day, or None if there is none.
+        """
+        self._ensure_loaded()
+        day = date.toordinal()
+        i = self._position(day)
+        if i < len(self._days) and self._days[i] == day:
+            return self._build_tasks(i, i + 1)[0]
+        return None
+
+    def is_completed(self, date: datetime) -> bool:
+        """
+        Returns whether the task on the given day is complete.
+        """
+        self._ensure_loaded()
+        return self._is_done(date.toordinal())
+
+    def tasks_between(self, start: datetime, end: datetime):
+        """
+        Returns the tasks dated from start to end (both days included), ordered by date.
+        """
+        self._ensure_loaded()
+        return self._build_tasks(bisect_left(self._days, start.toordinal()),
+                                 bisect_right(self._days, end.toordinal()))
+
+    def last_tasks(self, count: int):
+        """
+        Returns the latest count tasks, ordered by date.
+        """
+        self._ensure_loaded()
+        return self._build_tasks(max(len(self._days) - count, 0), len(self._days))
+
+    def add_task(self, date: datetime, is_complete=False, completed_at=None):
+        """
+        Adds a task for the given date, keeping tasks ordered by date. A task that
+        already exists for that day is marked complete if either of them is.
+        """
+        self._ensure_loaded()
+        self._add_day(date.toordinal(), is_complete, to_micros(completed_at))
+
+    def add_task_row(self, day: int, is_complete, completed_at):
+        """
+        Adds a task in the form it is stored in: a day ordinal, a completion flag and
+        the completion time as to_micros() microseconds (None when there is none).
+        """
+        self._ensure_loaded()
+        self._add_day(day, is_complete, _NO_TIMESTAMP if completed_at is None else completed_at)
+
+    def _add_day(self, day: int, is_complete, completed_at: int):
+        i = self._position(day)
+        if i < len(self._days) and self._days[i] == day:
+            if not is_complete or self._is_done(day):
+                return
+            self._timestamps[i] = completed_at
+        else:
+            self._days.insert(i, day)
+            self._timestamps.insert(i, completed_at)
+        if is_complete:
+            self._set_done(day)
+            self._record_completion(day)
+
+    def complete_task(self, date: datetime):
+        """
+        Marks a task as complete on a specific date or adds a new completed task.
+        Returns the completed task.
+        """
+        i = self._complete(date, datetime.now())
+        return self._build_tasks(i, i + 1)[0]
+
+    def _complete(self, date: datetime, completed_at):
+        """
+        Marks the task on the given day complete (adding it if needed) with the given
+        timestamp. Returns its index.
+        """
+        self._ensure_loaded()
+        day = date.toordinal()
+        i = self._position(day)
+        if i < len(self._days) and self._days[i] == day:
+            self._timestamps[i] = to_micros(completed_at)
+            if not self._is_done(day):
+                self._set_done(day)
+                self._record_completion(day)
+        else:
+            self._days.insert(i, day)
+            self._timestamps.insert(i, to_micros(completed_at))
+            self._set_done(day)
+            self._record_completion(day)
+        return i
+
+    def reset_tasks(self):
+        """
+        Clears all tasks (used when editing a habit).
+        """
+        self._loader = None
+        self._days = array("i")
+        self._timestamps = array("q")
+        self._done = bytearray()
+        self._done_base = 0
+        self._counts = None
+        self._invalidate_streaks()
+
+    def completed_days(self):
+        """
+        Returns the sorted day ordinals of all completed tasks.
+        """
+        self._ensure_loaded()
+        if int.from_bytes(self._done, "little").bit_count() == len(self._days):
+            return self._days
+        return array("i", (day for day in self._days if self._is_done(day)))
+
+    @property
+    def tasks_loaded(self) -> bool:
+        """
+        False while the tasks are waiting to be fetched by a loader.
+        """
+        return self._loader is None
+
+    @property
+    def task_count(self) -> int:
+        """
+        Number of tasks currently held in memory.
+        """
+        return len(self._days)
+
+    def memory_usage(self) -> int:
+        """
+        Bytes taken by the habit object, its in-memory task arrays and its completion counts.
+        """
+        size = (sys.getsizeof(self) + sys.getsizeof(self._days) + sys.getsizeof(self._timestamps)
+                + sys.getsizeof(self._done))
+        if self._counts is not None:
+            size += sys.getsizeof(self._counts.periods) + sys.getsizeof(self._counts.weekdays)
+        return size
+
+    def unload_tasks(self, loader):
+        """
+        Drops the in-memory tasks; loader(habit) is called to add them back (via
+        load_tasks) the next time they are needed. The cached streaks are kept.
+        """
+        streak, latest = self._streak, self._latest
+        self.reset_tasks()
+        self._streak, self._latest = streak, latest
+        self._loader = loader
+
+    def load_tasks(self, rows):
+        """
+        Fills in unloaded tasks from stored (day, is_complete, completed_at) rows (see
+        add_task_row), keeping the cached streak state they were computed from. The
+        tasks only count as loaded once every row is in, so a loader racing another
+        thread never hands out a partial list.
+        """
+        streak, latest = self._streak, self._latest
+        for day, is_complete, completed_at in rows:
+            self._add_day(day, is_complete, _NO_TIMESTAMP if completed_at is None else completed_at)
+        self._streak, self._latest = streak, latest
+        self._loader = None
+
+    def task_arrays(self):
+        """
+        Returns the tasks in their compact form: (days, timestamps, done, done_base),
+        the arrays described in the class docstring. Used to write snapshots.
+        """
+        self._ensure_loaded()
+        return self._days, self._timestamps, self._done, self._done_base
+
+    def load_task_arrays(self, days: array, timestamps: array, done: bytearray, done_base: int):
+        """
+        Fills in unloaded tasks from arrays in the form task_arrays() returns (e.g.
+        read from a snapshot file), taking them over whole rather than task by task.
+        The cached streak state is kept, as in load_tasks.
+        """
+        self._days, self._timestamps, self._done, self._done_base = days, timestamps, done, done_base
+        self._loader = None
+
+    def completion_counts(self) -> CompletionCounts:
+        """
+        Returns the running completion counts behind the completion-rate analytics,
+        built on first use from the habit's first day (its creation or first task,
+        whichever is earlier) and kept up to date as tasks are completed.
+        """
+        self._ensure_loaded()
+        if self._counts is None:
+            days = self.completed_days()
+            first_day = min(self.created_at.toordinal(), days[0]) if days else self.created_at.toordinal()
+            self._counts = CompletionCounts(self.periodicity, first_day, days)
+        return self._counts
+
+    @property
+    def streaks_stale(self) -> bool:
+        """
+        True when the cached streak state has to be recomputed.
+        """
+        return self._streak is None
+
+    def set_streak_state(self, state, latest):
+        """
+        Stores a (last_period, current, max) streak state computed elsewhere (see
+        Analytics.batch_streaks) together with the day ordinal of the latest
+        completion it covers.
+        """
+        self._streak = state
+        self._latest = latest
+
+    def streak_state(self):
+        """
+        Returns the (last_period, current, max) streak state and the day ordinal of
+        the latest completion it covers, as set_streak_state takes them, computing
+        the state first if it is stale.
+        """
+        self.get_streaks()
+        return self._streak, self._latest
+
+    def get_streaks(self):
+        """
+        Returns the (current_streak, max_streak) of the habit.
+        """
+        if self._streak is None:
+            days = self.completed_days()
+            self._streak = Analytics.day_streak_state(days, self.periodicity)
+            self._latest = days[-1] if days else None
+        return self._streak[1], self._streak[2]
+
+    def _ensure_loaded(self):
+        """
+        Runs the pending loader, if any.
+        """
+        if self._loader is not None:
+            self._loader(self)
+
+    def _position(self, day: int) -> int:
+        """
+        Returns the index of the day in the sorted days, or where it would be inserted.
+        """
+        if not self._days or self._days[-1] < day:
+            return len(self._days)  # the common case: a day after every existing one
+        return bisect_left(self._days, day)
+
+    def _build_tasks(self, start: int, stop: int):
+        tasks = [Task(datetime.fromordinal(self._days[i]), self._is_done(self._days[i]),
+                      from_micros(self._timestamps[i]))
+                 for i in range(start, stop)]
+        for task in tasks:
+            task._habit = self
+        return tasks
+
+    def _is_done(self, day: int) -> bool:
+        offset = day - self._done_base
+        return 0 <= offset < 8 * len(self._done) and bool(self._done[offset >> 3] >> (offset & 7) & 1)
+
+    def _set_done(self, day: int):
+        """
+        Sets the bitmap bit for a day, growing the bitmap in whole bytes when needed.
+        """
+        if not self._done:
+            self._done_base = day & ~7
+        elif day < self._done_base:
+            self._done[:0] = bytes((self._done_base - (day & ~7)) >> 3)
+            self._done_base = day & ~7
+        offset = day - self._done_base
+        if offset >> 3 >= len(self._done):
+            self._done.extend(bytes((offset >> 3) - len(self._done) + 1))
+        self._done[offset >> 3] |= 1 << (offset & 7)
+
+    def _record_completion(self, day: int):
+        """
+        Advances the cached streak state by one completion. A day before the latest
+        completion leaves it unchanged when it falls in the last completed period,
+        and drops it otherwise. Also counts the day in the completion counts, if
+        they have been built.
+        """
+        if self._counts is not None and not self._counts.add(day):
+            self._counts = None
+        if self._streak is None:
+            return
+        period = day if self.periodicity == "Daily" else period_ordinal(day, self.periodicity)
+        if self._latest is None or day > self._latest:
+            self._streak = Analytics.period_step(self._streak, period)
+            self._latest = day
+        elif period != self._streak[0]:
+            self._invalidate_streaks()
+
+    def _invalidate_streaks(self):
+        self._streak = None
+        self._latest = None
@@ -0,0 +1,175 @@
+import inspect
+import json
+import re
+import sys
+import threading
+from time import perf_counter
+from analytics import Analytics
+from log_storage import LogStorage
+from memory_storage import MemoryStorage
+from storage import Storage
+
+try:
+    import resource
+except ImportError:  # not available on Windows; the RSS gauge is left out there
+    resource = None
+
+# Methods timed while instrumentation is enabled. Each is wrapped only then, so
+# disabled instrumentation leaves the original methods in place and costs nothing.
+INSTRUMENTED = {
+    Storage: ("load_habits", "load_streaks", "load_task_values", "load_tasks", "get_habit_by_id",
+              "get_user_id", "save_habit", "update_habit", "delete_habit", "delete_tasks",
+              "save_task_rows", "_flush_tasks", "_update_stats", "rebuild_stats", "longest_streak", "compact"),
+    MemoryStorage: ("load_habits", "load_streaks", "load_task_values", "load_tasks", "get_habit_by_id",
+                    "get_user_id", "save_habit", "update_habit", "delete_habit", "delete_tasks", "save_tasks",
+                    "save_task_rows", "rebuild_stats", "longest_streak", "compact"),
+    LogStorage: ("_replay", "_commit", "_rewrite"),
+    Analytics: ("streak_state", "day_streak_state", "update_streak", "batch_streaks", "get_longest_streak",
+                "get_longest_streak_in_storage", "get_longest_streak_for_habit"),
+}
+
+_originals = {}  # (class, method name) -> the attribute as it was before wrapping, None if inherited
+_timings = {}  # name -> [calls, total seconds, max seconds, rows]
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(_originals)
+
+
+def enable():
+    """
+    Starts timing the INSTRUMENTED methods and every SQL statement Storage runs.
+    """
+    with _lock:
+        if _originals:
+            return
+        for owner, names in INSTRUMENTED.items():
+            for name in names:
+                _wrap(owner, name, _timed(f"{owner.__name__}.{name}", getattr(owner, name)))
+        _wrap(Storage, "_retry", _timed_statement(Storage._retry))
+
+
+def disable():
+    """
+    Puts the original methods back. Collected timings are kept until reset().
+    """
+    with _lock:
+        for (owner, name), original in _originals.items():
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        _originals.clear()
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+
+
+def _wrap(owner, name, wrapper):
+    original = inspect.getattr_static(owner, name)
+    _originals[(owner, name)] = original if name in vars(owner) else None
+    setattr(owner, name, staticmethod(wrapper) if isinstance(original, staticmethod) else wrapper)
+
+
+def _record(name, seconds, rows):
+    with _lock:
+        entry = _timings.get(name)
+        if entry is None:
+            entry = _timings[name] = [0, 0.0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        entry[3] += rows
+
+
+def _timed(name, function):
+    """
+    Wraps a function to record its call count, time and (for list results) rows.
+    """
+    def timed(*args, **kwargs):
+        started = perf_counter()
+        result = function(*args, **kwargs)
+        _record(name, perf_counter() - started, len(result) if isinstance(result, list) else 0)
+        return result
+    return timed
+
+
+def _timed_statement(retry):
+    """
+    Wraps Storage._retry, through which every statement runs, to time each SQL
+    statement (keyed by its first words) and count the rows it changed.
+    """
+    def timed(operation, *args):
+        started = perf_counter()
+        result = retry(operation, *args)
+        if args and isinstance(args[0], str):
+            rows = getattr(result, "rowcount", -1)
+            _record("SQL " + _statement_key(args[0]), perf_counter() - started, max(rows, 0))
+        return result
+    return timed
+
+
+def _statement_key(sql):
+    return re.sub(r"\s+", " ", sql).strip()[:60]
+
+
+def gauges(user=None):
+    """
+    Returns object counts and memory figures for the habits of user (if given) and the process.
+    """
+    values = {}
+    if user is not None:
+        habits = list(user.habits.values())
+        values["habits"] = len(habits)
+        values["habits_with_tasks_loaded"] = sum(habit.tasks_loaded for habit in habits)
+        values["tasks_loaded"] = sum(habit.task_count for habit in habits)
+        values["habit_memory_bytes"] = sum(habit.memory_usage() for habit in habits)
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        values["max_rss_kb"] = max_rss // 1024 if sys.platform == "darwin" else max_rss
+    return values
+
+
+def snapshot(user=None):
+    """
+    Returns the collected timings (slowest in total first) and the gauges as a JSON-ready dict.
+    """
+    with _lock:
+        timings = sorted(_timings.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "enabled": enabled(),
+            "timings": {name: {"calls": calls, "total_ms": round(total * 1000, 3),
+                               "mean_ms": round(total * 1000 / calls, 4), "max_ms": round(longest * 1000, 3),
+                               "rows": rows}
+                        for name, (calls, total, longest, rows) in timings},
+            "gauges": gauges(user),
+        }
+
+
+def dump(out, user=None):
+    """
+    Writes the snapshot as JSON to a path or a text file object.
+    """
+    if isinstance(out, str):
+        with open(out, "w", encoding="utf-8") as file:
+            json.dump(snapshot(user), file, indent=2)
+    else:
+        json.dump(snapshot(user), out, indent=2)
+
+
+def report(user=None, limit=20):
+    """
+    Returns the snapshot as lines of text for the CLI.
+    """
+    data = snapshot(user)
+    lines = [f"{'Operation':<62} {'Calls':>8} {'Total ms':>10} {'Mean ms':>9} {'Max ms':>9} {'Rows':>9}"]
+    for name, t in list(data["timings"].items())[:limit]:
+        lines.append(f"{name:<62} {t['calls']:>8} {t['total_ms']:>10.2f} {t['mean_ms']:>9.3f} "
+                     f"{t['max_ms']:>9.2f} {t['rows']:>9}")
+    if not data["timings"]:
+        lines.append("(nothing recorded yet)")
+    lines.extend(f"{name}: {value}" for name, value in data["gauges"].items())
+    return lines
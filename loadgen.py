@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import date, timedelta
+from server import DEFAULT_HOST, DEFAULT_PORT
+
+
+class Connection:
+    """
+    One keep-alive HTTP/1.1 connection to the habit service.
+    """
+
+    def __init__(self, reader, writer, host):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, host)
+
+    async def request(self, method, path, payload=None):
+        """
+        Sends a request and returns (status, decoded JSON body).
+        """
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head[:-4].decode("latin-1").split("\r\n")
+        length = 0
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return int(status_line.split(" ", 2)[1]), json.loads(data)
+
+    def close(self):
+        self.writer.close()
+
+
+async def run(host=DEFAULT_HOST, port=DEFAULT_PORT, connections=32, requests=20000, habits=100,
+              write_ratio=0.1, seed=0):
+    """
+    Creates `habits` habits, then sends `requests` requests over `connections`
+    concurrent connections: completions with probability write_ratio, otherwise an
+    even mix of "longest streak" and "list by periodicity". Returns a summary dict.
+    """
+    rng = random.Random(seed)
+    setup = await Connection.open(host, port)
+    habit_ids = []
+    for i in range(habits):
+        status, habit = await setup.request("POST", "/habits",
+                                            {"name": f"Load {i}", "periodicity": ("Daily", "Weekly", "Monthly")[i % 3]})
+        if status != 201:
+            raise RuntimeError(f"Creating a habit failed with {status}: {habit}")
+        habit_ids.append(habit["id"])
+    setup.close()
+
+    plan = []
+    start_day = date(2024, 1, 1)
+    for _ in range(requests):
+        if rng.random() < write_ratio:
+            day = start_day + timedelta(days=rng.randrange(730))
+            plan.append(("POST", f"/habits/{rng.choice(habit_ids)}/complete", {"date": day.isoformat()}))
+        elif rng.random() < 0.5:
+            plan.append(("GET", "/streaks/longest", None))
+        else:
+            plan.append(("GET", f"/habits?periodicity={rng.choice(('Daily', 'Weekly', 'Monthly'))}", None))
+
+    latencies = []
+    errors = 0
+
+    async def worker(share):
+        nonlocal errors
+        connection = await Connection.open(host, port)
+        try:
+            for method, path, payload in share:
+                sent = time.perf_counter()
+                status, _ = await connection.request(method, path, payload)
+                latencies.append(time.perf_counter() - sent)
+                if status >= 400:
+                    errors += 1
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(plan[i::connections]) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate load against a locally running habit service (server.py).")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--habits", type=int, default=100, help="habits to create before the run")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of requests that complete a task")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args.host, args.port, args.connections, args.requests,
+                                     args.habits, args.write_ratio, args.seed))))
+
+
+if __name__ == "__main__":
+    main()
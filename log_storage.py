@@ -0,0 +1,219 @@
+import mmap
+import os
+import struct
+from habit import from_micros, to_micros
+from memory_storage import CLEAR_TASKS, DELETE_HABIT, HABIT, TASK, USER, MemoryStorage
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; the log is then not locked against other processes
+    fcntl = None
+
+DEFAULT_LOG_PATH = "habits.log"
+LOG_MAGIC = b"HABITLOG"
+LOG_FORMAT = 1  # raised whenever the record layout below changes
+COMPACT_MIN_RECORDS = 100_000  # logs with fewer records are never compacted automatically...
+COMPACT_RATIO = 2.0  # ...nor while they hold fewer than this many records per live one
+
+# The file starts with the magic, the format and the generation before its first commit,
+# followed by records (little-endian, each starting with its type) in commits: the
+# records of one batch and a COMMIT byte. Replaying stops at the last complete commit.
+_HEADER = struct.Struct("<8sIq")
+_USER = struct.Struct("<BqH")  # user ID, name length; the UTF-8 name follows
+_HABIT = struct.Struct("<BqqqHH")  # habit ID, user ID (-1: none), created_at, name and periodicity lengths
+_DELETE = struct.Struct("<Bq")  # habit ID, for DELETE_HABIT and CLEAR_TASKS
+_TASK = struct.Struct("<BqiBq")  # habit ID, day, flags (_COMPLETE, _STAMPED), completed_at
+COMMIT = 0
+_COMPLETE, _STAMPED = 1, 2
+
+
+def _encode(record):
+    kind = record[0]
+    if kind == TASK:
+        _, habit_id, day, is_complete, completed_at = record
+        flags = (_COMPLETE if is_complete else 0) | (_STAMPED if completed_at is not None else 0)
+        return _TASK.pack(TASK, habit_id, day, flags, completed_at or 0)
+    if kind == USER:
+        name = record[2].encode()
+        return _USER.pack(USER, record[1], len(name)) + name
+    if kind == HABIT:
+        _, habit_id, name, periodicity, created_at, user_id = record
+        name, periodicity = name.encode(), periodicity.encode()
+        return _HABIT.pack(HABIT, habit_id, -1 if user_id is None else user_id, to_micros(created_at),
+                           len(name), len(periodicity)) + name + periodicity
+    return _DELETE.pack(kind, record[1])
+
+
+def _decode(data, offset):
+    """
+    Returns the record at offset (None for COMMIT) and the offset after it.
+    """
+    kind = data[offset]
+    if kind == COMMIT:
+        return None, offset + 1
+    if kind == TASK:
+        _, habit_id, day, flags, completed_at = _TASK.unpack_from(data, offset)
+        return (TASK, habit_id, day, flags & _COMPLETE, completed_at if flags & _STAMPED else None), \
+            offset + _TASK.size
+    if kind == USER:
+        _, user_id, size = _USER.unpack_from(data, offset)
+        offset += _USER.size
+        return (USER, user_id, _text(data, offset, size)), offset + size
+    if kind == HABIT:
+        _, habit_id, user_id, created_at, name_size, periodicity_size = _HABIT.unpack_from(data, offset)
+        offset += _HABIT.size
+        name, periodicity = _text(data, offset, name_size), _text(data, offset + name_size, periodicity_size)
+        return (HABIT, habit_id, name, periodicity, from_micros(created_at), None if user_id < 0 else user_id), \
+            offset + name_size + periodicity_size
+    if kind in (DELETE_HABIT, CLEAR_TASKS):
+        return (kind, _DELETE.unpack_from(data, offset)[1]), offset + _DELETE.size
+    raise ValueError(f"Unknown record type {kind}.")
+
+
+def _text(data, offset, size):
+    if offset + size > len(data):
+        raise ValueError("Record runs past the end of the log.")
+    return data[offset:offset + size].decode()
+
+
+class LogStorage(MemoryStorage):
+    """
+    A StorageBackend for write-heavy use: the data is held in memory (see
+    MemoryStorage) and every committed batch is appended to a binary log file, so a
+    completion costs one small sequential write rather than a database transaction.
+    Opening the log memory-maps it and replays it; a commit cut short by a crash is
+    dropped. Once the log holds far more records than the live data needs (see
+    COMPACT_RATIO), it is rewritten with only the live data; compact() does so at once.
+
+    Writes survive the process crashing; with fsync=True each commit is also flushed
+    to disk, to survive power loss. Only one process may have a log open at a time.
+    """
+
+    def __init__(self, path=DEFAULT_LOG_PATH, fsync=False):
+        super().__init__()
+        self.db_path = path
+        self.fsync = fsync
+        self._file = open(path, "a+b")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise RuntimeError(f"{path} is in use by another process.") from None
+            self._replay()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _replay(self):
+        """
+        Loads the log into memory, truncating any incomplete commit at its end.
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.write(_HEADER.pack(LOG_MAGIC, LOG_FORMAT, 0))
+            self._file.flush()
+            self._size, self._log_records = _HEADER.size, 0
+            return
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                magic, version, generation = _HEADER.unpack_from(data, 0)
+            except struct.error:
+                magic = version = generation = None
+            if magic != LOG_MAGIC or version != LOG_FORMAT:
+                raise ValueError(f"{self.db_path} is not a habit log of format {LOG_FORMAT}.")
+            offset = committed = _HEADER.size
+            records, pending = 0, []
+            try:
+                while offset < size:
+                    record, offset = _decode(data, offset)
+                    if record is not None:
+                        pending.append(record)
+                        continue
+                    for record in pending:
+                        self._apply(record)
+                    records += len(pending)
+                    generation += 1
+                    committed, pending = offset, []
+            except (ValueError, struct.error, IndexError):
+                pass  # a commit cut short; everything before it is kept
+        if committed < size:
+            self._file.truncate(committed)
+        self._generation, self._size, self._log_records = generation, committed, records
+
+    def _commit(self, records):
+        data = b"".join(map(_encode, records)) + bytes((COMMIT,))
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except BaseException:
+            self._file.truncate(self._size)
+            raise
+        self._size += len(data)
+        self._log_records += len(records)
+
+    def _after_commit(self):
+        """
+        Rewrites the log once it is mostly dead records. This is best-effort: the
+        commit is already in the log, so a failed rewrite leaves the log as it was.
+        """
+        if self._log_records > COMPACT_MIN_RECORDS and self._log_records > COMPACT_RATIO * self._live_records():
+            try:
+                self._rewrite(self._generation)
+            except OSError:
+                pass
+
+    def _live_records(self):
+        return len(self._users) + len(self._habits) + self._task_count
+
+    def _rewrite(self, generation):
+        """
+        Replaces the log with one holding only the live data, as a single commit
+        replaying to the given generation. The new log is written aside and moved into
+        place.
+        """
+        records = [(USER, user_id, name) for name, user_id in self._users.items()]
+        records += [(HABIT, habit_id, *stored) for habit_id, stored in self._habits.items()]
+        records += [(TASK, habit_id, day, *value)
+                    for habit_id, days in self._tasks.items() for day, value in days.items()]
+        data = (_HEADER.pack(LOG_MAGIC, LOG_FORMAT, generation - 1)
+                + b"".join(map(_encode, records)) + bytes((COMMIT,)))
+        partial = f"{self.db_path}.tmp"
+        try:
+            with open(partial, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            replaced = open(partial, "a+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(replaced, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.replace(partial, self.db_path)
+            except BaseException:
+                replaced.close()
+                raise
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        self._file.close()
+        self._file = replaced
+        self._size, self._log_records = len(data), len(records)
+
+    def compact(self):
+        """
+        Drops tasks of habits that no longer exist and rewrites the log with only the
+        live data. Returns the number of tasks removed.
+        """
+        with self.lock:
+            removed = super().compact()
+            self._rewrite(self._generation)
+            return removed
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self._file.close()
+            super().close()
@@ -1,120 +1,397 @@
-import sys
-from datetime import datetime
-from user import User
-from analytics import Analytics
-
-class CLI:
-    """
-    Command-line interface for interacting with the habit tracker.
-    """
-
-    def __init__(self):
-        self.user = User("John Doe")
-
-    def display_menu(self):
-        """
-        Displays the main menu options.
-        """
-        print("\nHabit Tracker Menu")
-        print("1. Create Habit")
-        print("2. Edit Habit")
-        print("3. Delete Habit")
-        print("4. Complete Task")
-        print("5. List Habits")
-        print("6. Get Current Longest Streak")
-        print("7. List Habits by Periodicity")
-        print("8. Exit")
-
-    def get_input(self):
-        return input("Select an option: ")
-
-    def display_message(self, msg):
-        print(msg)
-
-    def display_habits(self, habits):
-        """
-        Nicely prints out the user's habits and their details.
-        """
-        if not habits:
-            print("No habits found.")
-            return
-        for habit in habits:
-            current_streak, max_streak = Analytics.update_streak(habit.get_tasks(), habit.periodicity)
-            print(f"ID {habit.id}: {habit.name} - {habit.periodicity}, Created: {habit.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"  Current Streak: {current_streak}, Max Streak: {max_streak}")
-            for task in habit.get_tasks():
-                status = "Completed" if task.is_complete else "Pending"
-                completed_at = task.completed_at.strftime('%Y-%m-%d %H:%M:%S') if task.completed_at else "N/A"
-                print(f"    Task: {task.date.strftime('%Y-%m-%d')}, Status: {status}, Completed At: {completed_at}")
-
-    def handle_user_selection(self, sel):
-        """
-        Handles user selection from the menu.
-        """
-        if sel == "1":
-            name = input("Enter habit name: ")
-            periodicity = {"1": "Daily", "2": "Weekly", "3": "Monthly"}.get(
-                input("Select periodicity (1. Daily, 2. Weekly, 3. Monthly): "), "Daily")
-            self.user.create_habit(name, periodicity)
-            self.display_message("Habit created.")
-
-        elif sel == "2":
-            try:
-                habit_id = int(input("Enter habit ID to edit: "))
-                new_name = input("Enter new name for the habit: ")
-                new_periodicity = {"1": "Daily", "2": "Weekly", "3": "Monthly"}.get(
-                    input("Enter new periodicity (1. Daily, 2. Weekly, 3. Monthly): "), "Daily")
-                self.user.edit_habit(habit_id, new_name, new_periodicity)
-                self.display_message("Habit updated and progress reset.")
-            except ValueError:
-                self.display_message("Invalid input.")
-
-        elif sel == "3":
-            try:
-                habit_id = int(input("Enter habit ID to delete: "))
-                self.user.delete_habit(habit_id)
-                self.display_message("Habit deleted.")
-            except ValueError:
-                self.display_message("Invalid habit ID.")
-
-        elif sel == "4":
-            try:
-                habit_id = int(input("Enter habit ID to complete task for: "))
-                date_str = input("Enter date (YYYY-MM-DD): ")
-                date = datetime.strptime(date_str, "%Y-%m-%d")
-                self.user.complete_task(habit_id, date)
-                self.display_message("Task completed.")
-            except ValueError:
-                self.display_message("Invalid input.")
-
-        elif sel == "5":
-            habits = self.user.list_habits()
-            self.display_habits(habits)
-
-        elif sel == "6":
-            habits = self.user.list_habits()
-            if habits:
-                name, longest = Analytics.get_longest_streak(habits)
-                self.display_message(f"Longest streak: {longest} periods (Habit: {name})")
-            else:
-                self.display_message("No habits found.")
-
-        elif sel == "7":
-            periodicity = {"1": "Daily", "2": "Weekly", "3": "Monthly"}.get(
-                input("Select periodicity (1. Daily, 2. Weekly, 3. Monthly): "), "Daily")
-            filtered = self.user.list_habits_by_periodicity(periodicity)
-            self.display_habits(filtered)
-
-        elif sel == "8":
-            self.display_message("Exiting...")
-            sys.exit()
-
-        else:
-            self.display_message("Invalid selection.")
-
-if __name__ == "__main__":
-    cli = CLI()
-    while True:
-        cli.display_menu()
-        option = cli.get_input()
-        cli.handle_user_selection(option)
+import argparse
+import atexit
+import json
+import sqlite3
+import sys
+import instrumentation
+from contextlib import nullcontext
+from datetime import datetime
+from user import User
+from analytics import Analytics
+from storage import BACKENDS, DEFAULT_BACKEND, DEFAULT_DB_PATH, DEFAULT_LOG_PATH, DEFAULT_USER_NAME, open_storage, \
+    shared_storage
+from transfer import PERIODICITIES
+
+LEADERBOARD_SIZE = 10  # habits listed per ranking in the streak leaderboard
+PAGE_SIZE = 20  # habits listed per page by "List Habits"
+LAST_TASKS = 10  # tasks listed per habit by "List Habits" unless a date range is chosen
+OUTPUT_CHUNK = 500  # lines collected before they are written out in one go
+SCRIPT_OPS = ("create", "complete", "edit", "delete", "report")  # commands of a --script file
+
+class CLI:
+    """
+    Command-line interface for interacting with the habit tracker.
+    """
+
+    def __init__(self, user=None, page_size=PAGE_SIZE, last_tasks=LAST_TASKS):
+        self.user = user or User(DEFAULT_USER_NAME)
+        self.page_size = page_size
+        self.last_tasks = last_tasks
+
+    def display_menu(self):
+        """
+        Displays the main menu options.
+        """
+        print("\nHabit Tracker Menu")
+        print("1. Create Habit")
+        print("2. Edit Habit")
+        print("3. Delete Habit")
+        print("4. Complete Task")
+        print("5. List Habits")
+        print("6. Get Current Longest Streak")
+        print("7. List Habits by Periodicity")
+        print("8. Exit")
+        print("9. Performance Stats")
+        print("10. Streak Leaderboard")
+        print("11. Due Habits")
+
+    def get_input(self):
+        return input("Select an option: ")
+
+    def display_message(self, msg):
+        print(msg)
+
+    def display_habits(self, habits, page_size=None, last=None, start=None, end=None, out=None):
+        """
+        Nicely prints out the user's habits and their details.
+
+        Lists every task of each habit, only its last `last` tasks, or only those
+        from start to end (both days included, either may be None). With a
+        page_size, habits are shown that many at a time, asking before each next
+        page. Lines are written to out (stdout by default) in chunks of
+        OUTPUT_CHUNK rather than one print() each.
+        """
+        out = out or sys.stdout
+        if not habits:
+            out.write("No habits found.\n")
+            return
+        lines = []
+        page_size = page_size or len(habits)
+        for first in range(0, len(habits), page_size):
+            page = habits[first:first + page_size]
+            if first and input(f"-- {first} of {len(habits)} habits shown; Enter for more, q to stop: ") == "q":
+                return
+            for habit, (current_streak, max_streak) in zip(page, Analytics.batch_streaks(page)):
+                lines.append(f"ID {habit.id}: {habit.name} - {habit.periodicity}, "
+                             f"Created: {habit.created_at.isoformat(' ', 'seconds')}")
+                lines.append(f"  Current Streak: {current_streak}, Max Streak: {max_streak}")
+                if start is not None or end is not None:
+                    tasks = habit.tasks_between(start or datetime.min, end or datetime.max)
+                elif last is not None:
+                    tasks = habit.last_tasks(last)
+                else:
+                    tasks = habit.get_tasks()
+                for task in tasks:
+                    lines.append(f"    Task: {task.date.date().isoformat()}, "
+                                 f"Status: {'Completed' if task.is_complete else 'Pending'}, Completed At: "
+                                 f"{task.completed_at.isoformat(' ', 'seconds') if task.completed_at else 'N/A'}")
+                if len(lines) >= OUTPUT_CHUNK:
+                    out.write("\n".join(lines) + "\n")
+                    lines.clear()
+            if lines:
+                out.write("\n".join(lines) + "\n")
+                lines.clear()
+            out.flush()
+
+    def display_due(self, day=None, out=None):
+        """
+        Prints the habits due on day (today by default) from the user's scheduler:
+        overdue ones, those whose streak is at risk, and the rest.
+        """
+        out = out or sys.stdout
+        day = day or datetime.now().date()
+        due = self.user.scheduler.due(day)
+        if not due:
+            out.write(f"Nothing due on {day.isoformat()}.\n")
+            return
+        groups = {"Overdue": [], "At risk": [], "Due": []}
+        for habit, start, deadline, streak, _ in due:
+            if deadline < day:
+                groups["Overdue"].append(f"  ID {habit.id}: {habit.name} ({habit.periodicity}), "
+                                         f"due since {start.isoformat()}")
+            else:
+                group = groups["At risk" if streak else "Due"]
+                group.append(f"  ID {habit.id}: {habit.name} ({habit.periodicity}), by {deadline.isoformat()}"
+                             + (f", keeps a {streak}-period streak" if streak else ""))
+        lines = []
+        for title, group in groups.items():
+            if group:
+                lines.append(f"{title} ({len(group)}):")
+                lines.extend(group)
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+
+    def ask_task_window(self):
+        """
+        Asks which tasks "List Habits" shows; returns display_habits keyword arguments.
+        """
+        answer = input(f"Tasks to show (Enter: last {self.last_tasks}, a: all, "
+                       f"or a range YYYY-MM-DD YYYY-MM-DD): ").split()
+        if not answer:
+            return {"last": self.last_tasks}
+        if answer == ["a"]:
+            return {}
+        if len(answer) == 2:
+            try:
+                return {"start": datetime.strptime(answer[0], "%Y-%m-%d"),
+                        "end": datetime.strptime(answer[1], "%Y-%m-%d")}
+            except ValueError:
+                pass
+        self.display_message(f"Invalid range; showing the last {self.last_tasks} tasks.")
+        return {"last": self.last_tasks}
+
+    def handle_user_selection(self, sel):
+        """
+        Handles user selection from the menu.
+        """
+        if sel == "1":
+            name = input("Enter habit name: ")
+            periodicity = {"1": "Daily", "2": "Weekly", "3": "Monthly"}.get(
+                input("Select periodicity (1. Daily, 2. Weekly, 3. Monthly): "), "Daily")
+            self.user.create_habit(name, periodicity)
+            self.display_message("Habit created.")
+
+        elif sel == "2":
+            try:
+                habit_id = int(input("Enter habit ID to edit: "))
+                new_name = input("Enter new name for the habit: ")
+                new_periodicity = {"1": "Daily", "2": "Weekly", "3": "Monthly"}.get(
+                    input("Enter new periodicity (1. Daily, 2. Weekly, 3. Monthly): "), "Daily")
+                self.user.edit_habit(habit_id, new_name, new_periodicity)
+                self.display_message("Habit updated and progress reset.")
+            except ValueError:
+                self.display_message("Invalid input.")
+
+        elif sel == "3":
+            try:
+                habit_id = int(input("Enter habit ID to delete: "))
+                self.user.delete_habit(habit_id)
+                self.display_message("Habit deleted.")
+            except ValueError:
+                self.display_message("Invalid habit ID.")
+
+        elif sel == "4":
+            try:
+                habit_id = int(input("Enter habit ID to complete task for: "))
+                date_str = input("Enter date (YYYY-MM-DD): ")
+                date = datetime.strptime(date_str, "%Y-%m-%d")
+                self.user.complete_task(habit_id, date)
+                self.display_message("Task completed.")
+            except ValueError:
+                self.display_message("Invalid input.")
+
+        elif sel == "5":
+            habits = self.user.list_habits()
+            self.display_habits(habits, self.page_size, **self.ask_task_window())
+
+        elif sel == "6":
+            habits = self.user.list_habits()
+            if habits:
+                name, longest = Analytics.get_longest_streak_in_storage(self.user.storage, self.user.id)
+                self.display_message(f"Longest streak: {longest} periods (Habit: {name})")
+            else:
+                self.display_message("No habits found.")
+
+        elif sel == "7":
+            periodicity = {"1": "Daily", "2": "Weekly", "3": "Monthly"}.get(
+                input("Select periodicity (1. Daily, 2. Weekly, 3. Monthly): "), "Daily")
+            filtered = self.user.list_habits_by_periodicity(periodicity)
+            self.display_habits(filtered, self.page_size, last=self.last_tasks)
+
+        elif sel == "8":
+            self.display_message("Exiting...")
+            sys.exit()
+
+        elif sel == "9":
+            if instrumentation.enabled():
+                self.display_message("\n".join(instrumentation.report(self.user)))
+            else:
+                instrumentation.enable()
+                self.display_message("Instrumentation enabled; choose 9 again later to see where time went.")
+
+        elif sel == "10":
+            by = "current" if input("Rank by (1. Max Streak, 2. Current Streak): ") == "2" else "max"
+            boards = Analytics.leaderboard(self.user.list_habits(), LEADERBOARD_SIZE, by)
+            if not boards["All"]:
+                self.display_message("No habits found.")
+            else:
+                lines = []
+                for title, board in boards.items():
+                    if board:
+                        lines.append(f"\nTop {by} streaks - {title}")
+                    for rank, (habit, streak) in enumerate(board, 1):
+                        lines.append(f"{rank:>3}. {habit.name} (ID {habit.id}, {habit.periodicity}): {streak}")
+                self.display_message("\n".join(lines))
+
+        elif sel == "11":
+            self.display_due()
+
+        else:
+            self.display_message("Invalid selection.")
+
+def run_script(user, source, out):
+    """
+    Runs JSONL commands (one {"op": ..., ...} object per line, see SCRIPT_OPS and the
+    README) from a text file object against user, all in one transaction, and writes
+    one JSON result per command to out, in chunks of OUTPUT_CHUNK lines. A command
+    that fails is reported and skipped; the others still run. A last line sums up.
+
+    Task writes are queued until the transaction ends, so habit_stats is brought up to
+    date once, and streaks are only computed when a report asks for them. If the
+    transaction itself fails, nothing is saved: the summary says so and the error is
+    raised. Returns (commands, failed).
+    """
+    commands = failed = 0
+    lines = []
+    summary = {"done": True, "commands": 0, "failed": 0, "committed": False}
+    try:
+        with user.storage.batch():
+            for number, text in enumerate(source, 1):
+                if not text.strip():
+                    continue
+                commands += 1
+                result = {"line": number}
+                try:
+                    command = json.loads(text)
+                    if not isinstance(command, dict):
+                        raise ValueError("A command must be a JSON object.")
+                    result["op"] = command.get("op")
+                    result.update(_script_command(user, command))
+                    result["ok"] = True
+                except ValueError as e:
+                    failed += 1
+                    result["ok"] = False
+                    result["error"] = str(e)
+                lines.append(json.dumps(result))
+                if len(lines) >= OUTPUT_CHUNK:
+                    out.write("\n".join(lines) + "\n")
+                    lines.clear()
+        summary["committed"] = True
+    except Exception as e:
+        summary["error"] = str(e)
+        raise
+    finally:
+        summary.update(commands=commands, failed=failed)
+        lines.append(json.dumps(summary))
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+    return commands, failed
+
+
+def _script_command(user, command):
+    """
+    Runs one script command; returns the fields of its result. Raises ValueError
+    when the command is invalid, before anything is written.
+    """
+    op = command.get("op")
+    if op == "create":
+        habit = user.create_habit(_script_name(command), _script_periodicity(command))
+        return {"habit_id": habit.id}
+    if op == "complete":
+        habit_id = _script_habit_id(user, command)
+        date = command.get("date")
+        try:
+            day = datetime.fromisoformat(date)
+        except (TypeError, ValueError):
+            raise ValueError("date must be given as YYYY-MM-DD.") from None
+        user.complete_task(habit_id, day)
+        return {"habit_id": habit_id, "date": day.date().isoformat()}
+    if op == "edit":
+        habit_id = _script_habit_id(user, command)
+        user.edit_habit(habit_id, _script_name(command), _script_periodicity(command))
+        return {"habit_id": habit_id}
+    if op == "delete":
+        habit_id = _script_habit_id(user, command)
+        user.delete_habit(habit_id)
+        return {"habit_id": habit_id}
+    if op == "report":
+        habits = [user.habits[_script_habit_id(user, command)]] if "habit_id" in command else user.list_habits()
+        return {"habits": [{"id": habit.id, "name": habit.name, "periodicity": habit.periodicity,
+                            "current_streak": current, "max_streak": longest}
+                           for habit, (current, longest) in zip(habits, Analytics.batch_streaks(habits))]}
+    raise ValueError(f"op must be one of {', '.join(SCRIPT_OPS)}.")
+
+
+def _script_habit_id(user, command):
+    habit_id = command.get("habit_id")
+    if type(habit_id) is not int or habit_id not in user.habits:
+        raise ValueError(f"Habit {habit_id} not found.")
+    return habit_id
+
+
+def _script_name(command):
+    name = command.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("A non-empty name is required.")
+    return name
+
+
+def _script_periodicity(command):
+    periodicity = command.get("periodicity")
+    if periodicity not in PERIODICITIES:
+        raise ValueError(f"periodicity must be one of {', '.join(PERIODICITIES)}.")
+    return periodicity
+
+
+def _open(path, mode, standard_stream):
+    if path == "-":
+        return nullcontext(standard_stream)
+    return open(path, mode, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Habit tracker CLI")
+    parser.add_argument("--user", default=DEFAULT_USER_NAME, help="name of the user to track habits for")
+    parser.add_argument("--db", help=f"database file (default: {DEFAULT_DB_PATH}, "
+                                     f"{DEFAULT_LOG_PATH} for the log backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="storage engine")
+    parser.add_argument("--compact", action="store_true",
+                        help="remove tasks and stats of deleted habits, vacuum the database and exit")
+    parser.add_argument("--rebuild-stats", action="store_true",
+                        help="recompute the stored streaks of every habit from its tasks and exit")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="habits listed per page (0 lists all at once)")
+    parser.add_argument("--last-tasks", type=int, default=LAST_TASKS,
+                        help="tasks listed per habit unless a date range is chosen")
+    parser.add_argument("--script", metavar="PATH",
+                        help="run the JSONL commands in PATH (- for stdin) in one transaction and exit")
+    parser.add_argument("--results", metavar="PATH", default="-",
+                        help="where --script writes its JSONL results (default: stdout)")
+    parser.add_argument("--due", action="store_true",
+                        help="list the habits due today (overdue, streak at risk, due) and exit")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="load habits from the database only, without reading or writing the startup snapshot")
+    parser.add_argument("--stats", action="store_true", help="time database and analytics calls from the start")
+    parser.add_argument("--stats-dump", metavar="PATH", help="write the collected stats as JSON to PATH on exit")
+    args = parser.parse_args()
+    if args.stats or args.stats_dump:
+        instrumentation.enable()
+    if args.compact:
+        removed = open_storage(args.db, args.backend).compact()
+        print(f"Compaction complete: removed {removed} tasks.")
+        sys.exit()
+    if args.rebuild_stats:
+        rebuilt = open_storage(args.db, args.backend).rebuild_stats()
+        print(f"Streaks rebuilt for {rebuilt} habits.")
+        sys.exit()
+
+    cli = CLI(User(args.user, storage=shared_storage(args.db, args.backend), snapshot=not args.no_snapshot),
+              args.page_size, args.last_tasks)
+    atexit.register(cli.user.save_snapshot)
+    if args.stats_dump:
+        atexit.register(instrumentation.dump, args.stats_dump, cli.user)
+    if args.due:
+        cli.display_due()
+        sys.exit()
+    if args.script:
+        try:
+            with _open(args.script, "r", sys.stdin) as source, _open(args.results, "w", sys.stdout) as out:
+                commands, failed = run_script(cli.user, source, out)
+        except (sqlite3.Error, OSError) as e:
+            sys.exit(f"Script failed, nothing was saved: {e}")
+        print(f"Ran {commands} commands, {failed} failed.", file=sys.stderr)
+        sys.exit(1 if failed else 0)
+    while True:
+        cli.display_menu()
+        option = cli.get_input()
+        cli.handle_user_selection(option)
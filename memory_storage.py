@@ -0,0 +1,332 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from analytics import Analytics, period_ordinal
+from backend import StorageBackend, parse_task_row
+from habit import Habit, from_micros, to_micros
+
+MEMORY_FORMAT = 1  # first element of data_state()
+
+# Records: every change to the data is one of these tuples, applied by _apply. LogStorage
+# appends the same records to its file. DROP_USER and DROP_TASK only undo other records.
+USER = 1  # (USER, user_id, name)
+HABIT = 2  # (HABIT, habit_id, name, periodicity, created_at, user_id): inserts or replaces
+DELETE_HABIT = 3  # (DELETE_HABIT, habit_id): the habit and its tasks
+TASK = 4  # (TASK, habit_id, day, is_complete, completed_at): the task's new stored values
+CLEAR_TASKS = 5  # (CLEAR_TASKS, habit_id)
+DROP_USER = 6  # (DROP_USER, name)
+DROP_TASK = 7  # (DROP_TASK, habit_id, day)
+
+
+class MemoryStorage(StorageBackend):
+    """
+    A StorageBackend keeping everything in dictionaries, for tests and benchmarks:
+    nothing is written anywhere and the data is gone when the object is.
+
+    Each change is applied as a record (see USER and the constants after it). A batch
+    keeps the records that undo its changes, and applies them in reverse if the batch
+    raises; writes outside a batch are a batch of their own. Streaks are computed from
+    the tasks when first asked for and then advanced as completions arrive, as Habit
+    does. All operations hold lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.closed = False
+        self._users = {}  # name -> user ID
+        self._habits = {}  # habit ID -> (name, periodicity, created_at, user_id)
+        self._tasks = {}  # habit ID -> {day ordinal: (is_complete, completed_at)}
+        self._task_count = 0
+        self._streaks = {}  # habit ID -> ((last_period, current, max), latest day), when known
+        self._generation = 0
+        self._batch_depth = 0
+        self._undo = []  # records undoing the running batch's changes
+        self._records = []  # the running batch's records
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self._users, self._habits, self._tasks, self._streaks = {}, {}, {}, {}
+            self._task_count = 0
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups every write made inside the block into one transaction, undone if the
+        block raises. Nested batches join the outer one.
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Cannot operate on a closed storage.")
+            self._batch_depth += 1
+            committed = False
+            try:
+                yield self
+                if self._batch_depth == 1 and self._records:
+                    self._commit(self._records)
+                    self._generation += 1
+                    committed = True
+            except BaseException:
+                if self._batch_depth == 1:
+                    for record in reversed(self._undo):
+                        self._apply(record)
+                    self._streaks.clear()
+                raise
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._undo, self._records = [], []
+            if committed:
+                self._after_commit()
+
+    def in_batch(self) -> bool:
+        """
+        Returns whether the calling thread, which holds lock, is inside batch().
+        """
+        return self._batch_depth > 0
+
+    def _commit(self, records):
+        """
+        Called with a batch's records when it ends without error, before it counts as
+        committed; raising undoes the batch. Backends that persist records do it here.
+        """
+
+    def _after_commit(self):
+        """
+        Called once a batch has committed, for upkeep that must not undo it.
+        """
+
+    def _write(self, record):
+        """
+        Applies a record as part of the running batch (or a batch of its own).
+        """
+        with self.batch():
+            self._undo.extend(self._apply(record))
+            self._records.append(record)
+
+    def _apply(self, record):
+        """
+        Applies one record to the data. Returns the records that undo it.
+        """
+        kind, key = record[0], record[1]
+        if kind == USER:
+            self._users[record[2]] = key
+            return [(DROP_USER, record[2])]
+        if kind == DROP_USER:
+            del self._users[key]
+            return []
+        if kind == HABIT:
+            previous = self._habits.get(key)
+            self._habits[key] = record[2:]
+            if previous is None or previous[1] != record[3]:
+                self._streaks.pop(key, None)
+            return [(DELETE_HABIT, key) if previous is None else (HABIT, key, *previous)]
+        if kind == DELETE_HABIT:
+            undo = self._apply((CLEAR_TASKS, key))
+            previous = self._habits.pop(key, None)
+            if previous is not None:
+                undo.append((HABIT, key, *previous))
+            return undo
+        if kind == TASK:
+            days = self._tasks.setdefault(key, {})
+            day, value = record[2], record[3:]
+            previous = days.get(day)
+            days[day] = value
+            if previous is None:
+                self._task_count += 1
+            if value[0] and not (previous and previous[0]):
+                self._advance_streak(key, day)
+            elif previous and previous[0] and not value[0]:
+                self._streaks.pop(key, None)
+            return [(DROP_TASK, key, day) if previous is None else (TASK, key, day, *previous)]
+        if kind == DROP_TASK:
+            del self._tasks[key][record[2]]
+            self._task_count -= 1
+            self._streaks.pop(key, None)
+            return []
+        if kind == CLEAR_TASKS:
+            days = self._tasks.pop(key, {})
+            self._task_count -= len(days)
+            self._streaks.pop(key, None)
+            return [(TASK, key, day, *value) for day, value in days.items()]
+        raise ValueError(f"Unknown record type {kind}.")
+
+    def _advance_streak(self, habit_id, day):
+        """
+        Moves a habit's known streak state forward by a completed day after its latest
+        one; any other completion makes it unknown, to be computed again.
+        """
+        known = self._streaks.get(habit_id)
+        habit = self._habits.get(habit_id)
+        if known is None or habit is None:
+            return
+        state, latest = known
+        if latest is not None and day <= latest:
+            del self._streaks[habit_id]
+        else:
+            self._streaks[habit_id] = (Analytics.period_step(state, period_ordinal(day, habit[1])), day)
+
+    def _streak_state(self, habit_id):
+        """
+        Returns the ((last_period, current, max), latest day) of a habit, computing it if needed.
+        """
+        known = self._streaks.get(habit_id)
+        if known is None:
+            days = sorted(day for day, (is_complete, _) in self._tasks.get(habit_id, {}).items() if is_complete)
+            known = self._streaks[habit_id] = (Analytics.day_streak_state(days, self._habits[habit_id][1]),
+                                               days[-1] if days else None)
+        return known
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError("Cannot operate on a closed storage.")
+
+    def get_user_id(self, name):
+        with self.lock:
+            self._check_open()
+            if name not in self._users:
+                self._write((USER, max(self._users.values(), default=0) + 1, name))
+            return self._users[name]
+
+    def save_habit(self, habit: Habit, user_id=None):
+        with self.lock:
+            self._check_open()
+            if habit.id is None:
+                habit.id = self.max_habit_id() + 1
+            elif habit.id in self._habits:
+                raise ValueError(f"Habit {habit.id} already exists.")
+            self._write((HABIT, habit.id, habit.name, habit.periodicity, habit.created_at, user_id))
+
+    def update_habit(self, habit: Habit):
+        with self.lock:
+            self._check_open()
+            stored = self._habits.get(habit.id)
+            if stored is not None:
+                self._write((HABIT, habit.id, habit.name, habit.periodicity, stored[2], stored[3]))
+
+    def delete_habit(self, habit_id):
+        with self.lock:
+            self._check_open()
+            if habit_id in self._habits or habit_id in self._tasks:
+                self._write((DELETE_HABIT, habit_id))
+
+    def delete_tasks(self, habit_id):
+        with self.lock:
+            self._check_open()
+            if habit_id in self._tasks:
+                self._write((CLEAR_TASKS, habit_id))
+
+    def save_tasks(self, habit_id, tasks):
+        self._save_values((habit_id, task.date.toordinal(), int(bool(task.is_complete)),
+                           to_micros(task.completed_at, None)) for task in tasks)
+
+    def save_task_rows(self, rows):
+        self._save_values(parse_task_row(*row) for row in rows)
+
+    def _save_values(self, values):
+        """
+        Saves (habit_id, day, is_complete, completed_at) values: a day saved again stays
+        complete if either save was, taking the completion time of a completing save.
+        """
+        with self.batch():
+            for habit_id, day, is_complete, completed_at in values:
+                if not is_complete and day in self._tasks.get(habit_id, ()):
+                    continue
+                self._write((TASK, habit_id, day, is_complete, completed_at))
+
+    def _habit(self, habit_id, with_tasks):
+        name, periodicity, created_at, _ = self._habits[habit_id]
+        habit = Habit(habit_id, name, periodicity, created_at)
+        if with_tasks:
+            for day, (is_complete, completed_at) in sorted(self._tasks.get(habit_id, {}).items()):
+                habit.add_task_row(day, is_complete, completed_at)
+        habit.set_streak_state(*self._streak_state(habit_id))
+        return habit
+
+    def _habit_ids(self, user_id):
+        return sorted(habit_id for habit_id, stored in self._habits.items()
+                      if user_id is None or stored[3] == user_id)
+
+    def load_habits(self, with_tasks=True, user_id=None):
+        with self.lock:
+            self._check_open()
+            return [self._habit(habit_id, with_tasks) for habit_id in self._habit_ids(user_id)]
+
+    def get_habit_by_id(self, habit_id):
+        with self.lock:
+            self._check_open()
+            return self._habit(habit_id, True) if habit_id in self._habits else None
+
+    def load_task_values(self, habit_id):
+        with self.lock:
+            self._check_open()
+            return [(day, is_complete, completed_at)
+                    for day, (is_complete, completed_at) in sorted(self._tasks.get(habit_id, {}).items())]
+
+    def load_streaks(self, user_id=None):
+        with self.lock:
+            self._check_open()
+            streaks = []
+            for habit_id in self._habit_ids(user_id):
+                (_, current, longest), _ = self._streak_state(habit_id)
+                name, periodicity, _, _ = self._habits[habit_id]
+                streaks.append((habit_id, name, periodicity, current, longest))
+            return streaks
+
+    def longest_streak(self, user_id=None):
+        best = (None, 0)
+        for _, name, _, _, longest in self.load_streaks(user_id):
+            if best[0] is None or longest > best[1]:
+                best = (name, longest)
+        return best
+
+    def max_habit_id(self):
+        with self.lock:
+            return max(self._habits, default=0)
+
+    def iter_history(self, chunk_size=10000, user_id=None):
+        with self.lock:
+            self._check_open()
+            habit_ids = self._habit_ids(user_id)
+        for habit_id in habit_ids:
+            with self.lock:
+                if habit_id not in self._habits:
+                    continue
+                name, periodicity, created_at, _ = self._habits[habit_id]
+                tasks = sorted(self._tasks.get(habit_id, {}).items())
+            habit = (habit_id, name, periodicity, created_at.isoformat())
+            if not tasks:
+                yield (*habit, None, None, None)
+            for day, (is_complete, completed_at) in tasks:
+                completed_at = from_micros(completed_at)
+                yield (*habit, datetime.fromordinal(day).isoformat(), is_complete,
+                       completed_at.isoformat() if completed_at else None)
+
+    def data_state(self, user_id=None):
+        with self.lock:
+            if user_id is None:
+                return (MEMORY_FORMAT, self._generation, len(self._habits), self._task_count)
+            habit_ids = self._habit_ids(user_id)
+            return (MEMORY_FORMAT, self._generation, len(habit_ids),
+                    sum(len(self._tasks.get(habit_id, ())) for habit_id in habit_ids))
+
+    def compact(self):
+        """
+        Drops tasks of habits that no longer exist. Returns the number removed.
+        """
+        with self.lock:
+            self._check_open()
+            if self._batch_depth:
+                raise RuntimeError("compact() cannot run inside batch().")
+            orphans = [habit_id for habit_id in self._tasks if habit_id not in self._habits]
+            removed = sum(len(self._tasks[habit_id]) for habit_id in orphans)
+            with self.batch():
+                for habit_id in orphans:
+                    self._write((CLEAR_TASKS, habit_id))
+            return removed
+
+    def rebuild_stats(self):
+        with self.lock:
+            self._check_open()
+            self._streaks.clear()
+            return len(self._habits)
@@ -0,0 +1,139 @@
+import heapq
+from datetime import date
+from itertools import count
+from analytics import period_end, period_ordinal, period_start
+
+# Heap entry fields: [due day, habit ID, sequence number, deadline day, running streak,
+# habit, owner]. The sequence number keeps entries of one habit and day from being
+# compared further; the habit is None once the entry is dead (replaced or removed).
+_DUE, _ID, _SEQUENCE, _DEADLINE, _STREAK, _HABIT, _OWNER = range(7)
+
+
+class Scheduler:
+    """
+    Keeps habits in a min-heap keyed by the first day of their next due period: the
+    period after the last one completed, or the period the habit was created in while
+    it has no completions. A habit is due from that day until it is completed again,
+    overdue once that period has ended (its streak is broken), and at risk while the
+    period is still running and completing it would extend a streak.
+
+    update() and remove() take O(log n): a changed habit gets a new entry and its old
+    one is marked dead and skipped, and the heap is rebuilt without dead entries once
+    they outnumber the live ones. Queries walk only the due part of the heap, so they
+    cost O(k log k) for k due habits instead of a scan of every habit. One scheduler
+    can hold the habits of many users; each habit keeps the owner it was added with.
+    Callers serialize access (User holds user.habits_lock).
+    """
+
+    def __init__(self, habits=(), owner=None):
+        self._heap = []
+        self._entries = {}  # habit ID -> its live heap entry
+        self._dead = 0
+        self._sequence = count()
+        self.add_all(habits, owner)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, habit, owner):
+        (last_period, current, _), _ = habit.streak_state()
+        if last_period is None:
+            period, streak = period_ordinal(habit.created_at.toordinal(), habit.periodicity), 0
+        else:
+            period, streak = last_period + 1, current
+        return [period_start(period, habit.periodicity), habit.id, next(self._sequence),
+                period_end(period, habit.periodicity), streak, habit, owner]
+
+    def _kill(self, habit_id):
+        entry = self._entries.pop(habit_id, None)
+        if entry is not None:
+            entry[_HABIT] = None
+            self._dead += 1
+
+    def add_all(self, habits, owner=None):
+        """
+        Adds (or updates) many habits at once, rebuilding the heap in O(n).
+        """
+        for habit in habits:
+            self._kill(habit.id)
+            self._entries[habit.id] = entry = self._entry(habit, owner)
+            self._heap.append(entry)
+        self._heap = [entry for entry in self._heap if entry[_HABIT] is not None]
+        self._dead = 0
+        heapq.heapify(self._heap)
+
+    def update(self, habit, owner=None):
+        """
+        Schedules a habit after it was created, completed or edited. Without an owner,
+        the habit keeps the one it had.
+        """
+        previous = self._entries.get(habit.id)
+        if owner is None and previous is not None:
+            owner = previous[_OWNER]
+        self._kill(habit.id)
+        self._entries[habit.id] = entry = self._entry(habit, owner)
+        heapq.heappush(self._heap, entry)
+        self._prune()
+
+    def remove(self, habit_id):
+        """
+        Stops scheduling a habit (e.g. when it is deleted).
+        """
+        self._kill(habit_id)
+        self._prune()
+
+    def _prune(self):
+        if self._dead > len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[_HABIT] is not None]
+            self._dead = 0
+            heapq.heapify(self._heap)
+
+    def _due_entries(self, day):
+        """
+        Returns the live entries due on or before a day ordinal, by due day and habit
+        ID. Entries due that early form a subtree at the top of the heap; only that
+        subtree (and the dead entries in it) is visited.
+        """
+        heap, found = self._heap, []
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            entry = heap[i]
+            if entry[_DUE] > day:
+                continue
+            if entry[_HABIT] is not None:
+                found.append(entry)
+            stack.extend(child for child in (2 * i + 1, 2 * i + 2) if child < len(heap))
+        found.sort()
+        return found
+
+    @staticmethod
+    def _row(entry):
+        return (entry[_HABIT], date.fromordinal(entry[_DUE]), date.fromordinal(entry[_DEADLINE]),
+                entry[_STREAK], entry[_OWNER])
+
+    def due(self, day=None) -> list:
+        """
+        Returns (habit, due date, deadline, running streak, owner) for every habit due
+        on day (today by default), overdue ones included, by due date and habit ID.
+        """
+        day = (day or date.today()).toordinal()
+        return [self._row(entry) for entry in self._due_entries(day)]
+
+    def overdue(self, day=None) -> list:
+        """
+        Returns the due() rows of habits whose due period ended before day.
+        """
+        day = (day or date.today()).toordinal()
+        return [self._row(entry) for entry in self._due_entries(day) if entry[_DEADLINE] < day]
+
+    def at_risk(self, day=None, within=None) -> list:
+        """
+        Returns the due() rows of habits whose running streak breaks unless they are
+        completed before their current period ends; given within, only those whose
+        period ends at most that many days after day.
+        """
+        day = (day or date.today()).toordinal()
+        last = None if within is None else day + within
+        return [self._row(entry) for entry in self._due_entries(day)
+                if entry[_STREAK] and entry[_DEADLINE] >= day and (last is None or entry[_DEADLINE] <= last)]
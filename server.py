@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+from analytics import Analytics
+from storage import BACKENDS, DEFAULT_BACKEND, DEFAULT_DB_PATH, DEFAULT_LOG_PATH, DEFAULT_USER_NAME, shared_storage
+from transfer import PERIODICITIES
+from user import User
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+MAX_BODY = 1 << 20  # largest request body accepted, in bytes
+MAX_WINDOW_DAYS = 10 * 366  # longest analytics window accepted, in days
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """
+    An error answered with the given HTTP status and {"error": message}.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HabitService:
+    """
+    Serves the operations of the CLI menu as a local HTTP/JSON service:
+
+        GET    /habits[?periodicity=Weekly]  list habits with their streaks
+        POST   /habits                       create {"name": ..., "periodicity": ...}
+        PUT    /habits/<id>                  edit {"name": ..., "periodicity": ...}; resets progress
+        DELETE /habits/<id>                  delete
+        POST   /habits/<id>/complete         complete {"date": "YYYY-MM-DD"}
+        GET    /habits/<id>/rates            completion rates over the last ?windows=7,30,365
+                                             days and per weekday over the longest one
+        GET    /habits/<id>/heatmap          calendar weeks of the last ?days=365 days
+        GET    /streaks/longest              habit with the longest streak
+
+    Connections are kept alive, so a client can send many requests over one socket.
+    Calls that touch the database run in a thread pool of at most `workers` threads.
+    Listings and the longest streak are answered on the event loop itself, from the
+    habits' cached streaks, whenever every streak is cached and no other thread is
+    changing the habits; otherwise they go through the pool too. Reads go through
+    User.read, so they do not wait for a storage batch to end.
+    """
+
+    def __init__(self, user: User, workers=4):
+        self.user = user
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="habit-service")
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Starts listening and returns the asyncio server.
+        """
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def handle(self, method, target, body=b""):
+        """
+        Answers one request. Returns (status, JSON-serializable payload).
+        """
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+
+        if parts == ["habits"]:
+            if method == "GET":
+                periodicity = query.get("periodicity", [None])[0]
+                if periodicity is not None:
+                    periodicity = _periodicity(periodicity)
+                return 200, await self._read(self._list_habits, periodicity)
+            if method == "POST":
+                data = _json(body)
+                return 201, await self._write(self._create_habit, _name(data), _periodicity(data.get("periodicity")))
+            raise HTTPError(405, f"{method} is not allowed on /habits.")
+
+        if len(parts) in (2, 3) and parts[0] == "habits":
+            habit_id = _habit_id(parts[1])
+            if len(parts) == 2 and method == "PUT":
+                data = _json(body)
+                return 200, await self._write(self._edit_habit, habit_id, _name(data),
+                                              _periodicity(data.get("periodicity")))
+            if len(parts) == 2 and method == "DELETE":
+                return 200, await self._write(self._delete_habit, habit_id)
+            if parts[2:] == ["complete"] and method == "POST":
+                data = _json(body)
+                try:
+                    date = datetime.strptime(str(data.get("date")), "%Y-%m-%d")
+                except ValueError:
+                    raise HTTPError(400, "date must be given as YYYY-MM-DD.") from None
+                return 200, await self._write(self._complete_task, habit_id, date)
+            if parts[2:] == ["rates"] and method == "GET":
+                windows = _positive_ints(query.get("windows", ["7,30,365"])[0], "windows")
+                return 200, await self._write(self._read_habit, self._rates, habit_id, windows, _end(query))
+            if parts[2:] == ["heatmap"] and method == "GET":
+                days = _positive_ints(query.get("days", ["365"])[0], "days")[0]
+                return 200, await self._write(self._read_habit, self._heatmap, habit_id, days, _end(query))
+            if len(parts) == 2 or parts[2] in ("complete", "rates", "heatmap"):
+                raise HTTPError(405, f"{method} is not allowed on {url.path}.")
+
+        if parts == ["streaks", "longest"]:
+            if method != "GET":
+                raise HTTPError(405, f"{method} is not allowed on {url.path}.")
+            return 200, await self._read(self._longest_streak)
+
+        raise HTTPError(404, f"No such resource: {url.path}")
+
+    async def _read(self, operation, *args):
+        """
+        Runs a read on the event loop when it can be answered from cached streaks,
+        and in the thread pool otherwise. Neither waits for a write in progress.
+        """
+        if self.user.habits_lock.acquire(blocking=False):
+            try:
+                if not any(habit.streaks_stale for habit in self.user.habits.values()):
+                    return operation(*args)
+            finally:
+                self.user.habits_lock.release()
+        return await self._write(self.user.read, operation, *args)
+
+    async def _write(self, operation, *args):
+        """
+        Runs a blocking operation in the thread pool.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(operation, *args))
+
+    def _read_habit(self, operation, habit_id, *args):
+        return self.user.read(operation, habit_id, *args, habit_ids=(habit_id,))
+
+    def _list_habits(self, periodicity=None):
+        if periodicity is None:
+            habits = self.user.list_habits()
+        else:
+            habits = self.user.list_habits_by_periodicity(periodicity)
+        return [_habit_json(habit, streaks) for habit, streaks in zip(habits, Analytics.batch_streaks(habits))]
+
+    def _longest_streak(self):
+        name, longest = Analytics.get_longest_streak(self.user.list_habits())
+        return {"name": name, "streak": longest}
+
+    def _habit(self, habit_id):
+        habit = self.user.habits.get(habit_id)
+        if habit is None:
+            raise HTTPError(404, f"Habit {habit_id} not found.")
+        return habit
+
+    def _rates(self, habit_id, windows, end):
+        habit = self._habit(habit_id)
+        longest = max(windows)
+        weekdays = Analytics.weekday_breakdown(habit, end - timedelta(days=longest - 1), end)
+        return {"id": habit_id,
+                "rates": {str(days): rate for days, rate in Analytics.completion_rates(habit, windows, end).items()},
+                "weekdays": {name: {"completed": done, "days": days}
+                             for name, (done, days) in zip(WEEKDAYS, weekdays)}}
+
+    def _heatmap(self, habit_id, days, end):
+        weeks = Analytics.heatmap(self._habit(habit_id), end - timedelta(days=days - 1), end)
+        return {"id": habit_id, "weeks": [{"monday": monday.date().isoformat(), "days": cells}
+                                          for monday, cells in weeks]}
+
+    def _create_habit(self, name, periodicity):
+        habit = self.user.create_habit(name, periodicity)
+        return _habit_json(habit, habit.get_streaks())
+
+    def _edit_habit(self, habit_id, name, periodicity):
+        try:
+            self.user.edit_habit(habit_id, name, periodicity)
+        except ValueError:
+            raise HTTPError(404, f"Habit {habit_id} not found.") from None
+        habit = self.user.habits[habit_id]
+        return _habit_json(habit, habit.get_streaks())
+
+    def _delete_habit(self, habit_id):
+        with self.user.lock:
+            if habit_id not in self.user.habits:
+                raise HTTPError(404, f"Habit {habit_id} not found.")
+            self.user.delete_habit(habit_id)
+        return {"deleted": habit_id}
+
+    def _complete_task(self, habit_id, date):
+        try:
+            self.user.complete_task(habit_id, date)
+        except ValueError:
+            raise HTTPError(404, f"Habit {habit_id} not found.") from None
+        habit = self.user.habits[habit_id]
+        return _habit_json(habit, habit.get_streaks())
+
+    async def _respond(self, method, target, body):
+        try:
+            return await self.handle(method, target, body)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:  # keep serving; report the failure to this client only
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def _serve_connection(self, reader, writer):
+        """
+        Reads HTTP/1.1 requests from one connection and answers them in order.
+        """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head[:-4].decode("latin-1").split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    self._send(writer, 400, {"error": "Malformed request."}, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    self._send(writer, 413, {"error": "Request body too large."}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, payload = await self._respond(method, target, body)
+                self._send(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _send(writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n")
+        if not keep_alive:
+            head += "Connection: close\r\n"
+        writer.write(head.encode() + b"\r\n" + data)
+
+
+def _habit_json(habit, streaks):
+    return {"id": habit.id, "name": habit.name, "periodicity": habit.periodicity,
+            "created_at": habit.created_at.isoformat(),
+            "current_streak": streaks[0], "max_streak": streaks[1]}
+
+
+def _json(body):
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "The request body is not valid JSON.") from None
+    if not isinstance(data, dict):
+        raise HTTPError(400, "The request body must be a JSON object.")
+    return data
+
+
+def _name(data):
+    name = data.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise HTTPError(400, "A non-empty name is required.")
+    return name
+
+
+def _periodicity(value):
+    periodicity = str(value or "").capitalize()
+    if periodicity not in PERIODICITIES:
+        raise HTTPError(400, f"periodicity must be one of {', '.join(PERIODICITIES)}.")
+    return periodicity
+
+
+def _positive_ints(text, name):
+    try:
+        values = [int(part) for part in text.split(",")]
+    except ValueError:
+        values = []
+    if not values or min(values) < 1 or max(values) > MAX_WINDOW_DAYS:
+        raise HTTPError(400, f"{name} must be comma-separated numbers of days from 1 to {MAX_WINDOW_DAYS}.")
+    return values
+
+
+def _end(query):
+    """
+    Returns the last day of an analytics window: ?end=YYYY-MM-DD, or today.
+    """
+    if "end" not in query:
+        return datetime.now()
+    try:
+        return datetime.strptime(query["end"][0], "%Y-%m-%d")
+    except ValueError:
+        raise HTTPError(400, "end must be given as YYYY-MM-DD.") from None
+
+
+def _habit_id(text):
+    try:
+        return int(text)
+    except ValueError:
+        raise HTTPError(404, f"No such habit: {text}") from None
+
+
+async def _serve_forever(service, host, port):
+    server = await service.start(host, port)
+    print(f"Serving habits of {service.user.name} on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the habit tracker as a local HTTP/JSON service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--user", default=DEFAULT_USER_NAME, help="name of the user whose habits are served")
+    parser.add_argument("--db", help=f"database file (default: {DEFAULT_DB_PATH}, "
+                                     f"{DEFAULT_LOG_PATH} for the log backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="storage engine")
+    parser.add_argument("--workers", type=int, default=4, help="threads for blocking database calls")
+    args = parser.parse_args(argv)
+
+    service = HabitService(User(args.user, storage=shared_storage(args.db, args.backend)), args.workers)
+    try:
+        asyncio.run(_serve_forever(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from habit import Habit, from_micros, to_micros
+
+SNAPSHOT_MAGIC = b"HABITSNP"
+SNAPSHOT_FORMAT = 1  # raised whenever the layout below changes; older files are then ignored
+
+# File header: magic, format, user ID, the database's data_state() when written
+# for the user (schema version, write generation, habit and completion counts) and the
+# number of habits.
+_HEADER = struct.Struct("<8sIqqqqqI")
+# Per habit: ID, created_at (to_micros), flags (_LAST_PERIOD, _LATEST: which are set), last
+# period, current streak, max streak, latest completed day, then the byte lengths of its
+# name and periodicity and the lengths of its task arrays. The name and periodicity
+# (UTF-8) and the days, timestamps and done arrays (little-endian) follow.
+_HABIT = struct.Struct("<qqBxxxxxxxqqqqIIIiI")
+_LAST_PERIOD, _LATEST = 1, 2
+
+
+def snapshot_path(db_path, user_id):
+    """
+    Returns the snapshot file of a user's habits next to a database file, or None
+    for in-memory databases, which do not outlive the process.
+    """
+    if db_path in (":memory:", ""):
+        return None
+    return f"{db_path}.user{user_id}.snapshot"
+
+
+def _little_endian(values):
+    """
+    Returns the bytes of an array in little-endian order, whatever the platform's.
+    """
+    if sys.byteorder == "little":
+        return values.tobytes()
+    values = array(values.typecode, values)
+    values.byteswap()
+    return values.tobytes()
+
+
+def _native(typecode, data):
+    """
+    Copies little-endian data into an array of the platform's byte order.
+    """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot of one user's habits: each habit's row, its cached streak
+    state and its tasks in the compact arrays Habit keeps them in. Opening one reads
+    only the header and the habit records; task arrays stay in the mapped file until
+    a habit's tasks are needed, and are then copied in whole (see load_tasks).
+
+    A snapshot is only used while the database's data_state() matches the one it was
+    written at, so it never shows anything the database does not hold.
+    """
+
+    def __init__(self, file, mapped, user_id, habits, tasks):
+        self._file = file
+        self._mapped = mapped
+        self.user_id = user_id
+        self.habits = habits  # Habit objects, tasks not loaded
+        self._tasks = tasks  # habit id -> offsets of its not yet loaded task arrays
+        if not tasks:
+            self.close()
+
+    @classmethod
+    def open(cls, path, storage, user_id):
+        """
+        Maps the snapshot at path and returns it if it belongs to user_id and matches
+        the database; returns None if it is missing, stale or unreadable.
+        """
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            file = open(path, "rb")
+        except OSError:
+            return None
+        mapped = None
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, owner, *state, count = _HEADER.unpack_from(mapped, 0)
+            if (magic, version, owner) == (SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, user_id) \
+                    and tuple(state) == storage.data_state(user_id):
+                habits, tasks = cls._read_habits(mapped, count)
+                return cls(file, mapped, user_id, habits, tasks)
+        except (OSError, ValueError, struct.error):  # e.g. an empty or truncated file
+            pass
+        if mapped is not None:
+            mapped.close()
+        file.close()
+        return None
+
+    @staticmethod
+    def _read_habits(mapped, count):
+        """
+        Builds the habits of a mapped snapshot, recording where each one's task arrays are.
+        """
+        habits, tasks = [], {}
+        offset = _HEADER.size
+        for _ in range(count):
+            (habit_id, created_at, flags, last_period, current, longest, latest,
+             name_size, periodicity_size, days, base, done) = _HABIT.unpack_from(mapped, offset)
+            offset += _HABIT.size
+            name = mapped[offset:offset + name_size].decode()
+            offset += name_size
+            periodicity = mapped[offset:offset + periodicity_size].decode()
+            offset += periodicity_size
+            habit = Habit(habit_id, name, periodicity, from_micros(created_at))
+            habit.set_streak_state((last_period if flags & _LAST_PERIOD else None, current, longest),
+                                   latest if flags & _LATEST else None)
+            habits.append(habit)
+            tasks[habit_id] = (offset, days, base, done)
+            offset += 12 * days + done
+        if offset != len(mapped):
+            raise ValueError("Snapshot has trailing or missing data.")
+        return habits, tasks
+
+    def load_tasks(self, habit) -> bool:
+        """
+        Fills in the tasks of an unloaded habit from the snapshot. Each habit's tasks
+        are handed out once: after that the database is the only source, since the
+        habit may have changed since. Returns False when there is nothing left for it.
+        """
+        entry = self._tasks.pop(habit.id, None)
+        if entry is None:
+            return False
+        offset, days, base, done = entry
+        stamps, bitmap = offset + 4 * days, offset + 12 * days
+        with memoryview(self._mapped) as view:
+            habit.load_task_arrays(_native("i", view[offset:stamps]), _native("q", view[stamps:bitmap]),
+                                   bytearray(view[bitmap:bitmap + done]), base)
+        if not self._tasks:
+            self.close()
+        return True
+
+    def close(self):
+        self._tasks.clear()
+        self._mapped.close()
+        self._file.close()
+
+
+def save_snapshot(storage, user_id, path):
+    """
+    Writes a snapshot of user_id's habits, read afresh from storage, to path unless
+    the snapshot there is still current. The file is written aside and moved into
+    place, and is discarded if the database changed while it was read. Returns
+    whether a snapshot was written.
+    """
+    if path is None:
+        return False
+    state = storage.data_state(user_id)
+    try:
+        with open(path, "rb") as file:
+            magic, version, owner, *written, _ = _HEADER.unpack(file.read(_HEADER.size))
+        if (magic, version, owner) == (SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, user_id) and tuple(written) == state:
+            return False
+    except (OSError, struct.error):
+        pass
+    habits = storage.load_habits(with_tasks=True, user_id=user_id)
+    chunks = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, user_id, *state, len(habits))]
+    for habit in habits:
+        (last_period, current, longest), latest = habit.streak_state()
+        days, timestamps, done, base = habit.task_arrays()
+        name, periodicity = habit.name.encode(), habit.periodicity.encode()
+        flags = (_LAST_PERIOD if last_period is not None else 0) | (_LATEST if latest is not None else 0)
+        chunks.append(_HABIT.pack(habit.id, to_micros(habit.created_at), flags, last_period or 0, current,
+                                  longest, latest or 0, len(name), len(periodicity), len(days), base, len(done)))
+        chunks += [name, periodicity, _little_endian(days), _little_endian(timestamps), bytes(done)]
+    if storage.data_state(user_id) != state:
+        return False
+    partial = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(partial, "wb") as file:
+            file.write(b"".join(chunks))
+        os.replace(partial, path)
+    except OSError:
+        if os.path.exists(partial):
+            os.remove(partial)
+        return False
+    return True
@@ -1,121 +1,784 @@
-import sqlite3
-from datetime import datetime
-from habit import Habit, Task
-
-class Storage:
-    """
-    Handles all database operations using SQLite for habits and their tasks.
-    """
-
-    def __init__(self):
-        """
-        Initializes the database connection and sets up the tables.
-        """
-        self.conn = sqlite3.connect("habits.db")
-        self.cursor = self.conn.cursor()
-        self.setup()
-
-    def setup(self):
-        """
-        Creates the 'habits' and 'tasks' tables in the database if they don't exist.
-        """
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS habits (
-                id INTEGER PRIMARY KEY,
-                name TEXT,
-                periodicity TEXT,
-                created_at TEXT
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY,
-                habit_id INTEGER,
-                date TEXT,
-                is_complete INTEGER,
-                completed_at TEXT,
-                FOREIGN KEY(habit_id) REFERENCES habits(id)
-            )
-        ''')
-        self.conn.commit()
-
-    def save_habit(self, habit: Habit):
-        """
-        Saves a new habit into the database.
-        """
-        self.cursor.execute(
-            'INSERT INTO habits (id, name, periodicity, created_at) VALUES (?, ?, ?, ?)',
-            (habit.id, habit.name, habit.periodicity, habit.created_at.isoformat())
-        )
-        self.conn.commit()
-
-    def update_habit(self, habit: Habit):
-        """
-        Updates the name and periodicity of an existing habit.
-        """
-        self.cursor.execute(
-            'UPDATE habits SET name = ?, periodicity = ? WHERE id = ?',
-            (habit.name, habit.periodicity, habit.id)
-        )
-        self.conn.commit()
-
-    def get_habit_by_id(self, habit_id):
-        """
-        Retrieves a habit by its ID.
-        """
-        self.cursor.execute('SELECT * FROM habits WHERE id = ?', (habit_id,))
-        row = self.cursor.fetchone()
-        if row:
-            habit = Habit(row[0], row[1], row[2], datetime.fromisoformat(row[3]))
-            habit.tasks = self.load_tasks(habit.id)
-            return habit
-        return None
-
-    def load_habits(self):
-        """
-        Loads all habits from the database.
-        """
-        self.cursor.execute('SELECT * FROM habits')
-        rows = self.cursor.fetchall()
-        habits = []
-        for row in rows:
-            habit = Habit(row[0], row[1], row[2], datetime.fromisoformat(row[3]))
-            habit.tasks = self.load_tasks(habit.id)
-            habits.append(habit)
-        return habits
-
-    def delete_habit(self, habit_id):
-        """
-        Deletes a habit and all its tasks.
-        """
-        self.cursor.execute('DELETE FROM habits WHERE id = ?', (habit_id,))
-        self.cursor.execute('DELETE FROM tasks WHERE habit_id = ?', (habit_id,))
-        self.conn.commit()
-
-    def delete_tasks(self, habit_id):
-        """
-        Deletes all tasks for a specific habit.
-        """
-        self.cursor.execute('DELETE FROM tasks WHERE habit_id = ?', (habit_id,))
-        self.conn.commit()
-
-    def save_task(self, habit_id, task: Task):
-        """
-        Saves a completed task into the database.
-        """
-        self.cursor.execute(
-            'INSERT INTO tasks (habit_id, date, is_complete, completed_at) VALUES (?, ?, ?, ?)',
-            (habit_id, task.date.isoformat(), int(task.is_complete), task.completed_at.isoformat())
-        )
-        self.conn.commit()
-
-    def load_tasks(self, habit_id):
-        """
-        Loads all tasks for a specific habit.
-        """
-        self.cursor.execute('SELECT * FROM tasks WHERE habit_id = ?', (habit_id,))
-        rows = self.cursor.fetchall()
-        return [
-            Task(datetime.fromisoformat(row[2]), bool(row[3]), datetime.fromisoformat(row[4]) if row[4] else None)
-            for row in rows
-        ]
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby
+from analytics import Analytics, period_ordinal
+from backend import StorageBackend, parse_task_row
+from habit import Habit, from_micros, to_micros
+from log_storage import DEFAULT_LOG_PATH, LogStorage
+from memory_storage import MemoryStorage
+
+DEFAULT_DB_PATH = "habits.db"
+DEFAULT_USER_NAME = "John Doe"  # owner of the habits saved before storage was split per user
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+# Storage engines open_storage can pick: SQLite (Storage), everything in memory
+# (MemoryStorage) and an append-only completion log (LogStorage)
+BACKENDS = ("sqlite", "memory", "log")
+DEFAULT_BACKEND = "sqlite"
+# PRAGMA user_version; 1: task dates are whole days at midnight, 2: habit_stats is
+# maintained, 3: tasks are stored as integer day ordinals with their week and month,
+# 4: meta holds the write generation (see Storage.data_state)
+SCHEMA_VERSION = 4
+BUSY_RETRIES = 5  # retries of a statement that failed because the database was busy or locked
+BUSY_BACKOFF = 0.01  # seconds before the first retry, doubled for every further one
+
+# Streaks computed in SQL, mirroring Analytics.update_streak: the distinct periods (day,
+# week or month, precomputed per task) with a completion are numbered in order, and
+# consecutive periods share the same period - ROW_NUMBER(), which makes them one run
+# (gaps-and-islands). The current streak is the latest run, the max streak the longest.
+STREAKS_QUERY = '''
+    WITH periods AS (
+        SELECT DISTINCT t.habit_id,
+               CASE h.periodicity WHEN 'Weekly' THEN t.week WHEN 'Monthly' THEN t.month ELSE t.day END AS period
+        FROM tasks t
+        JOIN habits h ON h.id = t.habit_id
+        WHERE t.is_complete {user_filter}
+    ),
+    runs AS (
+        SELECT habit_id, COUNT(*) AS length, MAX(period) AS last_period
+        FROM (SELECT habit_id, period,
+                     period - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY period) AS run
+              FROM periods)
+        GROUP BY habit_id, run
+    ),
+    streaks AS (
+        SELECT habit_id, length AS current_streak,
+               MAX(length) OVER (PARTITION BY habit_id) AS max_streak,
+               ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY last_period DESC) AS latest
+        FROM runs
+    )
+    SELECT h.id, h.name, h.periodicity,
+           COALESCE(s.current_streak, 0), COALESCE(s.max_streak, 0)
+    FROM habits h
+    LEFT JOIN streaks s ON s.habit_id = h.id AND s.latest = 1
+    WHERE 1 {user_filter}
+    ORDER BY h.id
+'''
+
+_shared = {}  # (backend, path) -> storage
+_shared_lock = threading.Lock()
+
+
+def open_storage(path=None, backend=DEFAULT_BACKEND):
+    """
+    Opens the named backend (see BACKENDS) on path, or on the backend's default file
+    when path is None. The memory backend ignores the path.
+    """
+    if backend == "sqlite":
+        return Storage(DEFAULT_DB_PATH if path is None else path)
+    if backend == "log":
+        return LogStorage(DEFAULT_LOG_PATH if path is None else path)
+    if backend == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend {backend!r}; expected one of {', '.join(BACKENDS)}.")
+
+
+def shared_storage(db_path=None, backend=DEFAULT_BACKEND):
+    """
+    Returns the storage for a database file, opening it on first use (see
+    open_storage). Every User of the same file shares one storage instead of opening
+    their own connections.
+    """
+    if db_path is None:
+        db_path = DEFAULT_LOG_PATH if backend == "log" else DEFAULT_DB_PATH
+    key = (backend, db_path)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = open_storage(db_path, backend)
+        return _shared[key]
+
+
+class Storage(StorageBackend):
+    """
+    Handles all database operations using SQLite for habits and their tasks: the
+    default StorageBackend.
+
+    Habits belong to users (habits.user_id); methods that read many habits take
+    an optional user_id and, when given, only touch that user's rows.
+
+    Every write commits on its own unless it runs inside batch(), which groups
+    all writes into one transaction and queues task inserts for a single
+    executemany() when the batch ends.
+
+    A Storage can be shared between threads. Writes go through one connection
+    (conn), one thread at a time: every write holds lock, and a batch holds it until
+    the batch ends. Users of the storage lock the same lock (see User), so the two
+    can never be locked in opposite orders. Reads use
+    a connection per thread, so they run in parallel with each other and with the
+    writer; with journal_mode="WAL" they are not blocked by writes at all. Reads made
+    inside the calling thread's own batch use the writer connection, so they see the
+    batch's writes. An in-memory database only exists in one connection, so all of
+    its reads and writes share conn. Statements that fail because another connection
+    holds the database are retried BUSY_RETRIES times with exponential backoff.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, journal_mode=None, synchronous=None, timeout=5.0):
+        """
+        Initializes the database connection and sets up the tables.
+        journal_mode (e.g. "WAL") and synchronous (e.g. "NORMAL") are applied as
+        PRAGMAs when given; otherwise SQLite's defaults are kept. timeout is how long
+        SQLite itself waits for a lock before a statement fails and is retried.
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self.conn = self._connect()
+        self.cursor = self.conn.cursor()  # the writer's cursor; only used while holding lock
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()  # separate from lock, which a batch may hold for long
+        self.closed = False
+        self._single_connection = db_path in (":memory:", "")
+        self._batch_depth = 0
+        self._batch_thread = None
+        self._pending_tasks = []
+        self._committed_changes = 0  # conn.total_changes as of the last commit
+        if journal_mode is not None:
+            self.cursor.execute(f'PRAGMA journal_mode = {self._pragma_value(journal_mode, JOURNAL_MODES)}')
+        if synchronous is not None:
+            self.cursor.execute(f'PRAGMA synchronous = {self._pragma_value(synchronous, SYNCHRONOUS_LEVELS)}')
+        self.setup()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+
+    def close(self):
+        """
+        Closes the writer connection and the read connections of every thread.
+        """
+        with self.lock, self._readers_lock:
+            self.closed = True
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            self._local = threading.local()
+            self.conn.close()
+
+    @staticmethod
+    def _retry(operation, *args):
+        """
+        Runs operation(*args), retrying with exponential backoff while it fails
+        because another connection has the database busy or locked ("database is
+        locked" / "database table is locked").
+        """
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return operation(*args)
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or "locked" not in str(e):
+                    raise
+                time.sleep(BUSY_BACKOFF * 2 ** attempt)
+
+    @contextmanager
+    def _writing(self):
+        """
+        Holds the writer connection for one write and yields its cursor. The write is
+        committed at the end of the block (or rolled back if it raises) unless a batch
+        is collecting writes.
+        """
+        with self.lock:
+            try:
+                yield self.cursor
+                if not self._batch_depth:
+                    self._commit()
+            except BaseException:
+                if not self._batch_depth:
+                    self.conn.rollback()
+                raise
+
+    def _commit(self):
+        """
+        Commits the writer's transaction, advancing the write generation first if it
+        changed any rows (see data_state). The caller holds lock.
+        """
+        if self.conn.total_changes != self._committed_changes:
+            self._retry(self.cursor.execute, "UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+        self._retry(self.conn.commit)
+        self._committed_changes = self.conn.total_changes
+
+    @contextmanager
+    def _reading(self):
+        """
+        Yields a cursor for reads on the calling thread's own connection, or on the
+        writer connection (after writing queued tasks) inside the thread's batch and
+        for in-memory databases.
+        """
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed Storage.")
+        if self._single_connection or self._batch_thread == threading.get_ident():
+            with self.lock:
+                self._flush_tasks()
+                cursor = self.conn.cursor()
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                self._readers.append(conn)
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _pragma_value(value, allowed):
+        """
+        Validates a PRAGMA setting, since PRAGMA values cannot be bound as parameters.
+        """
+        if str(value).upper() not in allowed:
+            raise ValueError(f"Unsupported setting {value!r}; expected one of {', '.join(allowed)}.")
+        return str(value).upper()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups every write made inside the block into one transaction.
+        Task inserts are queued and written with one executemany() before the commit.
+        If the block raises, all of its writes are rolled back. Nested batches join the outer one.
+        Other threads' writes wait until the batch ends.
+        """
+        with self.lock:
+            self._batch_depth += 1
+            self._batch_thread = threading.get_ident()
+            try:
+                yield self
+                if self._batch_depth == 1:
+                    self._flush_tasks()
+                    self._commit()
+            except BaseException:
+                if self._batch_depth == 1:
+                    self._pending_tasks.clear()
+                    self.conn.rollback()
+                raise
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._batch_thread = None
+
+    def in_batch(self) -> bool:
+        """
+        Returns whether the calling thread is inside batch().
+        """
+        return self._batch_depth > 0 and self._batch_thread == threading.get_ident()
+
+    def _flush_tasks(self):
+        """
+        Writes the queued task inserts, so later statements see them.
+        The caller holds lock.
+        """
+        if self._pending_tasks:
+            self._retry(self.cursor.executemany, '''
+                INSERT INTO tasks (habit_id, day, week, month, is_complete, completed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (habit_id, day) DO UPDATE SET
+                    is_complete = MAX(is_complete, excluded.is_complete),
+                    completed_at = CASE WHEN excluded.is_complete THEN excluded.completed_at
+                                        ELSE completed_at END
+            ''', self._pending_tasks)
+            self._update_stats(self._pending_tasks)
+            self._pending_tasks.clear()
+
+    def _update_stats(self, rows):
+        """
+        Brings habit_stats up to date with newly written task rows, in the same
+        transaction. Completions after a habit's last one advance its streaks step by
+        step; a completion on or before it (a backfill) recomputes the habit from its
+        tasks. The caller holds lock.
+        """
+        completed = {}
+        for habit_id, day, _, _, is_complete, _ in rows:
+            if is_complete:
+                completed.setdefault(habit_id, set()).add(day)
+        stale = []
+        for habit_id, days in completed.items():
+            self._retry(self.cursor.execute, '''
+                SELECT h.periodicity, s.last_period, s.current_streak, s.max_streak,
+                       s.last_completion, s.total_completions
+                FROM habit_stats s JOIN habits h ON h.id = s.habit_id
+                WHERE s.habit_id = ?
+            ''', (habit_id,))
+            row = self.cursor.fetchone()
+            days = sorted(days)
+            if row is None or (row[4] is not None and days[0] <= row[4]):
+                stale.append(habit_id)
+                continue
+            periodicity, *state, _, total = row
+            state = tuple(state)
+            for day in days:
+                state = Analytics.period_step(state, period_ordinal(day, periodicity))
+            self._retry(self.cursor.execute, '''
+                UPDATE habit_stats SET last_period = ?, current_streak = ?, max_streak = ?,
+                                       last_completion = ?, total_completions = ?
+                WHERE habit_id = ?
+            ''', (*state, days[-1], total + len(days), habit_id))
+        if stale:
+            self._refresh_stats(stale)
+
+    def _refresh_stats(self, habit_ids=None):
+        """
+        Recomputes the habit_stats rows of the given habits (of every habit when None)
+        from their completed tasks. Returns the number of habits refreshed.
+        The caller holds lock.
+        """
+        if habit_ids is None:
+            self._retry(self.cursor.execute, 'DELETE FROM habit_stats')
+            chunks = [None]
+        else:
+            habit_ids = list(habit_ids)
+            chunks = [habit_ids[i:i + 500] for i in range(0, len(habit_ids), 500)]
+        stats = []
+        reader = self.conn.cursor()
+        try:
+            for chunk in chunks:
+                where = '' if chunk is None else f'WHERE h.id IN ({", ".join("?" * len(chunk))})'
+                self._retry(reader.execute, f'''
+                    SELECT h.id, h.user_id, h.periodicity, t.day
+                    FROM habits h
+                    LEFT JOIN tasks t ON t.habit_id = h.id AND t.is_complete
+                    {where}
+                    ORDER BY h.id, t.day
+                ''', chunk or ())
+                for (habit_id, user_id, periodicity), group in groupby(reader, key=lambda row: row[:3]):
+                    days = [row[3] for row in group if row[3] is not None]
+                    stats.append((habit_id, user_id, *Analytics.day_streak_state(days, periodicity),
+                                  days[-1] if days else None, len(days)))
+        finally:
+            reader.close()
+        self._retry(self.cursor.executemany, '''
+            INSERT INTO habit_stats (habit_id, user_id, last_period, current_streak, max_streak,
+                                     last_completion, total_completions)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (habit_id) DO UPDATE SET
+                user_id = excluded.user_id, last_period = excluded.last_period,
+                current_streak = excluded.current_streak, max_streak = excluded.max_streak,
+                last_completion = excluded.last_completion, total_completions = excluded.total_completions
+        ''', stats)
+        return len(stats)
+
+    def rebuild_stats(self):
+        """
+        Recomputes habit_stats for every habit from its tasks, repairing any drift
+        (e.g. after the tasks table was edited by hand). Returns the number of habits.
+        """
+        with self._writing():
+            self._flush_tasks()
+            return self._refresh_stats()
+
+    def setup(self):
+        """
+        Creates the 'users', 'habits', 'tasks' and 'habit_stats' tables in the database
+        if they don't exist, along with the unique index that allows one task per habit
+        and day. Tasks of databases from before they were stored as day ordinals are
+        converted (and de-duplicated by day); habit_stats is rebuilt from the tasks
+        when its schema changed (see SCHEMA_VERSION); and habits created before there
+        were users are given to DEFAULT_USER_NAME. All of it runs in one transaction,
+        so a migration is never left half done. A database already at SCHEMA_VERSION is
+        left alone, so opening one runs no DDL.
+        """
+        with self._writing() as cursor:
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()[0] == SCHEMA_VERSION:
+                return
+            self._retry(cursor.execute, 'BEGIN IMMEDIATE')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS habits (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    periodicity TEXT,
+                    created_at TEXT,
+                    user_id INTEGER REFERENCES users(id)
+                )
+            ''')
+            cursor.execute("PRAGMA table_info('habits')")
+            if 'user_id' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE habits ADD COLUMN user_id INTEGER REFERENCES users(id)')
+                cursor.execute('INSERT OR IGNORE INTO users (name) VALUES (?)', (DEFAULT_USER_NAME,))
+                cursor.execute('UPDATE habits SET user_id = (SELECT id FROM users WHERE name = ?)',
+                               (DEFAULT_USER_NAME,))
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_habits_user ON habits (user_id, id)')
+            cursor.execute("PRAGMA table_info('tasks')")
+            if 'date' in [row[1] for row in cursor.fetchall()]:
+                self._migrate_task_dates()
+            else:
+                self._create_tasks_table()
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_habit_day ON tasks (habit_id, day)')
+            cursor.execute('PRAGMA user_version')
+            version = cursor.fetchone()[0]
+            if version < 3:
+                cursor.execute('DROP TABLE IF EXISTS habit_stats')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS habit_stats (
+                    habit_id INTEGER PRIMARY KEY REFERENCES habits(id),
+                    user_id INTEGER,
+                    last_period INTEGER,
+                    current_streak INTEGER NOT NULL DEFAULT 0,
+                    max_streak INTEGER NOT NULL DEFAULT 0,
+                    last_completion INTEGER,
+                    total_completions INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_habit_stats_user '
+                           'ON habit_stats (user_id, max_streak DESC, habit_id)')
+            if version < 3:
+                self._refresh_stats()
+            cursor.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            cursor.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+            if version < SCHEMA_VERSION:
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _create_tasks_table(self):
+        """
+        Creates the tasks table: one row per habit and day, the day as a date ordinal
+        (datetime.toordinal()) along with its week and month period numbers (see
+        analytics.period_ordinal), and completed_at in to_micros() form.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                habit_id INTEGER,
+                day INTEGER NOT NULL,
+                week INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                is_complete INTEGER,
+                completed_at INTEGER,
+                FOREIGN KEY(habit_id) REFERENCES habits(id)
+            )
+        ''')
+
+    def _migrate_task_dates(self):
+        """
+        Converts a tasks table with ISO text dates (before schema version 3) to the
+        integer form, keeping one task per habit and day: the completed and most
+        recently completed one. The caller holds lock, inside setup()'s transaction.
+        """
+        cursor = self.cursor
+        cursor.execute('DROP INDEX IF EXISTS idx_tasks_habit_date')
+        cursor.execute('ALTER TABLE tasks RENAME TO text_tasks')
+        self._create_tasks_table()
+        reader = self.conn.cursor()
+        try:
+            reader.execute('''
+                SELECT habit_id, date, is_complete, completed_at FROM (
+                    SELECT habit_id, date, is_complete, completed_at, ROW_NUMBER() OVER (
+                        PARTITION BY habit_id, substr(date, 1, 10)
+                        ORDER BY is_complete DESC, completed_at DESC, id DESC
+                    ) AS rank
+                    FROM text_tasks
+                )
+                WHERE rank = 1
+            ''')
+            while rows := reader.fetchmany(10000):
+                cursor.executemany('''
+                    INSERT INTO tasks (habit_id, day, week, month, is_complete, completed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [self._text_task_values(*row) for row in rows])
+        finally:
+            reader.close()
+        cursor.execute('DROP TABLE text_tasks')
+
+    def compact(self):
+        """
+        Removes tasks of deleted habits, then VACUUMs the database to give the freed
+        space back. Returns the number of task rows removed.
+        """
+        with self.lock:
+            if self._batch_depth:
+                raise RuntimeError("compact() cannot run inside batch().")
+            with self._writing() as cursor:
+                self._retry(cursor.execute, 'DELETE FROM tasks WHERE habit_id NOT IN (SELECT id FROM habits)')
+                removed = cursor.rowcount
+                self._retry(cursor.execute, 'DELETE FROM habit_stats WHERE habit_id NOT IN (SELECT id FROM habits)')
+            self._retry(self.cursor.execute, 'VACUUM')
+            return removed
+
+    def data_state(self, user_id=None):
+        """
+        Returns (schema version, write generation, habit count, completion count): a
+        cheap fingerprint of the database, or of one user's habits. The generation
+        advances with every commit that changes rows through a Storage, in any
+        process; the counts come from habit_stats (through idx_habit_stats_user), so
+        no table is scanned. Snapshots (see snapshot.py) are only used while it is
+        unchanged. PRAGMA data_version cannot serve here: it only tells one connection
+        whether others have written since it last looked.
+        """
+        user_filter, params = self._user_filter(user_id, 's')
+        with self._reading() as cursor:
+            cursor.execute('PRAGMA user_version')
+            version = cursor.fetchone()[0]
+            self._retry(cursor.execute, f'''
+                SELECT (SELECT value FROM meta WHERE name = 'generation'),
+                       COUNT(*), COALESCE(SUM(s.total_completions), 0)
+                FROM habit_stats s
+                WHERE 1 {user_filter}
+            ''', params)
+            return (version, *cursor.fetchone())
+
+    def get_user_id(self, name):
+        """
+        Returns the ID of the user with the given name, creating the user if needed.
+        """
+        with self._writing() as cursor:
+            self._retry(cursor.execute, 'INSERT OR IGNORE INTO users (name) VALUES (?)', (name,))
+            cursor.execute('SELECT id FROM users WHERE name = ?', (name,))
+            return cursor.fetchone()[0]
+
+    def save_habit(self, habit: Habit, user_id=None):
+        """
+        Saves a new habit into the database, owned by user_id.
+        A habit without an ID gets the next free one, stored back on the habit.
+        """
+        with self._writing() as cursor:
+            self._retry(
+                cursor.execute,
+                'INSERT INTO habits (id, name, periodicity, created_at, user_id) VALUES (?, ?, ?, ?, ?)',
+                (habit.id, habit.name, habit.periodicity, habit.created_at.isoformat(), user_id)
+            )
+            if habit.id is None:
+                habit.id = cursor.lastrowid
+            self._retry(cursor.execute, 'INSERT OR REPLACE INTO habit_stats (habit_id, user_id) VALUES (?, ?)',
+                        (habit.id, user_id))
+
+    def update_habit(self, habit: Habit):
+        """
+        Updates the name and periodicity of an existing habit, and its stored streaks,
+        which depend on the periodicity.
+        """
+        with self._writing() as cursor:
+            self._flush_tasks()
+            self._retry(
+                cursor.execute,
+                'UPDATE habits SET name = ?, periodicity = ? WHERE id = ?',
+                (habit.name, habit.periodicity, habit.id)
+            )
+            self._refresh_stats([habit.id])
+
+    def get_habit_by_id(self, habit_id):
+        """
+        Retrieves a habit by its ID.
+        """
+        with self._reading() as cursor:
+            self._retry(cursor.execute, 'SELECT id, name, periodicity, created_at FROM habits WHERE id = ?',
+                        (habit_id,))
+            row = cursor.fetchone()
+        if row:
+            habit = Habit(row[0], row[1], row[2], datetime.fromisoformat(row[3]))
+            habit.tasks = self.load_tasks(habit.id)
+            return habit
+        return None
+
+    def load_habits(self, with_tasks=True, user_id=None):
+        """
+        Loads all habits and their tasks from the database, or only those of user_id.
+
+        Uses a single query ordered by habit and date and groups the rows into
+        habits in one pass, instead of querying the tasks of each habit separately.
+        With with_tasks=False only the habits themselves are read. Either way the
+        habits' cached streaks are filled in from habit_stats.
+        """
+        user_filter, params = self._user_filter(user_id)
+        with self._reading() as cursor:
+            if not with_tasks:
+                self._retry(
+                    cursor.execute,
+                    f'SELECT id, name, periodicity, created_at FROM habits h WHERE 1 {user_filter} ORDER BY id',
+                    params
+                )
+                habits = [Habit(row[0], row[1], row[2], datetime.fromisoformat(row[3])) for row in cursor]
+                self._fill_streaks(cursor, habits, user_filter, params)
+                return habits
+            self._retry(cursor.execute, f'''
+                SELECT h.id, h.name, h.periodicity, h.created_at,
+                       t.day, t.is_complete, t.completed_at
+                FROM habits h
+                LEFT JOIN tasks t ON t.habit_id = h.id
+                WHERE 1 {user_filter}
+                ORDER BY h.id, t.day
+            ''', params)
+            habits = []
+            habit = None
+            for row in cursor:
+                if habit is None or habit.id != row[0]:
+                    habit = Habit(row[0], row[1], row[2], datetime.fromisoformat(row[3]))
+                    habits.append(habit)
+                if row[4] is not None:
+                    habit.add_task_row(row[4], row[5], row[6])
+            self._fill_streaks(cursor, habits, user_filter, params)
+            return habits
+
+    def _fill_streaks(self, cursor, habits, user_filter, params):
+        """
+        Sets the cached streaks of loaded habits from their habit_stats rows.
+        """
+        by_id = {habit.id: habit for habit in habits}
+        self._retry(cursor.execute, f'''
+            SELECT s.habit_id, s.last_period, s.current_streak, s.max_streak, s.last_completion
+            FROM habit_stats s JOIN habits h ON h.id = s.habit_id
+            WHERE 1 {user_filter}
+        ''', params)
+        for habit_id, last_period, current_streak, max_streak, last_completion in cursor:
+            habit = by_id.get(habit_id)
+            if habit is not None:
+                habit.set_streak_state((last_period, current_streak, max_streak), last_completion)
+
+    def longest_streak(self, user_id=None):
+        """
+        Returns (name, max_streak) of the habit with the longest streak (of user_id, if
+        given), or (None, 0) without habits; ties go to the lowest habit ID. Read from
+        habit_stats, so for one user it is the first entry of idx_habit_stats_user.
+        """
+        where, params = ('WHERE s.user_id = ?', (user_id,)) if user_id is not None else ('', ())
+        with self._reading() as cursor:
+            self._retry(cursor.execute, f'''
+                SELECT h.name, s.max_streak
+                FROM habit_stats s JOIN habits h ON h.id = s.habit_id
+                {where}
+                ORDER BY s.max_streak DESC, s.habit_id
+                LIMIT 1
+            ''', params)
+            row = cursor.fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def delete_habit(self, habit_id):
+        """
+        Deletes a habit and all its tasks.
+        """
+        with self._writing() as cursor:
+            self._flush_tasks()
+            self._retry(cursor.execute, 'DELETE FROM habits WHERE id = ?', (habit_id,))
+            self._retry(cursor.execute, 'DELETE FROM tasks WHERE habit_id = ?', (habit_id,))
+            self._retry(cursor.execute, 'DELETE FROM habit_stats WHERE habit_id = ?', (habit_id,))
+
+    def delete_tasks(self, habit_id):
+        """
+        Deletes all tasks for a specific habit.
+        """
+        with self._writing() as cursor:
+            self._flush_tasks()
+            self._retry(cursor.execute, 'DELETE FROM tasks WHERE habit_id = ?', (habit_id,))
+            self._retry(cursor.execute, '''
+                UPDATE habit_stats SET last_period = NULL, current_streak = 0, max_streak = 0,
+                                       last_completion = NULL, total_completions = 0
+                WHERE habit_id = ?
+            ''', (habit_id,))
+
+    def save_tasks(self, habit_id, tasks):
+        """
+        Saves several tasks of a habit with one executemany().
+        Inside a batch the rows are queued and written when the batch ends.
+        """
+        self._save_values(
+            self._task_values(habit_id, task.date.toordinal(), task.is_complete, to_micros(task.completed_at, None))
+            for task in tasks
+        )
+
+    def save_task_rows(self, rows):
+        """
+        Saves raw (habit_id, date, is_complete, completed_at) rows, dates in ISO format.
+        Only the day of date is stored, so there is one row per habit and day.
+        Inside a batch the rows are queued and written when the batch ends.
+        """
+        self._save_values(self._text_task_values(*row) for row in rows)
+
+    def _save_values(self, values):
+        with self._writing():
+            self._pending_tasks.extend(values)
+            if not self._batch_depth:
+                self._flush_tasks()
+
+    @staticmethod
+    def _task_values(habit_id, day, is_complete, completed_at):
+        """
+        Returns the stored (habit_id, day, week, month, is_complete, completed_at) row of
+        a task, given its day ordinal and its completion time in to_micros() form.
+        """
+        return (habit_id, day, period_ordinal(day, 'Weekly'), period_ordinal(day, 'Monthly'),
+                int(bool(is_complete)), completed_at)
+
+    @staticmethod
+    def _text_task_values(habit_id, date, is_complete, completed_at):
+        """
+        Returns the stored row of a task given with ISO text dates.
+        """
+        return Storage._task_values(*parse_task_row(habit_id, date, is_complete, completed_at))
+
+    def load_streaks(self, user_id=None):
+        """
+        Computes the streaks of every habit (or every habit of user_id) inside SQLite,
+        without loading any tasks. Returns (habit_id, name, periodicity, current_streak,
+        max_streak) rows ordered by habit ID, following the same rules as
+        Analytics.update_streak.
+        """
+        user_filter, params = self._user_filter(user_id)
+        with self._reading() as cursor:
+            self._retry(cursor.execute, STREAKS_QUERY.format(user_filter=user_filter), params * 2)
+            return cursor.fetchall()
+
+    @staticmethod
+    def _user_filter(user_id, alias='h'):
+        """
+        Returns the extra WHERE condition and parameters restricting habits to a user.
+        """
+        if user_id is None:
+            return '', ()
+        return f'AND {alias}.user_id = ?', (user_id,)
+
+    def max_habit_id(self):
+        """
+        Returns the highest habit ID in use, or 0 when there are no habits.
+        """
+        with self._reading() as cursor:
+            self._retry(cursor.execute, 'SELECT MAX(id) FROM habits')
+            return cursor.fetchone()[0] or 0
+
+    def iter_history(self, chunk_size=10000, user_id=None):
+        """
+        Yields (habit_id, name, periodicity, created_at, date, is_complete, completed_at)
+        rows for every task (of every user, or of user_id), ordered by habit and date,
+        straight from a database cursor, with dates as ISO text. Habits without tasks
+        yield one row with None in the task columns.
+        """
+        user_filter, params = self._user_filter(user_id)
+        with self._reading() as cursor:
+            self._retry(cursor.execute, f'''
+                SELECT h.id, h.name, h.periodicity, h.created_at,
+                       t.day, t.is_complete, t.completed_at
+                FROM habits h
+                LEFT JOIN tasks t ON t.habit_id = h.id
+                WHERE 1 {user_filter}
+                ORDER BY h.id, t.day
+            ''', params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for *habit, day, is_complete, completed_at in rows:
+                    completed_at = from_micros(completed_at)
+                    yield (*habit, None if day is None else datetime.fromordinal(day).isoformat(), is_complete,
+                           completed_at.isoformat() if completed_at else None)
+
+    def load_task_values(self, habit_id):
+        """
+        Loads the tasks of a habit as stored (day, is_complete, completed_at) rows of
+        integers, without parsing anything or building Task objects (see Habit.load_tasks).
+        """
+        with self._reading() as cursor:
+            self._retry(
+                cursor.execute,
+                'SELECT day, is_complete, completed_at FROM tasks WHERE habit_id = ? ORDER BY day',
+                (habit_id,)
+            )
+            return cursor.fetchall()
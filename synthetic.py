@@ -0,0 +1,69 @@
+import random
+from datetime import date, datetime, timedelta
+from habit import Habit, Task
+
+PERIODICITIES = ("Daily", "Weekly", "Monthly")
+HISTORY_END = date(2025, 1, 1)  # fixed, so the same parameters always give the same history
+
+
+def completion_days(periodicity, years, density, rng, end=HISTORY_END):
+    """
+    Returns the completed days of one habit over the `years` years before `end`:
+    one candidate day per period (every day, every 7 days, or the same day of every
+    month), each kept with probability `density`.
+    """
+    start = end - timedelta(days=round(365.25 * years))
+    if periodicity == "Monthly":
+        candidates = []
+        year, month = start.year, start.month
+        while date(year, month, min(start.day, 28)) < end:
+            candidates.append(date(year, month, min(start.day, 28)))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    else:
+        step = 7 if periodicity == "Weekly" else 1
+        candidates = [start + timedelta(days=d) for d in range(0, (end - start).days, step)]
+    return [day for day in candidates if rng.random() < density]
+
+
+def task_rows(habit_id, days, duplicates, rng):
+    """
+    Builds (habit_id, date, is_complete, completed_at) rows for Storage.save_task_rows.
+    A share `duplicates` of the days is written a second time, later the same day,
+    as happens when a day is completed again.
+    """
+    rows = []
+    for day in days:
+        midnight = datetime(day.year, day.month, day.day)
+        rows.append((habit_id, midnight.isoformat(), 1, (midnight + timedelta(hours=8)).isoformat()))
+        if duplicates and rng.random() < duplicates:
+            rows.append((habit_id, midnight.isoformat(), 1, (midnight + timedelta(hours=20)).isoformat()))
+    return rows
+
+
+def synthetic_tasks(periodicity, years=1, density=0.8, duplicates=0.0, seed=0):
+    """
+    Returns the Task list of one synthetic habit, in date order (duplicates included).
+    """
+    rng = random.Random(seed)
+    return [Task(datetime.fromisoformat(date_text), True, datetime.fromisoformat(completed_at))
+            for _, date_text, _, completed_at in task_rows(None, completion_days(periodicity, years, density, rng),
+                                                          duplicates, rng)]
+
+
+def populate(storage, habits=100, years=1, density=0.8, duplicates=0.0, seed=0, user_name="Benchmark"):
+    """
+    Fills storage with `habits` habits of user_name, cycling through the three
+    periodicities, each with `years` years of history. The same arguments always
+    produce the same data. Returns the user's ID.
+    """
+    user_id = storage.get_user_id(user_name)
+    with storage.batch():
+        for i in range(habits):
+            rng = random.Random(seed * 1_000_003 + i)
+            periodicity = PERIODICITIES[i % len(PERIODICITIES)]
+            days = completion_days(periodicity, years, density, rng)
+            created = days[0] if days else HISTORY_END
+            habit = Habit(None, f"Habit {i}", periodicity, datetime(created.year, created.month, created.day))
+            storage.save_habit(habit, user_id)
+            storage.save_task_rows(task_rows(habit.id, days, duplicates, rng))
+    return user_id
@@ -1,126 +1,294 @@
-import unittest
-from datetime import datetime, timedelta
-from habit import Habit, Task
-from analytics import Analytics
-
-class TestAnalytics(unittest.TestCase):
-    """
-    Unit tests for the Analytics class, which handles streak calculations.
-    Covers Daily, Weekly, and Monthly streak logic using sample habits and tasks.
-    """
-
-    def create_tasks(self, dates, completed=True):
-        """
-        Helper method to create a list of completed Task objects for given dates.
-        Useful for simulating task completion across time intervals.
-        """
-        tasks = []
-        for d in dates:
-            task = Task(d)
-            if completed:
-                task.is_complete = True
-            tasks.append(task)
-        return tasks
-
-    def test_daily_streak_perfect(self):
-        """
-        Test perfect daily streak: 5 tasks on consecutive days.
-        Expected: current and max streak both = 5.
-        """
-        base_date = datetime(2025, 6, 1)
-        dates = [base_date + timedelta(days=i) for i in range(5)]
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Daily")
-        self.assertEqual(current_streak, 5)
-        self.assertEqual(max_streak, 5)
-
-    def test_daily_streak_with_gap(self):
-        """
-        Test daily streak with a 1-day gap.
-        Expected: current = 1 (last task), max = 2 (first two tasks).
-        """
-        base_date = datetime(2025, 6, 1)
-        dates = [base_date, base_date + timedelta(days=1), base_date + timedelta(days=3)]
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Daily")
-        self.assertEqual(current_streak, 1)
-        self.assertEqual(max_streak, 2)
-
-    def test_weekly_streak_perfect(self):
-        """
-        Test perfect weekly streak: tasks done exactly every 7 days.
-        Expected: current and max streak both = 3.
-        """
-        base_date = datetime(2025, 6, 1)  # Sunday
-        dates = [base_date + timedelta(days=7*i) for i in range(3)]
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Weekly")
-        self.assertEqual(current_streak, 3)
-        self.assertEqual(max_streak, 3)
-
-    def test_weekly_streak_with_skips(self):
-        """
-        Test weekly streak with a skip (8-day gap), then a valid 7-day one.
-        Expected: current = 2 (from 6/9 to 6/16), max = 2.
-        """
-        base_date = datetime(2025, 6, 1)
-        dates = [base_date, base_date + timedelta(days=8), base_date + timedelta(days=15)]
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Weekly")
-        self.assertEqual(current_streak, 2)
-        self.assertEqual(max_streak, 2)
-
-    def test_weekly_streak_partial(self):
-        """
-        Test weekly streak where one task breaks the cycle (14-day gap).
-        Expected: current = 1 (last task only), max = 2 (first two).
-        """
-        base_date = datetime(2025, 6, 1)
-        dates = [base_date, base_date + timedelta(days=7), base_date + timedelta(days=21)]
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Weekly")
-        self.assertEqual(current_streak, 1)
-        self.assertEqual(max_streak, 2)
-
-    def test_monthly_streak_perfect(self):
-        """
-        Test monthly streak with tasks done on the 1st of 3 consecutive months.
-        Expected: current and max streak both = 3.
-        """
-        dates = [datetime(2025, m, 1) for m in range(1, 4)]  # Jan, Feb, Mar
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Monthly")
-        self.assertEqual(current_streak, 3)
-        self.assertEqual(max_streak, 3)
-
-    def test_monthly_streak_with_gap(self):
-        """
-        Test monthly streak with a gap (missing March).
-        Expected: current = 1 (April), max = 2 (Jan & Feb).
-        """
-        dates = [datetime(2025, 1, 1), datetime(2025, 2, 1), datetime(2025, 4, 1)]
-        tasks = self.create_tasks(dates)
-        current_streak, max_streak = Analytics.update_streak(tasks, "Monthly")
-        self.assertEqual(current_streak, 1)
-        self.assertEqual(max_streak, 2)
-
-    def test_get_longest_streak(self):
-        """
-        Test comparison across multiple habits to find which has the longest streak.
-        Habit1 has 3-day streak, Habit2 has 2-week streak.
-        Expected: Habit1 is longest with streak = 3.
-        """
-        # Habit 1: Daily streak of 3
-        habit1 = Habit(1, "Habit1", "Daily")
-        habit1.tasks = self.create_tasks([datetime(2025,6,1) + timedelta(days=i) for i in range(3)])
-        
-        # Habit 2: Weekly streak of 2
-        habit2 = Habit(2, "Habit2", "Weekly")
-        habit2.tasks = self.create_tasks([datetime(2025,6,1), datetime(2025,6,8)])
-        
-        longest = Analytics.get_longest_streak([habit1, habit2])
-        self.assertEqual(longest, ("Habit1", 3))
-
-# Run the tests when this file is executed
-if __name__ == "__main__":
-    unittest.main()
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from habit import Habit, Task
+from analytics import Analytics
+from storage import Storage
+
+class TestAnalytics(unittest.TestCase):
+    """
+    Unit tests for the Analytics class, which handles streak calculations.
+    Covers Daily, Weekly, and Monthly streak logic using sample habits and tasks.
+    """
+
+    def create_tasks(self, dates, completed=True):
+        """
+        Helper method to create a list of completed Task objects for given dates.
+        Useful for simulating task completion across time intervals.
+        """
+        tasks = []
+        for d in dates:
+            task = Task(d)
+            if completed:
+                task.is_complete = True
+            tasks.append(task)
+        return tasks
+
+    def test_daily_streak_perfect(self):
+        """
+        Test perfect daily streak: 5 tasks on consecutive days.
+        Expected: current and max streak both = 5.
+        """
+        base_date = datetime(2025, 6, 1)
+        dates = [base_date + timedelta(days=i) for i in range(5)]
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Daily")
+        self.assertEqual(current_streak, 5)
+        self.assertEqual(max_streak, 5)
+
+    def test_daily_streak_with_gap(self):
+        """
+        Test daily streak with a 1-day gap.
+        Expected: current = 1 (last task), max = 2 (first two tasks).
+        """
+        base_date = datetime(2025, 6, 1)
+        dates = [base_date, base_date + timedelta(days=1), base_date + timedelta(days=3)]
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Daily")
+        self.assertEqual(current_streak, 1)
+        self.assertEqual(max_streak, 2)
+
+    def test_weekly_streak_perfect(self):
+        """
+        Test perfect weekly streak: one task in each of 3 consecutive calendar weeks.
+        Expected: current and max streak both = 3.
+        """
+        base_date = datetime(2025, 6, 1)  # Sunday
+        dates = [base_date + timedelta(days=7*i) for i in range(3)]
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Weekly")
+        self.assertEqual(current_streak, 3)
+        self.assertEqual(max_streak, 3)
+
+    def test_weekly_streak_with_skips(self):
+        """
+        Test weekly streak with a skipped calendar week (6/2-6/8), then two consecutive ones.
+        Expected: current = 2 (from 6/9 to 6/16), max = 2.
+        """
+        base_date = datetime(2025, 6, 1)
+        dates = [base_date, base_date + timedelta(days=8), base_date + timedelta(days=15)]
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Weekly")
+        self.assertEqual(current_streak, 2)
+        self.assertEqual(max_streak, 2)
+
+    def test_weekly_streak_partial(self):
+        """
+        Test weekly streak where one task breaks the cycle (the week of 6/9 is missed).
+        Expected: current = 1 (last task only), max = 2 (first two).
+        """
+        base_date = datetime(2025, 6, 1)
+        dates = [base_date, base_date + timedelta(days=7), base_date + timedelta(days=21)]
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Weekly")
+        self.assertEqual(current_streak, 1)
+        self.assertEqual(max_streak, 2)
+
+    def test_monthly_streak_perfect(self):
+        """
+        Test monthly streak with tasks done on the 1st of 3 consecutive months.
+        Expected: current and max streak both = 3.
+        """
+        dates = [datetime(2025, m, 1) for m in range(1, 4)]  # Jan, Feb, Mar
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Monthly")
+        self.assertEqual(current_streak, 3)
+        self.assertEqual(max_streak, 3)
+
+    def test_monthly_streak_with_gap(self):
+        """
+        Test monthly streak with a gap (missing March).
+        Expected: current = 1 (April), max = 2 (Jan & Feb).
+        """
+        dates = [datetime(2025, 1, 1), datetime(2025, 2, 1), datetime(2025, 4, 1)]
+        tasks = self.create_tasks(dates)
+        current_streak, max_streak = Analytics.update_streak(tasks, "Monthly")
+        self.assertEqual(current_streak, 1)
+        self.assertEqual(max_streak, 2)
+
+    def test_streaks_count_calendar_periods(self):
+        """
+        Test that streaks count consecutive calendar periods rather than fixed gaps:
+        a Monday and the Sunday 13 days later are consecutive weeks, Jan 31 and Feb 1
+        consecutive months, and extra completions in a period count once.
+        Expected: weekly 2/2, monthly 3/3 (Jan, Feb, Mar).
+        """
+        weekly = self.create_tasks([datetime(2025, 6, 2), datetime(2025, 6, 3), datetime(2025, 6, 15)])
+        self.assertEqual(Analytics.update_streak(weekly, "Weekly"), (2, 2))
+        monthly = self.create_tasks([datetime(2025, 1, 31), datetime(2025, 2, 1), datetime(2025, 2, 28),
+                                     datetime(2025, 3, 31)])
+        self.assertEqual(Analytics.update_streak(monthly, "Monthly"), (3, 3))
+        habit = Habit(1, "Jog", "Weekly")
+        for day in (2, 3, 15):
+            habit.complete_task(datetime(2025, 6, day))
+        self.assertEqual(habit.get_streaks(), (2, 2))
+
+    def test_get_longest_streak(self):
+        """
+        Test comparison across multiple habits to find which has the longest streak.
+        Habit1 has 3-day streak, Habit2 has 2-week streak.
+        Expected: Habit1 is longest with streak = 3.
+        """
+        # Habit 1: Daily streak of 3
+        habit1 = Habit(1, "Habit1", "Daily")
+        habit1.tasks = self.create_tasks([datetime(2025,6,1) + timedelta(days=i) for i in range(3)])
+        
+        # Habit 2: Weekly streak of 2
+        habit2 = Habit(2, "Habit2", "Weekly")
+        habit2.tasks = self.create_tasks([datetime(2025,6,1), datetime(2025,6,8)])
+        
+        longest = Analytics.get_longest_streak([habit1, habit2])
+        self.assertEqual(longest, ("Habit1", 3))
+
+    def test_incremental_streak_matches_full_recompute(self):
+        """
+        Test that completing tasks in date order keeps the cached streaks equal
+        to a full recompute after every completion, for all periodicities.
+        """
+        offsets = [0, 1, 2, 5, 7, 14, 15, 22, 29, 30, 60, 61, 90, 120, 121, 122]
+        for periodicity in ("Daily", "Weekly", "Monthly"):
+            habit = Habit(1, "Habit", periodicity)
+            habit.get_streaks()  # prime the cached state
+            for offset in offsets:
+                habit.complete_task(datetime(2025, 1, 1) + timedelta(days=offset))
+                self.assertEqual(habit.get_streaks(),
+                                 Analytics.update_streak(habit.get_tasks(), periodicity))
+
+    def test_backfilled_completion_recomputes_streak(self):
+        """
+        Test that completing an earlier, missing day closes the gap in the streak.
+        Expected: 1st, 2nd and 4th give max = 2; backfilling the 3rd gives 4/4.
+        """
+        habit = Habit(1, "Habit", "Daily")
+        for day in (1, 2, 4):
+            habit.complete_task(datetime(2025, 6, day))
+        self.assertEqual(habit.get_streaks(), (1, 2))
+
+        habit.complete_task(datetime(2025, 6, 3))
+        self.assertEqual(habit.get_streaks(), (4, 4))
+
+    def test_batch_streaks_matches_update_streak(self):
+        """
+        Test that the batch computation agrees with the reducer for habits of every
+        periodicity, including skipped early completions, duplicates and gaps.
+        """
+        offsets = [0, 0, 1, 2, 5, 7, 9, 14, 15, 22, 29, 30, 31, 60, 61, 90, 92, 120, 150, 200]
+        habits = []
+        for i, periodicity in enumerate(("Daily", "Weekly", "Monthly", "Daily", "Weekly", "Monthly")):
+            habit = Habit(i, f"Habit{i}", periodicity)
+            habit.tasks = self.create_tasks(
+                [datetime(2025, 1, 31) + timedelta(days=o + 3 * i) for o in offsets[i:]])
+            habits.append(habit)
+        habits.append(Habit(99, "Empty", "Weekly"))
+
+        expected = [Analytics.update_streak(h.get_tasks(), h.periodicity) for h in habits]
+        self.assertEqual(Analytics.batch_streaks(habits), expected)
+
+    def test_parallel_streaks_match_batch_streaks(self):
+        """
+        Test that streaks computed in worker processes agree with the in-process ones,
+        fill the habits' caches, and that small inputs stay in-process.
+        """
+        habits = []
+        for i, periodicity in enumerate(("Daily", "Weekly", "Monthly") * 3):
+            habit = Habit(i, f"Habit{i}", periodicity)
+            habit.tasks = self.create_tasks(
+                [datetime(2025, 1, 1) + timedelta(days=d) for d in range(0, 200, 1 + i) if d % 11 != i])
+            habits.append(habit)
+        habits.append(Habit(99, "Empty", "Weekly"))
+        expected = [Analytics.update_streak(h.get_tasks(), h.periodicity) for h in habits]
+
+        self.assertEqual(Analytics.parallel_streaks(habits, workers=2, min_completions=0), expected)
+        self.assertFalse(any(habit.streaks_stale for habit in habits))
+        for habit in habits:
+            habit.set_streak_state(None, None)
+        with patch("analytics.ProcessPoolExecutor") as pool:
+            self.assertEqual(Analytics.parallel_streaks(habits, workers=2), expected)
+        pool.assert_not_called()
+        self.assertEqual(Analytics.get_longest_streak(habits, workers=2), Analytics.get_longest_streak(habits))
+
+    def test_completion_rates_follow_completions(self):
+        """
+        Test completion rates per period for every periodicity, and that the counts
+        stay right when days are completed after, between and before the counted ones.
+        """
+        daily = Habit(1, "Read", "Daily", datetime(2025, 6, 1))
+        weekly = Habit(2, "Jog", "Weekly", datetime(2025, 6, 1))
+        monthly = Habit(3, "Swim", "Monthly", datetime(2025, 6, 1))
+        for habit in (daily, weekly, monthly):
+            habit.complete_task(datetime(2025, 6, 2))
+            habit.completion_counts()  # build now, so the completions below update the counts
+            for day in (datetime(2025, 6, 3), datetime(2025, 6, 20), datetime(2025, 6, 10)):
+                habit.complete_task(day)
+
+        june = (datetime(2025, 6, 1), datetime(2025, 6, 30))
+        self.assertEqual(Analytics.completion_rate(daily, *june), 4 / 30)
+        self.assertEqual(Analytics.completion_rate(weekly, *june), 3 / 6)  # weeks from May 26 to June 30
+        self.assertEqual(Analytics.completion_rate(monthly, datetime(2025, 5, 1), datetime(2025, 7, 31)), 1 / 2)
+        self.assertEqual(Analytics.completion_rates(daily, (7, 1), datetime(2025, 6, 8)), {7: 2 / 7, 1: 0.0})
+        self.assertEqual(Analytics.weekday_breakdown(daily, *june)[:2], [(1, 5), (2, 4)])  # Mondays, Tuesdays
+
+        daily.complete_task(datetime(2025, 5, 31))  # before the counted range: rebuilt on next use
+        self.assertEqual(Analytics.completion_rate(daily, datetime(2025, 5, 31), datetime(2025, 6, 3)), 3 / 4)
+
+    def test_top_streaks_ranks_with_deterministic_ties(self):
+        """
+        Test that the leaderboard ranks by max or current streak, breaks ties by habit ID,
+        keeps only the top k and ranks each periodicity separately.
+        """
+        histories = {  # habit ID -> (periodicity, completed day offsets)
+            1: ("Daily", [0, 1, 2, 5]),        # current 1, max 3
+            2: ("Daily", [0, 1, 2]),           # current 3, max 3
+            3: ("Weekly", [0, 7, 14, 21]),     # current 4, max 4
+            4: ("Weekly", [0]),                # current 1, max 1
+            5: ("Monthly", []),                # no completions
+        }
+        habits = []
+        for habit_id, (periodicity, offsets) in histories.items():
+            habit = Habit(habit_id, f"Habit{habit_id}", periodicity)
+            habit.tasks = self.create_tasks([datetime(2025, 1, 1) + timedelta(days=o) for o in offsets])
+            habits.append(habit)
+
+        def ranking(pairs):
+            return [(habit.id, streak) for habit, streak in pairs]
+
+        self.assertEqual(ranking(Analytics.top_streaks(habits, 3)), [(3, 4), (1, 3), (2, 3)])
+        self.assertEqual(ranking(Analytics.top_streaks(habits, 2, by="current")), [(3, 4), (2, 3)])
+        self.assertEqual(ranking(Analytics.top_streaks(habits, 5, periodicity="Weekly")), [(3, 4), (4, 1)])
+        boards = Analytics.leaderboard(habits, 1)
+        self.assertEqual(list(boards), ["All", "Daily", "Weekly", "Monthly"])
+        self.assertEqual([ranking(board) for board in boards.values()], [[(3, 4)], [(1, 3)], [(3, 4)], [(5, 0)]])
+        with self.assertRaises(ValueError):
+            Analytics.top_streaks(habits, by="total")
+
+    def test_sql_streaks_match_update_streak(self):
+        """
+        Test that the streaks computed inside SQLite agree with the Python reducer
+        for every periodicity, including pending tasks, skipped early completions, gaps
+        and several rows on one day.
+        """
+        offsets = [0, 1, 2, 5, 7, 9, 14, 15, 22, 29, 30, 31, 60, 61, 90, 92, 120, 150, 200]
+        storage = Storage(":memory:")
+        for i, periodicity in enumerate(("Daily", "Weekly", "Monthly", "Daily", "Weekly", "Monthly", "Weekly")):
+            storage.save_habit(Habit(i + 1, f"Habit{i}", periodicity))
+            tasks = self.create_tasks([datetime(2025, 1, 31) + timedelta(days=o + 3 * i) for o in offsets[i:]])
+            tasks[len(tasks) // 2].is_complete = False
+            for task in tasks:
+                task.completed_at = datetime(2025, 6, 1)
+            storage.save_tasks(i + 1, tasks)
+        # rows of one day at different times of day
+        storage.save_habit(Habit(8, "Habit7", "Daily"))
+        storage.save_task_rows([(8, "2025-01-01T00:00:00", 1, None), (8, "2025-01-01T09:00:00", 1, None),
+                                (8, "2025-01-02T00:00:00", 1, None)])
+        storage.rebuild_stats()
+
+        expected = [(h.id, h.name, h.periodicity) + Analytics.update_streak(h.get_tasks(), h.periodicity)
+                    for h in storage.load_habits()]
+        self.assertEqual(storage.load_streaks(), expected)
+        self.assertEqual(Analytics.get_longest_streak_in_storage(storage),
+                         Analytics.get_longest_streak(storage.load_habits()))
+        storage.conn.close()
+
+# Run the tests when this file is executed
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import log_storage
+from habit import Habit, Task
+from log_storage import LogStorage
+from memory_storage import MemoryStorage
+from storage import Storage, open_storage
+from user import User
+
+class TestBackends(unittest.TestCase):
+    """
+    Unit tests checking that the in-memory and log backends behave like SQLite.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "habits.log")
+        self.backends = [Storage(":memory:"), MemoryStorage(), LogStorage(self.log_path)]
+
+    def tearDown(self):
+        for storage in self.backends:
+            storage.close()
+        self.tmp.cleanup()
+
+    def fill(self, storage):
+        """
+        Helper method making the same changes through any backend.
+        """
+        alice, bob = storage.get_user_id("Alice"), storage.get_user_id("Bob")
+        with storage.batch():
+            storage.save_habit(Habit(None, "Read", "Daily", datetime(2025, 1, 1)), alice)
+            storage.save_habit(Habit(None, "Jog", "Weekly", datetime(2025, 1, 2)), alice)
+            storage.save_habit(Habit(None, "Swim", "Monthly", datetime(2025, 1, 3)), bob)
+            for day in (1, 2, 3, 5, 6):
+                storage.save_task(1, Task(datetime(2025, 6, day), True, datetime(2025, 6, day, 7, 30)))
+        storage.save_task(1, Task(datetime(2025, 6, 2)))  # does not undo the completion
+        storage.save_task(1, Task(datetime(2025, 6, 7)))
+        storage.save_task_rows([(2, "2025-06-02", 1, "2025-06-02T09:00:00"), (2, "2025-06-10", 1, None),
+                                (3, "2025-05-31", 1, None), (3, "2025-06-01T00:00:00", 1, None)])
+        storage.update_habit(Habit(3, "Swim laps", "Monthly"))
+        storage.save_habit(Habit(None, "Stretch", "Daily"), bob)
+        storage.delete_habit(4)
+        return alice, bob
+
+    def describe(self, storage, alice):
+        """
+        Helper method returning everything a backend reports, for comparison.
+        """
+        return (storage.load_streaks(), storage.load_streaks(alice), storage.longest_streak(),
+                list(storage.iter_history()), [storage.load_task_values(habit_id) for habit_id in (1, 2, 3)],
+                [(h.id, h.name, len(h.tasks), h.get_streaks()) for h in storage.load_habits()],
+                storage.max_habit_id(), storage.get_user_id("Bob"))
+
+    def test_backends_agree(self):
+        """
+        Test that the same writes give the same habits, tasks, streaks and history on
+        every backend, and the same again after reopening the log.
+        """
+        described = [self.describe(storage, self.fill(storage)[0]) for storage in self.backends]
+        self.assertEqual(described[1], described[0])
+        self.assertEqual(described[2], described[0])
+        self.assertEqual(described[0][0], [(1, "Read", "Daily", 2, 3), (2, "Jog", "Weekly", 2, 2),
+                                           (3, "Swim laps", "Monthly", 2, 2)])
+
+        state = self.backends[2].data_state()
+        self.backends[2].close()
+        self.backends[2] = LogStorage(self.log_path)
+        self.assertEqual(self.describe(self.backends[2], 1), described[0])
+        self.assertEqual(self.backends[2].data_state(), state)
+
+    def test_failed_batch_changes_nothing(self):
+        """
+        Test that a batch that raises leaves the data, streaks and log as they were.
+        SQLite may count the rolled back batch as a change; the others do not.
+        """
+        for storage in self.backends:
+            alice, _ = self.fill(storage)
+            before, state = self.describe(storage, alice), storage.data_state()
+            with self.assertRaises(RuntimeError):
+                with storage.batch():
+                    storage.save_task(1, Task(datetime(2025, 6, 8), True))
+                    storage.update_habit(Habit(1, "Read more", "Weekly"))
+                    storage.delete_habit(2)
+                    storage.get_user_id("Carol")
+                    raise RuntimeError("stop")
+            self.assertEqual(self.describe(storage, alice), before)
+            if not isinstance(storage, Storage):
+                self.assertEqual(storage.data_state(), state)
+        self.backends[2].close()
+        self.backends[2] = LogStorage(self.log_path)
+        self.assertEqual(self.describe(self.backends[2], 1), self.describe(self.backends[0], 1))
+
+    def test_torn_commit_is_dropped(self):
+        """
+        Test that reopening a log whose last commit was cut short keeps every complete
+        commit and truncates the rest.
+        """
+        storage = self.backends[2]
+        self.fill(storage)
+        expected = self.describe(storage, 1)
+        storage.save_task(1, Task(datetime(2025, 6, 20), True))
+        storage.close()
+        size = os.path.getsize(self.log_path)
+        with open(self.log_path, "r+b") as file:
+            file.truncate(size - 1)  # the COMMIT byte
+        storage = self.backends[2] = LogStorage(self.log_path)
+        self.assertEqual(self.describe(storage, 1), expected)
+        self.assertLess(os.path.getsize(self.log_path), size - 1)
+
+    def test_compaction(self):
+        """
+        Test that compacting rewrites the log with only the live data, both on request
+        and automatically once the log is mostly dead records.
+        """
+        storage = self.backends[2]
+        self.fill(storage)
+        for _ in range(20):
+            storage.delete_tasks(2)
+            storage.save_task_rows([(2, "2025-06-02", 1, "2025-06-02T09:00:00"), (2, "2025-06-10", 1, None)])
+        expected, size = self.describe(storage, 1), os.path.getsize(self.log_path)
+        self.assertEqual(storage.compact(), 0)
+        self.assertLess(os.path.getsize(self.log_path), size / 2)
+        self.assertEqual(self.describe(storage, 1), expected)
+
+        with patch.object(log_storage, "COMPACT_MIN_RECORDS", 20):
+            for _ in range(10):
+                storage.delete_tasks(2)
+                storage.save_task_rows([(2, "2025-06-02", 1, "2025-06-02T09:00:00"), (2, "2025-06-10", 1, None)])
+            # at most one delete and two saves since the last rewrite
+            self.assertLessEqual(storage._log_records, log_storage.COMPACT_RATIO * storage._live_records() + 3)
+        state = storage.data_state()
+        storage.close()
+        storage = self.backends[2] = LogStorage(self.log_path)
+        self.assertEqual(self.describe(storage, 1), expected)
+        self.assertEqual(storage.data_state(), state)
+
+    def test_failed_automatic_compaction_keeps_the_commit(self):
+        """
+        Test that a rewrite failing after a commit leaves the commit in memory and in
+        the log, so that a reopened log holds the same data.
+        """
+        storage = self.backends[2]
+        self.fill(storage)
+        with patch.object(log_storage, "COMPACT_MIN_RECORDS", 0), \
+                patch.object(LogStorage, "_rewrite", side_effect=OSError(28, "No space left on device")) as rewrite:
+            for _ in range(5):
+                storage.delete_tasks(2)
+                storage.save_task_rows([(2, "2025-06-02", 1, "2025-06-02T09:00:00")])
+        self.assertTrue(rewrite.called)
+        with patch.object(log_storage, "COMPACT_MIN_RECORDS", 0), \
+                patch.object(log_storage.os, "replace", side_effect=OSError(5, "Input/output error")):
+            storage.save_task_rows([(2, "2025-06-03", 1, None)])
+        self.assertFalse(os.path.exists(f"{self.log_path}.tmp"))
+        expected, state = self.describe(storage, 1), storage.data_state()
+        self.assertEqual([day for day, _, _ in storage.load_task_values(2)],
+                         [datetime(2025, 6, 2).toordinal(), datetime(2025, 6, 3).toordinal()])
+        storage.close()
+        storage = self.backends[2] = LogStorage(self.log_path)
+        self.assertEqual(self.describe(storage, 1), expected)
+        self.assertEqual(storage.data_state(), state)
+
+    def test_log_refuses_other_files_and_second_opener(self):
+        """
+        Test that a file that is not a habit log is left alone, and that a log cannot be
+        opened twice at once.
+        """
+        db_path = os.path.join(self.tmp.name, "habits.db")
+        Storage(db_path).close()
+        with open(db_path, "rb") as file:
+            content = file.read()
+        with self.assertRaises(ValueError):
+            LogStorage(db_path)
+        with open(db_path, "rb") as file:
+            self.assertEqual(file.read(), content)
+        if log_storage.fcntl is not None:
+            with self.assertRaises(RuntimeError):
+                LogStorage(self.log_path)
+
+    def test_open_storage_and_user(self):
+        """
+        Test that open_storage picks backends by name and that a User works the same on
+        each of them.
+        """
+        self.assertIsInstance(open_storage(backend="memory"), MemoryStorage)
+        with self.assertRaises(ValueError):
+            open_storage(backend="csv")
+        for storage in self.backends[1:]:
+            user = User("Jane", storage=storage)
+            user.create_habit("Read", "Daily")
+            for day in (1, 2, 4):
+                user.complete_task(1, datetime(2025, 6, day))
+            self.assertEqual(User("Jane", storage=storage, lazy=False).habits[1].get_streaks(), (1, 2))
+            user.edit_habit(1, "Read", "Weekly")
+            self.assertEqual(storage.load_task_values(1), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
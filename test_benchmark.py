@@ -0,0 +1,55 @@
+import unittest
+from benchmark import compare, run_scale
+from storage import Storage
+from synthetic import populate, synthetic_tasks
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Unit tests for the synthetic history generator and the baseline comparison.
+    """
+
+    def test_generator_is_deterministic(self):
+        """
+        Test that the same parameters produce the same history, and a different seed another one.
+        """
+        histories = []
+        for seed in (1, 1, 2):
+            storage = Storage(":memory:")
+            populate(storage, habits=6, years=1, density=0.7, duplicates=0.2, seed=seed)
+            histories.append(list(storage.iter_history()))
+            storage.close()
+        self.assertEqual(histories[0], histories[1])
+        self.assertNotEqual(histories[0], histories[2])
+        self.assertEqual({row[2] for row in histories[0]}, {"Daily", "Weekly", "Monthly"})
+
+    def test_synthetic_tasks_include_duplicates(self):
+        """
+        Test that the duplicate share repeats days in the task list.
+        """
+        tasks = synthetic_tasks("Daily", years=1, density=1.0, duplicates=0.5, seed=3)
+        days = [task.date for task in tasks]
+        self.assertEqual(days, sorted(days))
+        self.assertGreater(len(days), len(set(days)))
+        self.assertEqual(len(set(days)), 365)
+
+    def test_run_scale_times_every_benchmark(self):
+        """
+        Test that a tiny scale produces a timing for each hot path.
+        """
+        results = run_scale(habits=3, years=0.1, repeat=1)
+        self.assertEqual(len(results), 9)
+        self.assertTrue(all(seconds >= 0 for seconds in results.values()))
+
+    def test_compare_flags_only_real_regressions(self):
+        """
+        Test that only benchmarks both relatively and absolutely slower than the baseline are reported.
+        """
+        baseline = {"small": {"fast": 0.001, "slow": 0.100, "same": 0.200}}
+        results = {"small": {"fast": 0.004, "slow": 0.300, "same": 0.210, "new": 1.0}}
+        regressions = compare(results, baseline, tolerance=2.0)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("small/slow"))
+
+
+if __name__ == "__main__":
+    unittest.main()
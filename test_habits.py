@@ -1,102 +1,269 @@
-import unittest
-from datetime import datetime, timedelta
-from habit import Habit
-from user import User
-
-class MockStorage:
-    """Mock storage class to simulate saving and retrieving habits and tasks, avoiding real file/database interactions."""
-    def __init__(self):
-        self.habits = {}
-        self.tasks = {}
-
-    def load_habits(self):
-        return list(self.habits.values())
-
-    def save_habit(self, habit):
-        self.habits[habit.id] = habit
-
-    def update_habit(self, habit):
-        self.habits[habit.id] = habit
-
-    def delete_habit(self, habit_id):
-        if habit_id in self.habits:
-            del self.habits[habit_id]
-
-    def save_task(self, habit_id, task):
-        self.tasks.setdefault(habit_id, []).append(task)
-
-    def delete_tasks(self, habit_id):
-        if habit_id in self.tasks:
-            del self.tasks[habit_id]
-
-
-class TestUserHabitOperations(unittest.TestCase):
-    """Unit tests to validate creation, editing, deletion, and task completion of habits by a User."""
-
-    def setUp(self):
-        # Setup a User with mock storage before each test
-        self.user = User("TestUser")
-        self.user.storage = MockStorage()  # Replace real storage with mock
-        self.user.habits = {}
-        self.user.next_id = 1  # Start ID from 1 for predictability
-
-    def test_create_habit(self):
-        """Test if a habit can be created and stored properly."""
-        self.user.create_habit("Read Book", "daily")
-        self.assertEqual(len(self.user.habits), 1)
-        habit = list(self.user.habits.values())[0]
-        self.assertEqual(habit.name, "Read Book")
-        self.assertEqual(habit.periodicity, "daily")
-        self.assertEqual(habit.id, 1)
-
-    def test_edit_habit_name_and_periodicity(self):
-        """Test editing a habit's name and periodicity, and ensure tasks are reset."""
-        self.user.create_habit("Exercise", "weekly")
-        habit_id = 1
-        self.user.edit_habit(habit_id, "Jogging", "daily")
-        habit = self.user.habits[habit_id]
-        self.assertEqual(habit.name, "Jogging")
-        self.assertEqual(habit.periodicity, "daily")
-        self.assertEqual(len(habit.tasks), 0)  # Task list should be cleared after edit
-
-    def test_delete_habit(self):
-        """Test deleting a habit by ID and ensure it's removed from user's habit list."""
-        self.user.create_habit("Meditate", "daily")
-        habit_id = 1
-        self.user.delete_habit(habit_id)
-        self.assertNotIn(habit_id, self.user.habits)
-
-        # Deleting a non-existent habit should not raise an error
-        self.user.delete_habit(99)  # Should silently pass without crashing
-
-    def test_complete_task_creates_and_saves_task(self):
-        """Test if completing a task correctly adds it to the habit and saves to storage."""
-        self.user.create_habit("Yoga", "daily")
-        habit_id = 1
-        date = datetime(2025, 6, 9)
-        self.user.complete_task(habit_id, date)
-
-        habit = self.user.habits[habit_id]
-        # Confirm task was added to habit
-        self.assertEqual(len(habit.tasks), 1)
-        self.assertEqual(habit.tasks[0].date.date(), date.date())
-        self.assertTrue(habit.tasks[0].is_complete)
-
-        # Confirm task was saved in storage
-        self.assertIn(habit_id, self.user.storage.tasks)
-        saved_tasks = self.user.storage.tasks[habit_id]
-        self.assertEqual(saved_tasks[0].date.date(), date.date())
-
-    def test_complete_task_invalid_habit(self):
-        """Test completing a task for a non-existent habit should raise an error."""
-        with self.assertRaises(ValueError):
-            self.user.complete_task(999, datetime.now())
-
-    def test_edit_habit_invalid_id_raises(self):
-        """Test editing a habit with a non-existent ID should raise an error."""
-        with self.assertRaises(ValueError):
-            self.user.edit_habit(999, "NewName", "monthly")
-
-
-if __name__ == "__main__":
-    unittest.main()
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from habit import Habit, Task
+from memory_storage import MemoryStorage
+from storage import Storage
+from user import User
+
+class TestUserHabitOperations(unittest.TestCase):
+    """Unit tests to validate creation, editing, deletion, and task completion of habits by a User."""
+
+    def setUp(self):
+        # Setup a User with in-memory storage before each test; habit IDs start from 1
+        self.user = User("TestUser", storage=MemoryStorage())
+
+    def test_create_habit(self):
+        """Test if a habit can be created and stored properly."""
+        self.user.create_habit("Read Book", "daily")
+        self.assertEqual(len(self.user.habits), 1)
+        habit = list(self.user.habits.values())[0]
+        self.assertEqual(habit.name, "Read Book")
+        self.assertEqual(habit.periodicity, "daily")
+        self.assertEqual(habit.id, 1)
+
+    def test_edit_habit_name_and_periodicity(self):
+        """Test editing a habit's name and periodicity, and ensure tasks are reset."""
+        self.user.create_habit("Exercise", "weekly")
+        habit_id = 1
+        self.user.edit_habit(habit_id, "Jogging", "daily")
+        habit = self.user.habits[habit_id]
+        self.assertEqual(habit.name, "Jogging")
+        self.assertEqual(habit.periodicity, "daily")
+        self.assertEqual(len(habit.tasks), 0)  # Task list should be cleared after edit
+
+    def test_delete_habit(self):
+        """Test deleting a habit by ID and ensure it's removed from user's habit list."""
+        self.user.create_habit("Meditate", "daily")
+        habit_id = 1
+        self.user.delete_habit(habit_id)
+        self.assertNotIn(habit_id, self.user.habits)
+
+        # Deleting a non-existent habit should not raise an error
+        self.user.delete_habit(99)  # Should silently pass without crashing
+
+    def test_complete_task_creates_and_saves_task(self):
+        """Test if completing a task correctly adds it to the habit and saves to storage."""
+        self.user.create_habit("Yoga", "daily")
+        habit_id = 1
+        date = datetime(2025, 6, 9)
+        self.user.complete_task(habit_id, date)
+
+        habit = self.user.habits[habit_id]
+        # Confirm task was added to habit
+        self.assertEqual(len(habit.tasks), 1)
+        self.assertEqual(habit.tasks[0].date.date(), date.date())
+        self.assertTrue(habit.tasks[0].is_complete)
+
+        # Confirm task was saved in storage
+        saved_tasks = self.user.storage.load_tasks(habit_id)
+        self.assertEqual(len(saved_tasks), 1)
+        self.assertEqual(saved_tasks[0].date.date(), date.date())
+
+    def test_complete_task_invalid_habit(self):
+        """Test completing a task for a non-existent habit should raise an error."""
+        with self.assertRaises(ValueError):
+            self.user.complete_task(999, datetime.now())
+
+    def test_edit_habit_invalid_id_raises(self):
+        """Test editing a habit with a non-existent ID should raise an error."""
+        with self.assertRaises(ValueError):
+            self.user.edit_habit(999, "NewName", "monthly")
+
+
+
+class TestUserLazyLoading(unittest.TestCase):
+    """Unit tests for loading task histories on first access and bounding them in memory."""
+
+    def setUp(self):
+        self.storage = Storage(":memory:")
+        user_id = self.storage.get_user_id("TestUser")
+        for habit_id in (1, 2, 3):
+            self.storage.save_habit(Habit(habit_id, f"Habit{habit_id}", "Daily"), user_id)
+            self.storage.save_tasks(habit_id, [Task(datetime(2025, 6, day), True, datetime(2025, 6, day))
+                                               for day in range(1, 11)])
+
+    def tearDown(self):
+        self.storage.conn.close()
+
+    def test_tasks_load_on_first_access(self):
+        """Test that only habits are read at startup and tasks are fetched when first used."""
+        user = User("TestUser", storage=self.storage)
+        self.assertFalse(any(habit.tasks_loaded for habit in user.list_habits()))
+
+        self.assertEqual(len(user.habits[2].get_tasks()), 10)
+        self.assertEqual([habit.tasks_loaded for habit in user.list_habits()], [False, True, False])
+
+        user.complete_task(3, datetime(2025, 6, 11))
+        self.assertEqual(user.habits[3].get_streaks(), (11, 11))
+
+    def test_least_recently_used_tasks_are_evicted(self):
+        """Test that the memory bound unloads the coldest habit and that it reloads intact."""
+        user = User("TestUser", storage=self.storage, max_loaded_tasks=25)
+        user.habits[1].get_tasks()
+        user.habits[2].get_tasks()
+        user.complete_task(1, datetime(2025, 6, 11))  # habit 1 becomes the most recently used
+        user.habits[3].get_tasks()
+
+        self.assertEqual([habit.tasks_loaded for habit in user.list_habits()], [True, False, True])
+        self.assertEqual(user.habits[2].get_streaks(), (10, 10))
+        self.assertEqual(len(user.habits[1].get_tasks()), 11)
+
+    def test_batch_and_user_writes_from_two_threads(self):
+        """Test that a thread completing tasks inside a storage batch and another completing
+        tasks directly both finish, since the user and the storage share one lock."""
+        user = User("TestUser", storage=self.storage)
+
+        def in_batch():
+            with self.storage.batch():
+                for day in range(11, 21):
+                    user.complete_task(1, datetime(2025, 6, day))
+
+        def direct():
+            for day in range(11, 21):
+                user.complete_task(2, datetime(2025, 6, day))
+
+        threads = [threading.Thread(target=in_batch), threading.Thread(target=direct)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(len(self.storage.load_tasks(1)), 20)
+        self.assertEqual(len(self.storage.load_tasks(2)), 20)
+
+    def test_reads_go_on_while_another_thread_holds_a_batch(self):
+        """Test that listing habits and loading their tasks do not wait for a storage batch
+        held open by another thread, and that a habit written in the batch stays loaded."""
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = Storage(os.path.join(tmp, "habits.db"), journal_mode="wal")
+            user_id = storage.get_user_id("TestUser")
+            for habit_id in (1, 2):
+                storage.save_habit(Habit(habit_id, f"Habit{habit_id}", "Daily"), user_id)
+                storage.save_tasks(habit_id, [Task(datetime(2025, 6, day), True, datetime(2025, 6, day))
+                                              for day in range(1, 11)])
+            user = User("TestUser", storage=storage, max_loaded_tasks=15)
+            written, release = threading.Event(), threading.Event()
+
+            def in_batch():
+                with storage.batch():
+                    user.complete_task(1, datetime(2025, 6, 11))
+                    written.set()
+                    release.wait(timeout=10)
+
+            writer = threading.Thread(target=in_batch)
+            writer.start()
+            try:
+                self.assertTrue(written.wait(timeout=10))
+                reader = threading.Thread(target=lambda: user.read(user.habits[2].get_streaks, habit_ids=(2,)))
+                reader.start()
+                reader.join(timeout=10)
+                self.assertFalse(reader.is_alive())
+                self.assertEqual([habit.name for habit in user.list_habits()], ["Habit1", "Habit2"])
+                self.assertEqual([habit.tasks_loaded for habit in user.list_habits()], [True, True])
+            finally:
+                release.set()
+                writer.join(timeout=10)
+            self.assertEqual(len(user.habits[1].get_tasks()), 11)
+            self.assertEqual(len(storage.load_tasks(1)), 11)
+            storage.close()
+
+
+class TestMultipleUsers(unittest.TestCase):
+    """Unit tests for several users sharing one database."""
+
+    def test_users_only_see_their_own_habits(self):
+        """Test that habits, streaks and IDs are kept apart between users of one storage."""
+        storage = Storage(":memory:")
+        alice = User("Alice", storage=storage)
+        bob = User("Bob", storage=storage)
+        alice.create_habit("Read", "Daily")
+        bob.create_habit("Jog", "Weekly")
+        bob.create_habit("Swim", "Monthly")
+        bob.complete_task(2, datetime(2025, 6, 1))
+
+        self.assertEqual([h.name for h in User("Alice", storage=storage).list_habits()], ["Read"])
+        self.assertEqual([h.id for h in User("Bob", storage=storage).list_habits()], [2, 3])
+        self.assertEqual([row[0] for row in storage.load_streaks(alice.id)], [1])
+        storage.conn.close()
+
+
+class TestHabitTasks(unittest.TestCase):
+    """Unit tests for the compact task storage inside a Habit."""
+
+    def test_tasks_round_trip_in_date_order(self):
+        """Test that assigned tasks come back sorted by date with their status and timestamps."""
+        habit = Habit(1, "Read", "Daily")
+        habit.tasks = [
+            Task(datetime(2025, 6, 3), True, datetime(2025, 6, 3, 21, 15, 0, 250)),
+            Task(datetime(2025, 6, 1), False),
+            Task(datetime(2025, 6, 2), True, datetime(2025, 6, 2, 8, 0)),
+        ]
+        tasks = habit.get_tasks()
+        self.assertEqual([t.date for t in tasks],
+                         [datetime(2025, 6, 1), datetime(2025, 6, 2), datetime(2025, 6, 3)])
+        self.assertEqual([t.is_complete for t in tasks], [False, True, True])
+        self.assertEqual([t.completed_at for t in tasks],
+                         [None, datetime(2025, 6, 2, 8, 0), datetime(2025, 6, 3, 21, 15, 0, 250)])
+
+    def test_complete_task_before_earliest_and_same_day(self):
+        """Test backfilling well before the first task and completing the same day twice."""
+        habit = Habit(1, "Read", "Daily")
+        habit.complete_task(datetime(2025, 6, 9))
+        habit.complete_task(datetime(2024, 1, 1))
+        habit.complete_task(datetime(2025, 6, 9))
+        tasks = habit.get_tasks()
+        self.assertEqual([t.date for t in tasks], [datetime(2024, 1, 1), datetime(2025, 6, 9)])
+        self.assertTrue(all(t.is_complete for t in tasks))
+        self.assertEqual(list(habit.completed_days()),
+                         [datetime(2024, 1, 1).toordinal(), datetime(2025, 6, 9).toordinal()])
+
+    def test_date_lookup_and_range_queries(self):
+        """Test day lookups and inclusive date-range queries on a habit."""
+        habit = Habit(1, "Read", "Daily")
+        habit.tasks = [Task(datetime(2025, 6, 1) + timedelta(days=2 * i), i != 2) for i in range(6)]
+
+        self.assertTrue(habit.is_completed(datetime(2025, 6, 3, 18, 30)))
+        self.assertFalse(habit.is_completed(datetime(2025, 6, 5)))  # task exists but is pending
+        self.assertFalse(habit.is_completed(datetime(2025, 6, 4)))
+        self.assertEqual(habit.get_task(datetime(2025, 6, 7)).date, datetime(2025, 6, 7))
+        self.assertIsNone(habit.get_task(datetime(2025, 6, 8)))
+
+        between = habit.tasks_between(datetime(2025, 6, 3), datetime(2025, 6, 9))
+        self.assertEqual([t.date.day for t in between], [3, 5, 7, 9])
+        self.assertEqual(habit.tasks_between(datetime(2025, 7, 1), datetime(2025, 7, 31)), [])
+        self.assertEqual([t.date.day for t in habit.last_tasks(2)], [9, 11])
+        self.assertEqual(len(habit.last_tasks(10)), 6)
+
+    def test_complete_task_returns_completed_task(self):
+        """Test that completing a day returns that day's completed task."""
+        habit = Habit(1, "Read", "Daily")
+        task = habit.complete_task(datetime(2025, 6, 9))
+        self.assertEqual(task.date, datetime(2025, 6, 9))
+        self.assertTrue(task.is_complete)
+        self.assertIsNotNone(task.completed_at)
+
+    def test_completing_a_returned_task_completes_it_in_the_habit(self):
+        """Test that Task.complete on a task from get_tasks() still updates the habit."""
+        habit = Habit(1, "Read", "Daily")
+        habit.add_task(datetime(2025, 6, 1))
+        habit.add_task(datetime(2025, 6, 2))
+        for task in habit.get_tasks():
+            task.complete(datetime(2025, 6, 2, 21, 0))
+        self.assertTrue(all(t.is_complete for t in habit.get_tasks()))
+        self.assertEqual(habit.get_task(datetime(2025, 6, 1)).completed_at, datetime(2025, 6, 2, 21, 0))
+        self.assertEqual(habit.get_streaks(), (2, 2))
+
+    def test_timezone_aware_timestamps_are_stored_as_local_time(self):
+        """Test that an aware completion timestamp is kept as the same instant in naive local time."""
+        completed_at = datetime(2025, 1, 1, 8, 0, tzinfo=timezone(timedelta(hours=2)))
+        habit = Habit(1, "Read", "Daily")
+        habit.add_task(datetime(2025, 1, 1), True, completed_at)
+        self.assertEqual(habit.get_tasks()[0].completed_at,
+                         completed_at.astimezone().replace(tzinfo=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import json
+import unittest
+from datetime import datetime
+import instrumentation
+from analytics import Analytics
+from storage import Storage
+from user import User
+
+class TestInstrumentation(unittest.TestCase):
+    """
+    Unit tests for the opt-in timing of storage and analytics calls.
+    """
+
+    def setUp(self):
+        self.storage = Storage(":memory:")
+        self.user = User("TestUser", storage=self.storage)
+        self.user.create_habit("Read", "Daily")
+        for day in (1, 2, 3):
+            self.user.complete_task(1, datetime(2025, 6, day))
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+        self.storage.close()
+
+    def test_disabled_leaves_methods_untouched(self):
+        """
+        Test that enabling wraps the methods and disabling restores the originals.
+        """
+        load_habits, update_streak = Storage.load_habits, Analytics.update_streak
+        instrumentation.enable()
+        self.assertIsNot(Storage.load_habits, load_habits)
+        instrumentation.disable()
+        self.assertIs(Storage.load_habits, load_habits)
+        self.assertIs(Analytics.update_streak, update_streak)
+        self.assertFalse(instrumentation.enabled())
+
+    def test_records_calls_rows_and_statements(self):
+        """
+        Test that method calls, their result rows, SQL statements and gauges are reported.
+        """
+        instrumentation.enable()
+        habits = self.storage.load_habits()
+        Analytics.update_streak(habits[0].get_tasks(), "Daily")
+        self.user.complete_task(1, datetime(2025, 6, 4))
+
+        data = instrumentation.snapshot(self.user)
+        self.assertEqual(data["timings"]["Storage.load_habits"]["calls"], 1)
+        self.assertEqual(data["timings"]["Storage.load_habits"]["rows"], 1)
+        self.assertEqual(data["timings"]["Analytics.update_streak"]["calls"], 1)
+        self.assertIn("Storage._update_stats", data["timings"])
+        self.assertTrue(any(name.startswith("SQL INSERT INTO tasks") for name in data["timings"]))
+        self.assertEqual(data["gauges"]["habits"], 1)
+        self.assertEqual(data["gauges"]["tasks_loaded"], 4)
+
+    def test_dump_is_json(self):
+        """
+        Test that the machine-readable dump parses back to the snapshot.
+        """
+        instrumentation.enable()
+        self.storage.load_streaks()
+        out = io.StringIO()
+        instrumentation.dump(out, self.user)
+        self.assertEqual(json.loads(out.getvalue())["timings"]["Storage.load_streaks"]["calls"], 1)
+        self.assertIn("Storage.load_streaks", "\n".join(instrumentation.report(self.user)))
+
+
+if __name__ == "__main__":
+    unittest.main()
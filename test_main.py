@@ -0,0 +1,105 @@
+import io
+import json
+import sqlite3
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from habit import Habit, Task
+from main import CLI, run_script
+from memory_storage import MemoryStorage
+from storage import Storage
+from user import User
+
+class TestCLIDisplay(unittest.TestCase):
+    """Unit tests for the habit listings of the menu-driven CLI."""
+
+    def test_display_habits_limits_tasks_and_pages(self):
+        """Test that the habit listing shows only the chosen tasks and stops when paging is declined."""
+        habits = []
+        for habit_id in (1, 2):
+            habit = Habit(habit_id, f"Habit{habit_id}", "Daily", datetime(2025, 1, 1))
+            habit.tasks = [Task(datetime(2025, 6, day), True, datetime(2025, 6, day, 8)) for day in range(1, 11)]
+            habits.append(habit)
+        cli = CLI(User("TestUser", storage=MemoryStorage()))
+
+        out = io.StringIO()
+        cli.display_habits(habits, last=2, out=out)
+        self.assertEqual(out.getvalue().count("Task:"), 4)
+        self.assertIn("Task: 2025-06-10, Status: Completed, Completed At: 2025-06-10 08:00:00", out.getvalue())
+
+        out = io.StringIO()
+        cli.display_habits(habits, start=datetime(2025, 6, 3), end=datetime(2025, 6, 4), out=out)
+        self.assertEqual(out.getvalue().count("Task:"), 4)
+
+        out = io.StringIO()
+        with patch("builtins.input", return_value="q"):
+            cli.display_habits(habits, page_size=1, out=out)
+        self.assertIn("ID 1: Habit1", out.getvalue())
+        self.assertNotIn("ID 2:", out.getvalue())
+
+    def test_leaderboard_is_shown_in_one_message(self):
+        """Test that the streak leaderboard is written through display_message, ranked per periodicity."""
+        user = User("TestUser", storage=MemoryStorage())
+        for name, periodicity, days in (("Read", "Daily", (1, 2, 3)), ("Jog", "Weekly", (2,))):
+            habit = user.create_habit(name, periodicity)
+            for day in days:
+                user.complete_task(habit.id, datetime(2025, 6, day))
+        cli = CLI(user)
+        with patch("builtins.input", return_value="1"), patch.object(cli, "display_message") as display:
+            cli.handle_user_selection("10")
+        display.assert_called_once()
+        text = display.call_args[0][0]
+        self.assertIn("Top max streaks - All\n  1. Read (ID 1, Daily): 3\n  2. Jog (ID 2, Weekly): 1", text)
+        self.assertIn("Top max streaks - Weekly\n  1. Jog (ID 2, Weekly): 1", text)
+
+
+
+class TestScriptMode(unittest.TestCase):
+    """Tests for the non-interactive --script mode of main.py."""
+
+    def setUp(self):
+        self.storage = Storage(":memory:")
+        self.user = User("TestUser", storage=self.storage)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def run_commands(self, *commands):
+        """Runs commands (dicts, or raw lines) and returns the parsed result lines."""
+        source = io.StringIO("\n".join(c if isinstance(c, str) else json.dumps(c) for c in commands) + "\n")
+        out = io.StringIO()
+        run_script(self.user, source, out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_commands_run_and_report(self):
+        """Test that every op runs, is answered in order, and that invalid commands are reported and skipped."""
+        results = self.run_commands(
+            {"op": "create", "name": "Read", "periodicity": "Daily"},
+            {"op": "create", "name": "Jog", "periodicity": "Weekly"},
+            *({"op": "complete", "habit_id": 1, "date": f"2025-06-0{day}"} for day in (1, 2, 3)),
+            {"op": "complete", "habit_id": 9, "date": "2025-06-01"},
+            {"op": "create", "name": "Swim", "periodicity": "Yearly"},
+            "not json",
+            "",
+            {"op": "edit", "habit_id": 2, "name": "Run", "periodicity": "Monthly"},
+            {"op": "delete", "habit_id": 2},
+            {"op": "report"},
+        )
+        self.assertEqual([r["line"] for r in results[:-1]], [1, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12])
+        self.assertEqual([r["ok"] for r in results[:-1]], [True] * 5 + [False] * 3 + [True] * 3)
+        self.assertEqual(results[5]["error"], "Habit 9 not found.")
+        self.assertEqual(results[-2]["habits"], [{"id": 1, "name": "Read", "periodicity": "Daily",
+                                                 "current_streak": 3, "max_streak": 3}])
+        self.assertEqual(results[-1], {"done": True, "commands": 11, "failed": 3, "committed": True})
+        self.assertEqual(self.storage.load_streaks(), [(1, "Read", "Daily", 3, 3)])
+        self.assertEqual(self.storage.longest_streak(self.user.id), ("Read", 3))
+
+    def test_script_runs_in_one_transaction(self):
+        """Test that a script's writes are committed together, and that none are kept if the commit fails."""
+        with patch.object(self.storage, "_flush_tasks", side_effect=sqlite3.OperationalError("disk I/O error")):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.run_commands({"op": "create", "name": "Read", "periodicity": "Daily"})
+        self.assertEqual(self.storage.load_habits(user_id=self.user.id), [])
+
+if __name__ == "__main__":
+    unittest.main()
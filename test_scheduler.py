@@ -0,0 +1,122 @@
+import io
+import random
+import unittest
+from datetime import date, datetime, timedelta
+from analytics import period_end, period_ordinal, period_start
+from main import CLI
+from memory_storage import MemoryStorage
+from scheduler import Scheduler
+from user import User
+
+class TestScheduler(unittest.TestCase):
+    """
+    Unit tests for the next-due scheduler of habits.
+    """
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.user = User("Jane", storage=self.storage)
+        for name, periodicity in (("Read", "Daily"), ("Jog", "Weekly"), ("Swim", "Monthly"), ("Plan", "Weekly")):
+            self.user.create_habit(name, periodicity).created_at = datetime(2025, 5, 1)
+        for day in (5, 6, 7):
+            self.user.complete_task(1, datetime(2025, 6, day))  # Thursday to Saturday
+        self.user.complete_task(2, datetime(2025, 5, 21))
+        self.user.complete_task(2, datetime(2025, 5, 28))
+        self.user.complete_task(3, datetime(2025, 4, 20))
+
+    def ids(self, rows):
+        return [row[0].id for row in rows]
+
+    def test_period_boundaries(self):
+        """
+        Test that period_start and period_end bound the days period_ordinal maps to
+        each period.
+        """
+        for periodicity in ("Daily", "Weekly", "Monthly"):
+            for day in range(date(2024, 12, 20).toordinal(), date(2025, 3, 10).toordinal()):
+                period = period_ordinal(day, periodicity)
+                self.assertLessEqual(period_start(period, periodicity), day)
+                self.assertGreaterEqual(period_end(period, periodicity), day)
+                self.assertEqual(period_ordinal(period_start(period + 1, periodicity), periodicity), period + 1)
+
+    def test_due_overdue_and_at_risk(self):
+        """
+        Test which habits are due, overdue and at risk on a given day.
+        """
+        scheduler = self.user.scheduler
+        sunday = date(2025, 6, 8)
+        due = scheduler.due(sunday)
+        # Plan is due since the week it was created in, Swim since May, Jog since the week
+        # after its last one and Read since the day after its last one
+        self.assertEqual(self.ids(due), [4, 3, 2, 1])
+        self.assertEqual(due[2][1:], (date(2025, 6, 2), sunday, 2, "Jane"))
+        self.assertEqual(self.ids(scheduler.overdue(sunday)), [4, 3])
+        self.assertEqual(self.ids(scheduler.at_risk(sunday)), [2, 1])
+        self.assertEqual(self.ids(scheduler.due(date(2025, 6, 7))), [4, 3, 2])  # Read is done that day
+        self.assertEqual(self.ids(scheduler.at_risk(date(2025, 6, 2))), [2])
+        self.assertEqual(self.ids(scheduler.at_risk(date(2025, 6, 2), within=0)), [])
+        self.assertEqual(self.ids(scheduler.at_risk(date(2025, 6, 8), within=0)), [2, 1])
+
+    def test_updates_follow_the_user(self):
+        """
+        Test that creating, completing, editing and deleting habits through the user
+        keep the scheduler in step with one built from scratch.
+        """
+        scheduler = self.user.scheduler
+        rng = random.Random(7)
+        for _ in range(400):
+            choice = rng.random()
+            habit_ids = list(self.user.habits)
+            if choice < 0.1 or not habit_ids:
+                self.user.create_habit("New", rng.choice(("Daily", "Weekly", "Monthly")))
+            elif choice < 0.15:
+                self.user.delete_habit(rng.choice(habit_ids))
+            elif choice < 0.2:
+                self.user.edit_habit(rng.choice(habit_ids), "Edited", rng.choice(("Daily", "Weekly")))
+            else:
+                day = datetime(2025, 6, 1) + timedelta(days=rng.randrange(60))
+                self.user.complete_task(rng.choice(habit_ids), day)
+        fresh = Scheduler(self.user.list_habits(), "Jane")
+        for day in (date(2025, 6, 15), date(2025, 7, 31), date(2025, 9, 1)):
+            self.assertEqual(scheduler.due(day), fresh.due(day))
+            self.assertEqual(scheduler.at_risk(day), fresh.at_risk(day))
+        self.assertEqual(len(scheduler), len(self.user.habits))
+        self.assertLessEqual(len(scheduler._heap), 2 * len(self.user.habits) + 1)
+
+    def test_shared_scheduler_across_users(self):
+        """
+        Test that one scheduler holds the habits of several users, each row naming
+        its owner.
+        """
+        scheduler = Scheduler()
+        jane = User("Jane", storage=self.storage, scheduler=scheduler)
+        bob = User("Bob", storage=self.storage, scheduler=scheduler)
+        bob.create_habit("Walk", "Daily")
+        bob.complete_task(5, datetime(2025, 6, 7))
+        self.assertEqual(len(scheduler), 5)
+        rows = scheduler.at_risk(date(2025, 6, 8))
+        self.assertEqual([(row[0].id, row[4]) for row in rows], [(2, "Jane"), (1, "Jane"), (5, "Bob")])
+        jane.delete_habit(1)
+        self.assertEqual(self.ids(scheduler.at_risk(date(2025, 6, 8))), [2, 5])
+
+    def test_cli_due_view(self):
+        """
+        Test that the due view groups habits into overdue, at risk and due.
+        """
+        self.user.create_habit("Stretch", "Daily").created_at = datetime(2025, 6, 8)
+        out = io.StringIO()
+        CLI(self.user).display_due(date(2025, 6, 8), out=out)
+        text = out.getvalue()
+        self.assertIn("Overdue (2):\n  ID 4: Plan (Weekly), due since 2025-04-28\n"
+                      "  ID 3: Swim (Monthly), due since 2025-05-01", text)
+        self.assertIn("At risk (2):", text)
+        self.assertIn("ID 1: Read (Daily), by 2025-06-08, keeps a 3-period streak", text)
+        self.assertIn("Due (1):\n  ID 5: Stretch (Daily), by 2025-06-08", text)
+
+        out = io.StringIO()
+        CLI(User("Nobody", storage=self.storage)).display_due(date(2025, 6, 8), out=out)
+        self.assertEqual(out.getvalue(), "Nothing due on 2025-06-08.\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
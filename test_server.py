@@ -0,0 +1,106 @@
+import json
+import unittest
+from datetime import datetime
+from loadgen import Connection
+from server import HabitService
+from storage import Storage
+from user import User
+
+class TestHabitService(unittest.IsolatedAsyncioTestCase):
+    """
+    Unit tests for the HTTP/JSON service, run against an in-memory database.
+    """
+
+    async def asyncSetUp(self):
+        self.storage = Storage(":memory:")
+        self.service = HabitService(User("TestUser", storage=self.storage), workers=2)
+
+    async def asyncTearDown(self):
+        self.service.close()
+        self.storage.close()
+
+    async def request(self, method, target, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        return await self.service._respond(method, target, body)
+
+    async def test_create_complete_and_list(self):
+        """
+        Test that habits created and completed through the service are listed with their streaks.
+        """
+        status, habit = await self.request("POST", "/habits", {"name": "Read", "periodicity": "daily"})
+        self.assertEqual((status, habit["periodicity"]), (201, "Daily"))
+        await self.request("POST", "/habits", {"name": "Jog", "periodicity": "Weekly"})
+        for day in ("2025-06-01", "2025-06-02"):
+            status, _ = await self.request("POST", f"/habits/{habit['id']}/complete", {"date": day})
+            self.assertEqual(status, 200)
+
+        status, habits = await self.request("GET", "/habits?periodicity=Daily")
+        self.assertEqual(status, 200)
+        self.assertEqual([(h["name"], h["current_streak"], h["max_streak"]) for h in habits], [("Read", 2, 2)])
+        self.assertEqual(await self.request("GET", "/streaks/longest"), (200, {"name": "Read", "streak": 2}))
+
+    async def test_edit_and_delete(self):
+        """
+        Test that editing resets progress and that deleted or unknown habits give 404.
+        """
+        _, habit = await self.request("POST", "/habits", {"name": "Read", "periodicity": "Daily"})
+        await self.request("POST", f"/habits/{habit['id']}/complete", {"date": "2025-06-01"})
+
+        status, edited = await self.request("PUT", f"/habits/{habit['id']}", {"name": "Study", "periodicity": "Weekly"})
+        self.assertEqual((status, edited["name"], edited["max_streak"]), (200, "Study", 0))
+        self.assertEqual(await self.request("DELETE", f"/habits/{habit['id']}"), (200, {"deleted": habit["id"]}))
+        self.assertEqual((await self.request("DELETE", f"/habits/{habit['id']}"))[0], 404)
+        self.assertEqual((await self.request("POST", "/habits/99/complete", {"date": "2025-06-01"}))[0], 404)
+
+    async def test_completion_rates_and_heatmap(self):
+        """
+        Test that a habit's completion rates, weekday breakdown and heatmap are served.
+        """
+        _, habit = await self.request("POST", "/habits", {"name": "Read", "periodicity": "Daily"})
+        self.service.user.habits[habit["id"]].created_at = datetime(2025, 5, 1)
+        for day in ("2025-06-02", "2025-06-03", "2025-06-05"):  # Monday, Tuesday, Thursday
+            await self.request("POST", f"/habits/{habit['id']}/complete", {"date": day})
+
+        status, rates = await self.request("GET", f"/habits/{habit['id']}/rates?windows=7,4&end=2025-06-08")
+        self.assertEqual(status, 200)
+        self.assertEqual(rates["rates"], {"7": 3 / 7, "4": 1 / 4})
+        self.assertEqual(rates["weekdays"]["Monday"], {"completed": 1, "days": 1})
+        self.assertEqual(rates["weekdays"]["Wednesday"], {"completed": 0, "days": 1})
+
+        status, heatmap = await self.request("GET", f"/habits/{habit['id']}/heatmap?days=9&end=2025-06-08")
+        self.assertEqual(status, 200)
+        self.assertEqual(heatmap["weeks"], [{"monday": "2025-05-26", "days": [None, None, None, None, None, 0, 0]},
+                                            {"monday": "2025-06-02", "days": [1, 1, 0, 1, 0, 0, 0]}])
+        self.assertEqual((await self.request("GET", f"/habits/{habit['id']}/rates?windows=0"))[0], 400)
+        self.assertEqual((await self.request("GET", "/habits/99/heatmap"))[0], 404)
+
+    async def test_bad_requests(self):
+        """
+        Test that invalid input and unknown routes are answered with an error, not an exception.
+        """
+        self.assertEqual((await self.request("POST", "/habits", {"name": "Read", "periodicity": "Hourly"}))[0], 400)
+        self.assertEqual((await self.service._respond("POST", "/habits", b"{not json"))[0], 400)
+        self.assertEqual((await self.request("POST", "/habits/1/complete", {"date": "June 1"}))[0], 400)
+        self.assertEqual((await self.request("PATCH", "/habits"))[0], 405)
+        self.assertEqual((await self.request("GET", "/nothing"))[0], 404)
+
+    async def test_requests_over_a_kept_alive_connection(self):
+        """
+        Test that several requests can be sent over one HTTP connection to a running server.
+        """
+        server = await self.service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = await Connection.open("127.0.0.1", port)
+        try:
+            status, habit = await connection.request("POST", "/habits", {"name": "Read", "periodicity": "Daily"})
+            self.assertEqual(status, 201)
+            status, habits = await connection.request("GET", "/habits")
+            self.assertEqual((status, [h["id"] for h in habits]), (200, [habit["id"]]))
+        finally:
+            connection.close()
+            server.close()
+            await server.wait_closed()
+
+
+if __name__ == "__main__":
+    unittest.main()
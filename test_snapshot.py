@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from snapshot import Snapshot, save_snapshot, snapshot_path
+from storage import Storage
+from user import User
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Unit tests for the startup snapshot of a user's habits.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "habits.db")
+        self.storage = Storage(self.path)
+        user = User("Jane", storage=self.storage)
+        user.create_habit("Read", "Daily")
+        user.create_habit("Jog", "Weekly")
+        for day in (1, 2, 3, 9):
+            user.complete_task(1, datetime(2025, 6, day))
+        user.complete_task(2, datetime(2025, 6, 4))
+        self.user_id = user.id
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def describe(self, user):
+        """
+        Helper method returning everything a user's habits hold, for comparison.
+        """
+        return [(h.id, h.name, h.periodicity, h.created_at, h.get_streaks(),
+                 [(t.date, t.is_complete, t.completed_at) for t in h.get_tasks()])
+                for h in user.list_habits()]
+
+    def test_snapshot_round_trip(self):
+        """
+        Test that a user started from the snapshot holds the same habits, tasks and
+        streaks as one loaded from the database, lazily or not.
+        """
+        user = User("Jane", storage=self.storage, snapshot=True)
+        self.assertIsNone(user.snapshot)
+        self.assertTrue(user.save_snapshot())
+        self.assertFalse(user.save_snapshot())  # still current
+        expected = self.describe(User("Jane", storage=self.storage, lazy=False))
+
+        for lazy in (True, False):
+            user = User("Jane", storage=self.storage, lazy=lazy, snapshot=True)
+            self.assertIsNotNone(user.snapshot)
+            self.assertEqual([h.tasks_loaded for h in user.list_habits()], [not lazy] * 2)
+            self.assertEqual([h.streaks_stale for h in user.list_habits()], [False] * 2)
+            self.assertEqual(self.describe(user), expected)
+
+    def test_stale_snapshot_is_ignored_and_rewritten(self):
+        """
+        Test that a write made after the snapshot makes the next start read the
+        database, and that saving then brings the snapshot up to date.
+        """
+        User("Jane", storage=self.storage, snapshot=True).save_snapshot()
+        User("Jane", storage=self.storage).complete_task(1, datetime(2025, 6, 10))
+        user = User("Jane", storage=self.storage, snapshot=True)
+        self.assertIsNone(user.snapshot)
+        self.assertEqual(user.habits[1].get_streaks(), (2, 3))
+        self.assertTrue(user.save_snapshot())
+        user = User("Jane", storage=self.storage, snapshot=True)
+        self.assertIsNotNone(user.snapshot)
+        self.assertEqual(user.habits[1].get_streaks(), (2, 3))
+
+    def test_tasks_come_from_the_snapshot_once(self):
+        """
+        Test that a habit whose tasks were unloaded after changing reloads them from
+        the database, not from the snapshot it started with.
+        """
+        User("Jane", storage=self.storage, snapshot=True).save_snapshot()
+        user = User("Jane", storage=self.storage, snapshot=True, max_loaded_tasks=1)
+        user.complete_task(1, datetime(2025, 6, 10))
+        user.habits[2].get_tasks()  # evicts habit 1
+        self.assertFalse(user.habits[1].tasks_loaded)
+        self.assertTrue(user.habits[1].is_completed(datetime(2025, 6, 10)))
+
+    def test_unusable_snapshots_are_ignored(self):
+        """
+        Test that a truncated snapshot, one of another user and in-memory databases
+        fall back to the database.
+        """
+        self.assertIsNone(snapshot_path(":memory:", 1))
+        path = snapshot_path(self.path, self.user_id)
+        save_snapshot(self.storage, self.user_id, path)
+        self.assertIsNone(Snapshot.open(path, self.storage, self.user_id + 1))
+        with open(path, "r+b") as file:
+            file.truncate(os.path.getsize(path) - 1)
+        self.assertIsNone(Snapshot.open(path, self.storage, self.user_id))
+        self.assertEqual(len(User("Jane", storage=self.storage, snapshot=True).habits), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,454 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime
+from habit import Habit, Task, to_micros
+from storage import DEFAULT_USER_NAME, Storage
+
+class TestStorage(unittest.TestCase):
+    """
+    Unit tests for the Storage class, run against an in-memory SQLite database.
+    """
+
+    def setUp(self):
+        self.storage = Storage(":memory:")
+
+    def tearDown(self):
+        self.storage.conn.close()
+
+    def save_completed(self, habit_id, date):
+        """
+        Helper method to save a completed task for a habit on the given date.
+        """
+        task = Task(date)
+        task.complete(datetime(2025, 6, 30, 12, 0))
+        self.storage.save_task(habit_id, task)
+
+    def test_load_habits_groups_tasks_by_habit(self):
+        """
+        Test that the bulk loader attaches every task to its own habit, sorted by date,
+        and keeps habits that have no tasks yet.
+        """
+        self.storage.save_habit(Habit(1, "Read", "Daily"))
+        self.storage.save_habit(Habit(2, "Jog", "Weekly"))
+        self.storage.save_habit(Habit(3, "Swim", "Monthly"))
+        self.save_completed(1, datetime(2025, 6, 2))
+        self.save_completed(2, datetime(2025, 6, 1))
+        self.save_completed(1, datetime(2025, 6, 1))
+
+        habits = {habit.id: habit for habit in self.storage.load_habits()}
+
+        self.assertEqual(sorted(habits), [1, 2, 3])
+        self.assertEqual([t.date for t in habits[1].get_tasks()],
+                         [datetime(2025, 6, 1), datetime(2025, 6, 2)])
+        self.assertEqual([t.date for t in habits[2].get_tasks()], [datetime(2025, 6, 1)])
+        self.assertEqual(habits[3].get_tasks(), [])
+        self.assertTrue(habits[1].get_tasks()[0].is_complete)
+        self.assertEqual(habits[1].get_tasks()[0].completed_at, datetime(2025, 6, 30, 12, 0))
+
+    def test_setup_creates_task_index(self):
+        """
+        Test that setup() creates the (habit_id, day) index on the tasks table.
+        """
+        self.storage.cursor.execute("PRAGMA index_info('idx_tasks_habit_day')")
+        columns = [row[2] for row in self.storage.cursor.fetchall()]
+        self.assertEqual(columns, ["habit_id", "day"])
+
+    def test_data_state_follows_writes(self):
+        """
+        Test that the write generation advances once per commit that changes rows,
+        and not for writes that change nothing, like looking up an existing user, and
+        that the counts can be limited to one user's habits.
+        """
+        version, generation, habits, tasks = self.storage.data_state()
+        self.storage.get_user_id("Jane")
+        self.assertEqual(self.storage.data_state(), (version, generation + 1, 0, 0))
+        self.storage.get_user_id("Jane")
+        with self.storage.batch():
+            self.storage.save_habit(Habit(1, "Read", "Daily"))
+            self.save_completed(1, datetime(2025, 6, 1))
+        self.assertEqual(self.storage.data_state(), (version, generation + 2, 1, 1))
+
+        jane = self.storage.get_user_id("Jane")
+        self.storage.save_habit(Habit(2, "Jog", "Weekly"), jane)
+        self.save_completed(2, datetime(2025, 6, 2))
+        self.save_completed(2, datetime(2025, 6, 3))
+        self.assertEqual(self.storage.data_state(jane), (version, generation + 5, 1, 2))
+        self.assertEqual(self.storage.data_state(), (version, generation + 5, 2, 3))
+        plan = self.storage.conn.execute('EXPLAIN QUERY PLAN SELECT COUNT(*), SUM(s.total_completions) '
+                                         'FROM habit_stats s WHERE 1 AND s.user_id = ?', (jane,)).fetchall()
+        self.assertIn("idx_habit_stats_user", str(plan))
+
+    def test_batch_writes_tasks_in_one_transaction(self):
+        """
+        Test that writes inside batch() are committed together at the end of the block.
+        """
+        with self.storage.batch():
+            self.storage.save_habit(Habit(1, "Read", "Daily"))
+            for day in range(1, 11):
+                self.save_completed(1, datetime(2025, 6, day))
+            self.assertTrue(self.storage.conn.in_transaction)
+        self.assertFalse(self.storage.conn.in_transaction)
+        self.assertEqual(len(self.storage.load_tasks(1)), 10)
+
+    def test_batch_rolls_back_on_error(self):
+        """
+        Test that an exception inside batch() discards every write made in the block.
+        """
+        self.storage.save_habit(Habit(1, "Read", "Daily"))
+        with self.assertRaises(RuntimeError):
+            with self.storage.batch():
+                self.storage.save_habit(Habit(2, "Jog", "Weekly"))
+                self.save_completed(1, datetime(2025, 6, 1))
+                raise RuntimeError("abort")
+        self.assertEqual([h.id for h in self.storage.load_habits()], [1])
+        self.assertEqual(self.storage.load_tasks(1), [])
+
+    def test_journal_and_synchronous_settings(self):
+        """
+        Test that WAL mode and the synchronous level can be chosen, and that unknown values are rejected.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = Storage(os.path.join(tmp, "habits.db"), journal_mode="wal", synchronous="NORMAL")
+            self.assertEqual(storage.cursor.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(storage.cursor.execute("PRAGMA synchronous").fetchone()[0], 1)
+            storage.conn.close()
+        with self.assertRaises(ValueError):
+            Storage(":memory:", journal_mode="WAL; DROP TABLE habits")
+
+    def test_save_task_keeps_one_row_per_day(self):
+        """
+        Test that saving the same habit and day twice updates the existing row.
+        """
+        self.storage.save_habit(Habit(1, "Read", "Daily"))
+        self.storage.save_task(1, Task(datetime(2025, 6, 1), False))
+        self.save_completed(1, datetime(2025, 6, 1))
+        self.storage.save_task(1, Task(datetime(2025, 6, 1), False))
+
+        tasks = self.storage.load_tasks(1)
+        self.assertEqual(len(tasks), 1)
+        self.assertTrue(tasks[0].is_complete)
+        self.assertEqual(tasks[0].completed_at, datetime(2025, 6, 30, 12, 0))
+
+    def test_task_rows_are_keyed_by_day(self):
+        """
+        Test that rows for the same day at different times are stored as one row of that day,
+        with its week and month numbers and the completion time in microseconds.
+        """
+        self.storage.save_habit(Habit(1, "Read", "Daily"))
+        self.storage.save_task_rows([(1, "2025-01-01T00:00:00", 0, None),
+                                     (1, "2025-01-01T09:00:00", 1, "2025-01-01T09:00:00")])
+        rows = self.storage.cursor.execute("SELECT day, week, month, is_complete, completed_at FROM tasks").fetchall()
+        day = date(2025, 1, 1).toordinal()
+        self.assertEqual(rows, [(day, (day - 1) // 7, 2025 * 12, 1, to_micros(datetime(2025, 1, 1, 9, 0)))])
+        self.assertEqual(list(self.storage.iter_history())[0][4:],
+                         ("2025-01-01T00:00:00", 1, "2025-01-01T09:00:00"))
+
+    def test_dates_with_a_time_of_day_are_migrated_to_days(self):
+        """
+        Test that a database with ISO text task dates, some carrying times, is converted
+        to day ordinals and de-duplicated by day when opened.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "habits.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE habits (id INTEGER PRIMARY KEY, name TEXT, periodicity TEXT, created_at TEXT)")
+            conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, habit_id INTEGER, date TEXT, "
+                         "is_complete INTEGER, completed_at TEXT)")
+            conn.execute("CREATE UNIQUE INDEX idx_tasks_habit_date ON tasks (habit_id, date)")
+            conn.execute("INSERT INTO habits VALUES (1, 'Read', 'Daily', '2025-01-01T00:00:00')")
+            conn.execute("PRAGMA user_version = 2")
+            conn.executemany("INSERT INTO tasks (habit_id, date, is_complete, completed_at) VALUES (?, ?, ?, ?)", [
+                (1, "2025-01-01T00:00:00", 0, None),
+                (1, "2025-01-01T09:00:00", 1, "2025-01-01T09:00:00"),
+                (1, "2025-01-02T07:30:00", 1, "2025-01-02T07:30:00"),
+            ])
+            conn.commit()
+            conn.close()
+
+            storage = Storage(path)
+            rows = storage.cursor.execute("SELECT day, is_complete FROM tasks ORDER BY day").fetchall()
+            first = date(2025, 1, 1).toordinal()
+            self.assertEqual(rows, [(first, 1), (first + 1, 1)])
+            self.assertEqual(storage.load_tasks(1)[1].completed_at, datetime(2025, 1, 2, 7, 30))
+            self.assertEqual(storage.load_streaks(), [(1, "Read", "Daily", 2, 2)])
+            storage.close()
+
+    def test_existing_duplicates_are_removed_and_compacted(self):
+        """
+        Test that opening a database with duplicate tasks keeps one row per day
+        (the completed one), and that compact() removes orphaned tasks.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "habits.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE habits (id INTEGER PRIMARY KEY, name TEXT, periodicity TEXT, created_at TEXT)")
+            conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, habit_id INTEGER, date TEXT, "
+                         "is_complete INTEGER, completed_at TEXT)")
+            conn.execute("INSERT INTO habits VALUES (1, 'Read', 'Daily', '2025-06-01T00:00:00')")
+            conn.executemany("INSERT INTO tasks (habit_id, date, is_complete, completed_at) VALUES (?, ?, ?, ?)", [
+                (1, "2025-06-01T00:00:00", 0, None),
+                (1, "2025-06-01T00:00:00", 1, "2025-06-01T08:00:00"),
+                (1, "2025-06-01T00:00:00", 1, "2025-06-01T07:00:00"),
+                (1, "2025-06-02T00:00:00", 1, "2025-06-02T08:00:00"),
+                (2, "2025-06-02T00:00:00", 1, "2025-06-02T08:00:00"),
+            ])
+            conn.commit()
+            conn.close()
+
+            storage = Storage(path)
+            tasks = storage.load_tasks(1)
+            self.assertEqual([(t.date.day, t.completed_at) for t in tasks],
+                             [(1, datetime(2025, 6, 1, 8, 0)), (2, datetime(2025, 6, 2, 8, 0))])
+            self.assertEqual(storage.compact(), 1)
+            self.assertEqual(storage.cursor.execute("SELECT COUNT(*) FROM tasks").fetchone()[0], 2)
+            storage.conn.close()
+
+    def test_habits_from_before_users_go_to_default_user(self):
+        """
+        Test that habits of a database without a user column are given to the default user.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "habits.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE habits (id INTEGER PRIMARY KEY, name TEXT, periodicity TEXT, created_at TEXT)")
+            conn.execute("INSERT INTO habits VALUES (1, 'Read', 'Daily', '2025-06-01T00:00:00')")
+            conn.commit()
+            conn.close()
+
+            storage = Storage(path)
+            self.assertEqual([h.name for h in storage.load_habits(user_id=storage.get_user_id(DEFAULT_USER_NAME))],
+                             ["Read"])
+            self.assertEqual(storage.load_habits(user_id=storage.get_user_id("Someone Else")), [])
+            storage.conn.close()
+
+
+
+class TestStorageThreads(unittest.TestCase):
+    """
+    Tests for sharing one Storage between threads, run against a database file.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "habits.db")
+        self.storage = Storage(self.path, journal_mode="WAL")
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_readers_run_alongside_a_writer(self):
+        """
+        Test that threads can read streaks and habits while another thread records
+        completions, each reader on its own connection, without errors or lost writes.
+        """
+        self.storage.save_habit(Habit(1, "Read", "Daily"))
+        errors = []
+
+        def write():
+            for day in range(1, 29):
+                task = Task(datetime(2025, 2, day))
+                task.complete(datetime(2025, 2, day, 8, 0))
+                self.storage.save_task(1, task)
+
+        def read():
+            try:
+                for _ in range(20):
+                    self.assertIn(self.storage.load_streaks()[0][4], range(0, 29))
+                    self.assertEqual(len(self.storage.load_habits()), 1)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.storage.load_streaks()[0][3:], (28, 28))
+        self.assertGreaterEqual(len(self.storage._readers), 4)
+
+    def test_batch_reads_see_own_writes_only(self):
+        """
+        Test that reads inside a batch see its writes, while other threads see them only after the commit.
+        """
+        seen = []
+        with self.storage.batch():
+            self.storage.save_habit(Habit(1, "Read", "Daily"))
+            self.assertEqual(self.storage.max_habit_id(), 1)
+            reader = threading.Thread(target=lambda: seen.append(self.storage.max_habit_id()))
+            reader.start()
+            reader.join()
+        self.assertEqual(seen, [0])
+        self.assertEqual(self.storage.max_habit_id(), 1)
+
+    def test_write_is_retried_while_database_is_locked(self):
+        """
+        Test that a write blocked by another connection's lock is retried until the lock is released.
+        """
+        storage = Storage(self.path, timeout=0)
+        other = sqlite3.connect(self.path, check_same_thread=False)
+        other.execute("BEGIN EXCLUSIVE")
+        release = threading.Timer(0.05, other.commit)
+        release.start()
+        try:
+            storage.save_habit(Habit(1, "Read", "Daily"))
+        finally:
+            release.join()
+            other.close()
+        self.assertEqual([h.name for h in storage.load_habits()], ["Read"])
+        storage.close()
+
+    def test_reads_after_close_fail_clearly(self):
+        """
+        Test that after close() a thread that read before gets a clear error rather than a closed connection.
+        """
+        errors = []
+
+        def read():
+            try:
+                self.storage.load_habits()
+            except sqlite3.ProgrammingError as e:
+                errors.append(str(e))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        self.storage.close()
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        self.assertEqual(errors, ["Cannot operate on a closed Storage."])
+
+
+class TestHabitStats(unittest.TestCase):
+    """
+    Unit tests for the habit_stats table that keeps each habit's streaks up to date.
+    """
+
+    def setUp(self):
+        self.storage = Storage(":memory:")
+
+    def tearDown(self):
+        self.storage.close()
+
+    def stats(self):
+        """
+        Helper method returning (habit_id, name, periodicity, current, max) from habit_stats,
+        in the shape of load_streaks().
+        """
+        return self.storage.cursor.execute(
+            "SELECT h.id, h.name, h.periodicity, s.current_streak, s.max_streak "
+            "FROM habits h JOIN habit_stats s ON s.habit_id = h.id ORDER BY h.id").fetchall()
+
+    def complete(self, habit_id, *days):
+        self.storage.save_task_rows([(habit_id, f"2025-{day}T00:00:00", 1, f"2025-{day}T08:00:00")
+                                     for day in days])
+
+    def test_stats_follow_completions_and_backfills(self):
+        """
+        Test that the stored streaks match the recomputed ones after completions in order,
+        backfilled ones, duplicates and completions written in a batch.
+        """
+        for habit_id, periodicity in ((1, "Daily"), (2, "Weekly"), (3, "Monthly")):
+            self.storage.save_habit(Habit(habit_id, f"Habit{habit_id}", periodicity))
+        self.complete(1, "01-01", "01-02", "01-03", "01-05")
+        self.complete(2, "01-01", "01-08", "01-10", "01-15")
+        self.complete(3, "01-01", "02-01", "03-01")
+        self.assertEqual(self.stats(), self.storage.load_streaks())
+        self.complete(1, "01-04", "01-04")  # backfill joining the two runs
+        self.complete(2, "01-22")
+        with self.storage.batch():
+            self.complete(3, "04-01", "05-20")
+            self.complete(1, "01-06")
+        self.assertEqual(self.stats(), self.storage.load_streaks())
+        self.assertEqual(self.stats()[0][3:], (6, 6))
+        self.assertEqual(self.storage.cursor.execute(
+            "SELECT last_completion, total_completions FROM habit_stats WHERE habit_id = 1").fetchone(),
+            (date(2025, 1, 6).toordinal(), 6))
+
+    def test_stats_follow_habit_changes(self):
+        """
+        Test that editing a habit recomputes its stats, clearing its tasks zeroes them,
+        and deleting it (or compacting) removes them.
+        """
+        habit = Habit(1, "Read", "Daily")
+        self.storage.save_habit(habit)
+        self.storage.save_habit(Habit(2, "Jog", "Weekly"))
+        self.complete(1, "01-01", "01-08")
+        self.complete(2, "01-01", "01-08")
+        self.assertEqual(self.stats()[0][3:], (1, 1))
+        habit.periodicity = "Weekly"
+        self.storage.update_habit(habit)
+        self.assertEqual(self.stats()[0][3:], (2, 2))
+        self.storage.delete_tasks(1)
+        self.assertEqual(self.stats()[0][3:], (0, 0))
+        self.storage.delete_habit(2)
+        self.assertEqual([row[0] for row in self.stats()], [1])
+
+    def test_load_habits_fills_cached_streaks(self):
+        """
+        Test that loaded habits come with their streaks, without computing them from the tasks.
+        """
+        self.storage.save_habit(Habit(1, "Read", "Daily"))
+        self.complete(1, "01-01", "01-02")
+        for with_tasks in (True, False):
+            habit = self.storage.load_habits(with_tasks=with_tasks)[0]
+            self.assertFalse(habit.streaks_stale)
+            self.assertEqual(habit.get_streaks(), (2, 2))
+
+    def test_longest_streak_uses_the_index(self):
+        """
+        Test that the longest streak of a user is read from habit_stats through its index,
+        with ties going to the lowest habit ID.
+        """
+        user_id = self.storage.get_user_id("Alice")
+        for habit_id in (1, 2, 3):
+            self.storage.save_habit(Habit(habit_id, f"Habit{habit_id}", "Daily"), user_id)
+        self.complete(2, "01-01", "01-02")
+        self.complete(3, "02-01", "02-02")
+        self.assertEqual(self.storage.longest_streak(user_id), ("Habit2", 2))
+        self.assertEqual(self.storage.longest_streak(self.storage.get_user_id("Bob")), (None, 0))
+        plan = " ".join(row[3] for row in self.storage.cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT habit_id FROM habit_stats WHERE user_id = ? "
+            "ORDER BY max_streak DESC, habit_id LIMIT 1", (user_id,)))
+        self.assertIn("idx_habit_stats_user", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_stats_are_built_on_migration_and_rebuilt_on_request(self):
+        """
+        Test that opening a database with an older habit_stats rebuilds it, and that
+        rebuild_stats() repairs stats that drifted from the tasks.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "habits.db")
+            storage = Storage(path)
+            storage.save_habit(Habit(1, "Read", "Daily"))
+            storage.close()
+            conn = sqlite3.connect(path)
+            conn.execute("DROP TABLE habit_stats")
+            conn.execute("CREATE TABLE habit_stats (habit_id INTEGER PRIMARY KEY, user_id INTEGER, "
+                         "last_counted TEXT, current_streak INTEGER, max_streak INTEGER, "
+                         "last_completion TEXT, total_completions INTEGER)")
+            conn.execute("PRAGMA user_version = 2")
+            conn.executemany("INSERT INTO tasks (habit_id, day, week, month, is_complete, completed_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             [Storage._task_values(1, date(2025, 1, day).toordinal(), 1, None) for day in (1, 2)])
+            conn.commit()
+            conn.close()
+
+            storage = Storage(path)
+            self.storage.close()
+            self.storage = storage
+            self.assertEqual(self.stats(), [(1, "Read", "Daily", 2, 2)])
+            storage.cursor.execute("UPDATE habit_stats SET current_streak = 9, max_streak = 9")
+            self.assertEqual(storage.rebuild_stats(), 1)
+            self.assertEqual(self.stats(), storage.load_streaks())
+
+
+if __name__ == "__main__":
+    unittest.main()
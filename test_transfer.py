@@ -0,0 +1,94 @@
+import io
+import unittest
+from datetime import datetime
+from habit import Habit, Task
+from storage import Storage
+from transfer import ImportAborted, export_history, import_history
+from user import User
+
+class TestTransfer(unittest.TestCase):
+    """
+    Unit tests for streaming import and export of habit history.
+    """
+
+    def setUp(self):
+        self.source = Storage(":memory:")
+        self.source.save_habit(Habit(1, "Read", "Daily", datetime(2025, 5, 1, 9, 30)))
+        self.source.save_habit(Habit(2, "Swim", "Monthly", datetime(2025, 5, 2)))
+        self.source.save_tasks(1, [Task(datetime(2025, 6, day), True, datetime(2025, 6, day, 20, 0))
+                                   for day in (1, 2, 4)])
+        self.target = Storage(":memory:")
+
+    def tearDown(self):
+        self.source.conn.close()
+        self.target.conn.close()
+
+    def assert_round_trip(self, fmt):
+        out = io.StringIO()
+        self.assertEqual(export_history(self.source, out, fmt), 4)  # 3 tasks + 1 habit without tasks
+
+        self.assertEqual(import_history(self.target, io.StringIO(out.getvalue()), fmt, chunk_size=2), (2, 3))
+        self.assertEqual(list(self.target.iter_history()), list(self.source.iter_history()))
+
+    def test_csv_round_trip(self):
+        """
+        Test that exporting to CSV and importing into an empty database reproduces the history.
+        """
+        self.assert_round_trip("csv")
+
+    def test_jsonl_round_trip(self):
+        """
+        Test that exporting to JSONL and importing into an empty database reproduces the history.
+        """
+        self.assert_round_trip("jsonl")
+
+    def test_import_from_other_tracker(self):
+        """
+        Test importing completions keyed by habit name into a database that already has habits.
+        Expected: new habits get fresh IDs and tasks default to complete.
+        """
+        self.target.save_habit(Habit(7, "Existing", "Daily"))
+        source = io.StringIO('{"name": "Jog", "periodicity": "weekly", "date": "2025-06-01"}\n'
+                             '{"name": "Jog", "periodicity": "weekly", "date": "2025-06-08"}\n')
+        self.assertEqual(import_history(self.target, source, "jsonl"), (1, 2))
+
+        habit = self.target.get_habit_by_id(8)
+        self.assertEqual((habit.name, habit.periodicity), ("Jog", "Weekly"))
+        self.assertEqual(habit.get_streaks(), (2, 2))
+
+    def test_import_timezone_aware_timestamps(self):
+        """
+        Test that completions imported with a UTC offset can be read back through a User.
+        """
+        source = io.StringIO('{"name": "Jog", "periodicity": "Daily", "date": "2025-01-01",'
+                             ' "completed_at": "2025-01-01T08:00:00+02:00"}\n')
+        import_history(self.target, source, "jsonl", user_id=self.target.get_user_id("A"))
+
+        tasks = User("A", storage=self.target).list_habits()[0].get_tasks()
+        self.assertEqual([t.completed_at for t in tasks],
+                         [datetime.fromisoformat("2025-01-01T08:00:00+02:00").astimezone().replace(tzinfo=None)])
+
+    def test_import_rejects_bad_rows(self):
+        """
+        Test that an invalid date is reported with its line number.
+        """
+        source = io.StringIO("name,periodicity,date\nRead,Daily,2025-06-01\nRead,Daily,yesterday\n")
+        with self.assertRaisesRegex(ValueError, "Line 3"):
+            import_history(self.target, source, "csv")
+
+    def test_import_reports_how_far_it_got(self):
+        """
+        Test that a bad row after a committed chunk reports the committed lines, and that
+        only the chunk holding the bad row is rolled back.
+        """
+        source = io.StringIO("name,periodicity,date\n"
+                             "Read,Daily,2025-06-01\nRead,Daily,2025-06-02\n"
+                             "Jog,Weekly,2025-06-03\nRead,Daily,yesterday\n")
+        with self.assertRaisesRegex(ImportAborted, "Line 5.*Lines up to 3 were imported") as caught:
+            import_history(self.target, source, "csv", chunk_size=2)
+        self.assertEqual((caught.exception.habits, caught.exception.tasks, caught.exception.last_line), (1, 2, 3))
+        self.assertEqual([h.name for h in self.target.load_habits()], ["Read"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import argparse
+import csv
+import json
+import sys
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+from backend import StorageBackend
+from habit import Habit
+from storage import BACKENDS, DEFAULT_BACKEND, DEFAULT_DB_PATH, DEFAULT_LOG_PATH, DEFAULT_USER_NAME, open_storage
+
+FIELDS = ("habit_id", "name", "periodicity", "created_at", "date", "is_complete", "completed_at")
+FORMATS = ("csv", "jsonl")
+PERIODICITIES = ("Daily", "Weekly", "Monthly")
+
+
+class ImportAborted(ValueError):
+    """
+    Raised when an import stops at an invalid row. Chunks before the one holding the
+    row are already committed: habits, tasks and last_line (the last committed source
+    line, 0 if none) say how much of the file is in the database.
+    """
+
+    def __init__(self, message, habits, tasks, last_line):
+        super().__init__(message)
+        self.habits = habits
+        self.tasks = tasks
+        self.last_line = last_line
+
+
+def export_history(storage: StorageBackend, out, fmt="csv", user_id=None):
+    """
+    Streams every habit and task (of every user, or of user_id) to a text file object as
+    CSV or JSONL, one row per task (habits without tasks get one row with empty task
+    fields). Returns the number of rows. Rows come straight from a database cursor, so
+    the tables are never held in memory.
+    """
+    rows = storage.iter_history(user_id=user_id)
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            if record["is_complete"] is not None:
+                record["is_complete"] = bool(record["is_complete"])
+            out.write(json.dumps(record) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}.")
+    return count
+
+
+def import_history(storage: StorageBackend, source, fmt="csv", chunk_size=50000, user_id=None):
+    """
+    Streams habits and tasks from a CSV or JSONL text file object (same fields as the
+    export) into storage. Each source habit_id (or name, when there is no ID) becomes a
+    new habit owned by user_id; tasks are inserted with executemany(), one transaction
+    per chunk of rows. Returns (habits_created, tasks_imported).
+
+    An invalid row raises ImportAborted. Its chunk is rolled back, but earlier chunks
+    stay committed; the exception tells how far the import got.
+    """
+    habit_ids = {}  # source habit key -> habit ID in storage
+    next_id = storage.max_habit_id() + 1
+    tasks = 0
+    habits = 0
+    last_line = 0
+    records = _parse(source, fmt)
+    while True:
+        try:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            next_id, rows = _import_chunk(storage, chunk, habit_ids, next_id, user_id)
+        except ValueError as e:
+            message = str(e)
+            if last_line:
+                message += (f" Lines up to {last_line} were imported"
+                            f" ({habits} habits, {tasks} tasks); nothing after them was.")
+            raise ImportAborted(message, habits, tasks, last_line) from None
+        tasks += rows
+        habits = len(habit_ids)
+        last_line = chunk[-1][0]
+    return habits, tasks
+
+
+def _import_chunk(storage, chunk, habit_ids, next_id, user_id):
+    """
+    Imports one chunk of (line, record) pairs in a single transaction.
+    Returns the next free habit ID and the number of tasks imported.
+    """
+    with storage.batch():
+        rows = []
+        for line, record in chunk:
+            key = record.get("habit_id") or record.get("name")
+            if key in (None, ""):
+                raise ValueError(f"Line {line}: a habit_id or name is required.")
+            key = str(key)
+            if key not in habit_ids:
+                habit = _habit_from_record(next_id, record, line)
+                storage.save_habit(habit, user_id)
+                habit_ids[key] = next_id
+                next_id += 1
+            if record.get("date"):
+                rows.append(_task_row(habit_ids[key], record, line))
+        storage.save_task_rows(rows)
+    return next_id, len(rows)
+
+
+def _parse(source, fmt):
+    """
+    Yields (line number, record dict) pairs from the source, one at a time.
+    """
+    if fmt == "csv":
+        for line, record in enumerate(csv.DictReader(source), start=2):
+            yield line, record
+    elif fmt == "jsonl":
+        for line, text in enumerate(source, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Line {line}: invalid JSON ({e.msg}).") from None
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}.")
+
+
+def _habit_from_record(habit_id, record, line):
+    periodicity = str(record.get("periodicity") or "").capitalize()
+    if periodicity not in PERIODICITIES:
+        raise ValueError(f"Line {line}: periodicity must be one of {', '.join(PERIODICITIES)}.")
+    created_at = _parse_datetime(record.get("created_at"), line) or datetime.now()
+    return Habit(habit_id, record.get("name") or f"Habit {habit_id}", periodicity, created_at)
+
+
+def _task_row(habit_id, record, line):
+    """
+    Builds a (habit_id, date, is_complete, completed_at) row as Storage.save_task_rows expects.
+    Tasks default to complete, since most trackers only export completions.
+    """
+    date = _parse_datetime(record["date"], line)
+    is_complete = record.get("is_complete")
+    if isinstance(is_complete, str):
+        is_complete = is_complete.strip().lower() not in ("0", "false", "no")
+    completed_at = _parse_datetime(record.get("completed_at"), line)
+    return (habit_id,
+            datetime(date.year, date.month, date.day).isoformat(),
+            int(is_complete is None or bool(is_complete)),
+            completed_at.isoformat() if completed_at else None)
+
+
+def _parse_datetime(value, line):
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Line {line}: invalid date {value!r}.") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export habit history as CSV or JSONL.")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("path", help="file to read or write, or - for stdin/stdout")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--db", help=f"database file (default: {DEFAULT_DB_PATH}, "
+                                     f"{DEFAULT_LOG_PATH} for the log backend)")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="storage engine")
+    parser.add_argument("--user", help="only export this user's habits / import habits for this user "
+                                       f"(default: export all users, import for {DEFAULT_USER_NAME})")
+    args = parser.parse_args(argv)
+
+    storage = open_storage(args.db, args.backend)
+    if args.command == "export":
+        user_id = storage.get_user_id(args.user) if args.user else None
+        with _open(args.path, "w", sys.stdout) as out:
+            count = export_history(storage, out, args.format, user_id)
+        print(f"Exported {count} rows.", file=sys.stderr)
+    else:
+        user_id = storage.get_user_id(args.user or DEFAULT_USER_NAME)
+        try:
+            with _open(args.path, "r", sys.stdin) as source:
+                habits, tasks = import_history(storage, source, args.format, user_id=user_id)
+        except ImportAborted as e:
+            sys.exit(f"Import failed: {e}")
+        print(f"Imported {habits} habits and {tasks} tasks.", file=sys.stderr)
+
+
+def _open(path, mode, standard_stream):
+    if path == "-":
+        return nullcontext(standard_stream)
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
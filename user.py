@@ -1,69 +1,270 @@
-from storage import Storage
-from habit import Habit
-from datetime import datetime
-
-class User:
-    """
-    Represents the user and manages their habits and tasks.
-    """
-
-    def __init__(self, name: str):
-        self.name = name
-        self.storage = Storage()
-        self.habits = {habit.id: habit for habit in self.storage.load_habits()}
-        self.next_id = max(self.habits.keys(), default=0) + 1
-
-    def create_habit(self, name, periodicity):
-        """
-        Creates and saves a new habit.
-        """
-        habit = Habit(self.next_id, name, periodicity)
-        self.habits[self.next_id] = habit
-        self.storage.save_habit(habit)
-        self.next_id += 1
-
-    def edit_habit(self, habit_id, new_name, new_periodicity):
-        """
-        Edits an existing habit's name and periodicity. Resets tasks.
-        """
-        if habit_id in self.habits:
-            habit = self.habits[habit_id]
-            habit.name = new_name
-            habit.periodicity = new_periodicity
-            habit.reset_tasks()
-            self.storage.update_habit(habit)
-            self.storage.delete_tasks(habit_id)
-        else:
-            raise ValueError("Habit ID not found.")
-
-    def delete_habit(self, habit_id):
-        """
-        Deletes a habit.
-        """
-        if habit_id in self.habits:
-            del self.habits[habit_id]
-            self.storage.delete_habit(habit_id)
-
-    def list_habits(self):
-        """
-        Returns all habits.
-        """
-        return list(self.habits.values())
-
-    def list_habits_by_periodicity(self, periodicity):
-        """
-        Filters habits based on their periodicity.
-        """
-        return [habit for habit in self.habits.values() if habit.periodicity == periodicity]
-
-    def complete_task(self, habit_id, date):
-        """
-        Completes a task for a specific habit and date.
-        """
-        if habit_id in self.habits:
-            habit = self.habits[habit_id]
-            habit.complete_task(date)
-            task = next(t for t in habit.tasks if t.date.date() == date.date())
-            self.storage.save_task(habit_id, task)
-        else:
-            raise ValueError("Habit ID not found.")
+import threading
+from collections import OrderedDict
+from storage import shared_storage
+from habit import Habit
+from scheduler import Scheduler
+from snapshot import Snapshot, save_snapshot, snapshot_path
+
+class TaskCache:
+    """
+    Keeps the task lists of at most max_tasks tasks in memory, evicting the least
+    recently used habits first. Evicted habits reload their tasks on next access.
+    Habits whose IDs are in pinned are never evicted. evictions counts the habits
+    evicted so far.
+    """
+
+    def __init__(self, max_tasks: int, loader, pinned=()):
+        self.max_tasks = max_tasks
+        self.loader = loader
+        self.pinned = pinned
+        self.sizes = OrderedDict()  # habit id -> (habit, task count), least recently used first
+        self.total = 0
+        self.evictions = 0
+
+    def touch(self, habit):
+        """
+        Marks a habit's tasks as just used and evicts cold habits if over the limit.
+        """
+        if habit.id in self.sizes:
+            self.total -= self.sizes.pop(habit.id)[1]
+        self.sizes[habit.id] = (habit, habit.task_count)
+        self.total += habit.task_count
+        while self.total > self.max_tasks:
+            cold_id = next((i for i in self.sizes if i not in self.pinned and i != habit.id), None)
+            if cold_id is None:
+                break
+            cold, size = self.sizes.pop(cold_id)
+            cold.unload_tasks(self.loader)
+            self.total -= size
+            self.evictions += 1
+
+    def forget(self, habit_id):
+        """
+        Stops tracking a habit (e.g. when it is deleted).
+        """
+        if habit_id in self.sizes:
+            self.total -= self.sizes.pop(habit_id)[1]
+
+
+class User:
+    """
+    Represents the user and manages their habits and tasks. Users are stored by name;
+    by default they share one connection to the default database (see shared_storage).
+
+    With lazy=True (the default) only the habits are read at startup; the tasks of a
+    habit are loaded the first time they are needed. max_loaded_tasks optionally caps
+    the number of tasks kept in memory, unloading the least recently used habits.
+
+    With snapshot=True the habits are read from the user's snapshot file (see
+    snapshot.py) when it still matches the database, instead of from the database;
+    save_snapshot() writes it for the next start.
+
+    scheduler (see scheduler.py) answers which habits are due, overdue or at risk. It
+    is built on first use and kept up to date by every change made through the user.
+    Passing a Scheduler shared by several users adds this user's habits to it at once,
+    owned by the user's name, for reminder sweeps across users.
+
+    Users can be shared between threads. Methods that write hold user.lock, which is
+    the storage's lock, so a storage batch that calls into the user and a user method
+    that writes to the storage lock in the same order; they then hold user.habits_lock
+    while changing the habits. Reads only hold habits_lock, which is never held while
+    waiting for the storage, so they go on while another thread is inside a batch.
+    Lazy task loads read the storage first and take habits_lock to install the tasks.
+    Habits written inside a batch stay in memory until a later write outside one, as
+    their stored tasks are not committed yet. Code reading a user's Habit objects from
+    several threads does it through read(), which loads what it needs beforehand.
+    """
+
+    def __init__(self, name: str, storage=None, lazy=True, max_loaded_tasks=None, snapshot=False,
+                 scheduler=None):
+        self.name = name
+        self.storage = storage or shared_storage()
+        self.id = self.storage.get_user_id(name)
+        self.lock = self.storage.lock
+        self.habits_lock = threading.RLock()
+        self._unsaved = set()  # IDs of habits written inside a batch that may not be committed
+        self.task_cache = (TaskCache(max_loaded_tasks, self._load_tasks, self._unsaved)
+                           if max_loaded_tasks else None)
+        self.snapshot_path = snapshot_path(self.storage.db_path, self.id) if snapshot else None
+        self.snapshot = Snapshot.open(self.snapshot_path, self.storage, self.id)
+        if self.snapshot is not None:
+            habits = self.snapshot.habits
+        else:
+            habits = self.storage.load_habits(with_tasks=not lazy, user_id=self.id)
+        self.habits = {habit.id: habit for habit in habits}
+        for habit in self.habits.values():
+            if lazy or self.snapshot is not None:
+                habit.unload_tasks(self._load_tasks)
+            if lazy:
+                continue
+            if self.snapshot is not None:
+                self._load_tasks(habit)
+            elif self.task_cache:
+                self.task_cache.touch(habit)
+        self._scheduler = scheduler
+        if scheduler is not None:
+            scheduler.add_all(self.habits.values(), self.name)
+
+    def _evictions(self):
+        return self.task_cache.evictions if self.task_cache else 0
+
+    def _load_tasks(self, habit):
+        """
+        Loader given to habits whose tasks are not in memory yet. The tasks are read
+        without habits_lock and installed under it, unless another thread loaded them
+        meanwhile; if a habit was evicted in between, it may have been written and
+        evicted, so the read is repeated.
+        """
+        while True:
+            with self.habits_lock:
+                if habit.tasks_loaded:
+                    return
+                if self.snapshot is not None and self.snapshot.load_tasks(habit):
+                    self._touch(habit)
+                    return
+                evictions = self._evictions()
+            values = self.storage.load_task_values(habit.id)
+            with self.habits_lock:
+                if habit.tasks_loaded:
+                    return
+                if self._evictions() == evictions:
+                    habit.load_tasks(values)
+                    self._touch(habit)
+                    return
+
+    def read(self, operation, *args, habit_ids=None):
+        """
+        Returns operation(*args), run holding habits_lock once the tasks it needs are
+        in memory: those of the habits with the given IDs, or by default those of the
+        habits whose streaks are stale. The tasks are loaded before taking the lock, so
+        the operation does not wait for a storage batch of another thread. If they
+        could not all be kept loaded, it runs holding user.lock as well.
+        """
+        for _ in range(2):
+            with self.habits_lock:
+                if habit_ids is None:
+                    needed = [habit for habit in self.habits.values()
+                              if habit.streaks_stale and not habit.tasks_loaded]
+                else:
+                    needed = [self.habits[habit_id] for habit_id in habit_ids
+                              if habit_id in self.habits and not self.habits[habit_id].tasks_loaded]
+                if not needed:
+                    return operation(*args)
+            for habit in needed:
+                self._load_tasks(habit)
+        with self.lock, self.habits_lock:
+            return operation(*args)
+
+    @property
+    def scheduler(self):
+        """
+        The Scheduler of the user's habits, built on first use. Its queries are
+        made through read() when other threads may change the habits.
+        """
+        if self._scheduler is None:
+            self.read(self._build_scheduler)
+        return self._scheduler
+
+    def _build_scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = Scheduler(self.habits.values(), self.name)
+
+    def _touch(self, habit):
+        if self.task_cache:
+            self.task_cache.touch(habit)
+
+    def _written(self, habit):
+        """
+        Bookkeeping after a created, edited or completed habit was saved: keeps it in
+        memory while its batch is open, and reschedules it if the scheduler is in use.
+        """
+        if self.storage.in_batch():
+            self._unsaved.add(habit.id)
+        else:
+            self._unsaved.clear()  # no batch is open, so every earlier write is committed
+        self._touch(habit)
+        if self._scheduler is not None:
+            self._scheduler.update(habit, self.name)
+
+    def save_snapshot(self):
+        """
+        Writes the user's snapshot for the next start, unless snapshots are off or it
+        is still current (see snapshot.save_snapshot). Meant for when the user is done
+        with, e.g. at exit: the snapshot it was loaded from is released first, so tasks
+        loaded afterwards come from the database. Returns whether one was written.
+        """
+        with self.lock:
+            with self.habits_lock:
+                if self.snapshot is not None:
+                    self.snapshot.close()
+                    self.snapshot = None
+            return save_snapshot(self.storage, self.id, self.snapshot_path)
+
+    def create_habit(self, name, periodicity):
+        """
+        Creates and saves a new habit. Its ID is assigned by the storage.
+        Returns the habit.
+        """
+        with self.lock, self.habits_lock:
+            habit = Habit(None, name, periodicity)
+            self.storage.save_habit(habit, self.id)
+            self.habits[habit.id] = habit
+            self._written(habit)
+            return habit
+
+    def edit_habit(self, habit_id, new_name, new_periodicity):
+        """
+        Edits an existing habit's name and periodicity. Resets tasks.
+        """
+        with self.lock, self.habits_lock:
+            if habit_id in self.habits:
+                habit = self.habits[habit_id]
+                habit.name = new_name
+                habit.periodicity = new_periodicity
+                habit.reset_tasks()
+                self.storage.update_habit(habit)
+                self.storage.delete_tasks(habit_id)
+                self._written(habit)
+            else:
+                raise ValueError("Habit ID not found.")
+
+    def delete_habit(self, habit_id):
+        """
+        Deletes a habit.
+        """
+        with self.lock, self.habits_lock:
+            if habit_id in self.habits:
+                del self.habits[habit_id]
+                self.storage.delete_habit(habit_id)
+                self._unsaved.discard(habit_id)
+                if self.task_cache:
+                    self.task_cache.forget(habit_id)
+                if self._scheduler is not None:
+                    self._scheduler.remove(habit_id)
+
+    def list_habits(self):
+        """
+        Returns all habits.
+        """
+        with self.habits_lock:
+            return list(self.habits.values())
+
+    def list_habits_by_periodicity(self, periodicity):
+        """
+        Filters habits based on their periodicity.
+        """
+        with self.habits_lock:
+            return [habit for habit in self.habits.values() if habit.periodicity == periodicity]
+
+    def complete_task(self, habit_id, date):
+        """
+        Completes a task for a specific habit and date.
+        """
+        with self.lock, self.habits_lock:
+            if habit_id in self.habits:
+                habit = self.habits[habit_id]
+                task = habit.complete_task(date)
+                self.storage.save_task(habit_id, task)
+                self._written(habit)
+            else:
+                raise ValueError("Habit ID not found.")